@@ -4,15 +4,23 @@ from flask_login import LoginManager
 from flask_mail import Mail
 from flask_migrate import Migrate
 import logging
+import os
 
-db = SQLAlchemy()
+from .routing import StationSession
+
+db = SQLAlchemy(session_options={'class_': StationSession})
 mail = Mail()
 login_manager = LoginManager()
 
-def create_app():
+def create_app(config=None):
+    """ Build the app. Nothing here touches the database, so workers can call it
+    (or fork from a preloaded master) without repeating schema or seed work;
+    use "flask db upgrade" and "flask seed-admin" for that. `config` overrides
+    settings, e.g. for tests and benchmarks.
+    """
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'your_secret_key'
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///db.sqlite3'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///db.sqlite3')
     # app.config['MAIL_SERVER'] = 'smtp.thehexaa.com'
     # app.config['MAIL_PORT'] = 587
     # app.config['MAIL_USE_TLS'] = True
@@ -28,8 +36,95 @@ def create_app():
     app.config['MAIL_PASSWORD'] = None
     app.config['MAIL_DEFAULT_SENDER'] = 'daily-reports@thehexaa.com'
 
+    # Document numbering (bills, slips, vouchers)
+    app.config['STATION_CODE'] = os.environ.get('STATION_CODE', 'MAIN')
+    app.config['SEQUENCE_BLOCK_SIZE'] = int(os.environ.get('SEQUENCE_BLOCK_SIZE', 50))
+
+    # Stations with their own database: "NORTH=sqlite:///north.sqlite3,SOUTH=sqlite:///south.sqlite3".
+    # Their sales, purchases, vouchers and books go there; master data stays in the default database.
+    from . import stations
+    app.config['STATION_DATABASES'] = stations.parse_databases(os.environ.get('STATION_DATABASES', ''))
+
+    # POST /batch
+    app.config['BATCH_MAX_OPERATIONS'] = int(os.environ.get('BATCH_MAX_OPERATIONS', 50))
+
+    # Response encoding: "auto" uses orjson when installed, "stdlib" forces the json module
+    app.config['JSON_BACKEND'] = os.environ.get('JSON_BACKEND', 'auto')
+    from .serialization import FastJSONProvider
+    app.json = FastJSONProvider(app)
+
+    # Low-stock alerts: "log", "mail" or "webhook"
+    app.config['ALERT_NOTIFIER'] = os.environ.get('ALERT_NOTIFIER', 'log')
+    app.config['ALERT_RECIPIENTS'] = [r for r in os.environ.get('ALERT_RECIPIENTS', '').split(',') if r]
+    app.config['ALERT_WEBHOOK_URL'] = os.environ.get('ALERT_WEBHOOK_URL', 'http://127.0.0.1:8025/alerts')
+    app.config['ALERT_WEBHOOK_TIMEOUT'] = float(os.environ.get('ALERT_WEBHOOK_TIMEOUT', 5))
+
+    # Report endpoints read a snapshot at most SNAPSHOT_MAX_AGE seconds old (0 reads the live database)
+    app.config['SNAPSHOT_MAX_AGE'] = int(os.environ.get('SNAPSHOT_MAX_AGE', 0))
+    app.config['SNAPSHOT_DIR'] = os.environ.get('SNAPSHOT_DIR', os.path.join(app.instance_path, 'snapshots'))
+    app.config['SQLITE_WAL'] = os.environ.get('SQLITE_WAL', '1') == '1'
+
+    # A shift closes "balanced" when the counted cash is within this amount of the expected cash
+    app.config['SHIFT_VARIANCE_TOLERANCE'] = float(os.environ.get('SHIFT_VARIANCE_TOLERANCE', 0.0))
+
+    # Pump telemetry (POST /telemetry/readings): queue bound, and batch size / seconds that trigger a group commit
+    app.config['TELEMETRY_QUEUE_SIZE'] = int(os.environ.get('TELEMETRY_QUEUE_SIZE', 20000))
+    app.config['TELEMETRY_BATCH_SIZE'] = int(os.environ.get('TELEMETRY_BATCH_SIZE', 500))
+    app.config['TELEMETRY_FLUSH_INTERVAL'] = float(os.environ.get('TELEMETRY_FLUSH_INTERVAL', 0.5))
+
+    # Admission control: requests in flight per route class (write, read, report, login), seconds a
+    # request may wait for a slot, and optional per-client token buckets as "class=per_second:burst"
+    from . import admission
+    app.config['ADMISSION_CONTROL'] = os.environ.get('ADMISSION_CONTROL', '1') == '1'
+    app.config['ADMISSION_LIMITS'] = admission.parse_settings(
+        os.environ.get('ADMISSION_LIMITS', 'write=4,read=8,report=2,login=2'), int)
+    app.config['ADMISSION_QUEUE_TIMEOUTS'] = admission.parse_settings(
+        os.environ.get('ADMISSION_QUEUE_TIMEOUTS', 'write=10,read=2,report=0,login=0.5'))
+    app.config['ADMISSION_RATES'] = admission.parse_settings(
+        os.environ.get('ADMISSION_RATES', ''), admission.parse_rate)
+    # Terminals whose X-Client-Id header identifies them to the token buckets ("PUMP1,PUMP2");
+    # other clients are told apart by login or address
+    app.config['ADMISSION_CLIENT_IDS'] = {
+        c.strip() for c in os.environ.get('ADMISSION_CLIENT_IDS', '').split(',') if c.strip()}
+
+    # Reverse proxies in front of the app whose X-Forwarded-For is trusted for the client address
+    app.config['PROXY_COUNT'] = int(os.environ.get('PROXY_COUNT', 0))
+
+    # Wet-stock reconciliation: robust z-score that flags a day's variance as an outlier, and the
+    # cumulative variance (percent of litres sold plus fixed litres) beyond which an item is drifting
+    app.config['RECONCILIATION_OUTLIER_Z'] = float(os.environ.get('RECONCILIATION_OUTLIER_Z', 3.5))
+    app.config['RECONCILIATION_TOLERANCE_PCT'] = float(os.environ.get('RECONCILIATION_TOLERANCE_PCT', 0.5))
+    app.config['RECONCILIATION_TOLERANCE_LITRES'] = float(os.environ.get('RECONCILIATION_TOLERANCE_LITRES', 25))
+
+    # Cost of goods sold: "fifo" (oldest purchase layers first) or "average" (moving weighted average).
+    # Changing it needs "flask rebuild-costs" to re-cost history.
+    app.config['COSTING_METHOD'] = os.environ.get('COSTING_METHOD', 'fifo')
+
+    # Seconds between each worker's checks for new /stream events posted by any worker
+    app.config['STREAM_POLL_INTERVAL'] = float(os.environ.get('STREAM_POLL_INTERVAL', 0.5))
+    # Open /stream connections per worker; each holds a thread, so keep it well below GUNICORN_THREADS
+    app.config['STREAM_MAX_CLIENTS'] = int(os.environ.get('STREAM_MAX_CLIENTS', 2))
+
+    # Background report jobs: threads per process building them (0 leaves them to "flask run-report-jobs")
+    # and where their files are kept
+    app.config['REPORT_WORKERS'] = int(os.environ.get('REPORT_WORKERS', 2))
+    app.config['REPORT_DIR'] = os.environ.get('REPORT_DIR', os.path.join(app.instance_path, 'reports'))
+
+    app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'DEBUG')
+
+    if config:
+        app.config.update(config)
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {},
+                                          **stations.binds(app.config['STATION_DATABASES']))
+
+    if app.config['PROXY_COUNT']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_COUNT'])
+
     # Initialize extensions
     db.init_app(app)
+    from . import snapshots
+    snapshots.init_app(app)
     mail.init_app(app)
     migrate = Migrate(app, db)
     
@@ -42,13 +137,23 @@ def create_app():
     def load_user(user_id):
         return User.query.get(int(user_id))
 
+    from . import hooks  # noqa: F401  registers the after-commit session listeners
+    from . import search  # noqa: F401  keeps the search index in sync on write
+    from . import changelog  # noqa: F401  records row versions for /sync
+
+    stations.init_app(app)
+    admission.init_app(app)
+
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
+    from .commands import register_commands
+    register_commands(app)
+
     # Configure logging
-    logging.basicConfig(level=logging.DEBUG)
+    logging.basicConfig(level=app.config['LOG_LEVEL'])
     handler = logging.StreamHandler()
-    handler.setLevel(logging.DEBUG)
+    handler.setLevel(app.config['LOG_LEVEL'])
     app.logger.addHandler(handler)
 
     return app
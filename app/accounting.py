@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from . import db
+from .models import AccountingPeriod, AccountBalance, JournalEntry, JournalLine
+
+
+class PeriodError(ValueError):
+    """ Raised when a period cannot be closed or a closed period would change. """
+
+
+def parse_date(value):
+    """ Parse a YYYY-MM-DD query/body value; returns None for empty values. """
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def latest_period(before=None):
+    """ Most recent closed period, optionally the latest one ending on or before `before`. """
+    query = AccountingPeriod.query
+    if before is not None:
+        query = query.filter(AccountingPeriod.end_date <= before)
+    return query.order_by(AccountingPeriod.end_date.desc()).first()
+
+
+def ensure_open(date):
+    """ Refuse changes dated inside a closed period. """
+    period = latest_period()
+    if period is not None and date < period.end_date:
+        raise PeriodError(f"The books are closed up to {period.end_date.date().isoformat()}")
+
+
+def _line_totals(start, end, account_code=None):
+    """ Per-account debit/credit totals for lines with start <= entry_date < end. """
+    query = db.session.query(
+        JournalLine.account_code,
+        func.max(JournalLine.account_name),
+        func.sum(JournalLine.debit),
+        func.sum(JournalLine.credit),
+    )
+    if account_code is not None:
+        query = query.filter(JournalLine.account_code == account_code)
+    if start is not None:
+        query = query.filter(JournalLine.entry_date >= start)
+    if end is not None:
+        query = query.filter(JournalLine.entry_date < end)
+    return query.group_by(JournalLine.account_code).all()
+
+
+def balances(as_of=None, account_code=None):
+    """ Account totals up to (not including) `as_of`.
+
+    Starts from the snapshot of the latest period closed by `as_of` and adds
+    only the lines posted after it, so the cost follows recent activity.
+    Returns {account_code: {"account_name", "debit", "credit"}}.
+    """
+    period = latest_period(before=as_of)
+    result = {}
+
+    if period is not None:
+        query = AccountBalance.query.filter_by(period_id=period.id)
+        if account_code is not None:
+            query = query.filter_by(account_code=account_code)
+        for snap in query:
+            result[snap.account_code] = {
+                "account_name": snap.account_name,
+                "debit": snap.debit,
+                "credit": snap.credit,
+            }
+
+    since = period.end_date if period else None
+    for code, name, debit, credit in _line_totals(since, as_of, account_code):
+        row = result.setdefault(code, {"account_name": name, "debit": 0.0, "credit": 0.0})
+        row["debit"] = round(row["debit"] + (debit or 0.0), 2)
+        row["credit"] = round(row["credit"] + (credit or 0.0), 2)
+        row["account_name"] = row["account_name"] or name
+
+    return result
+
+
+def close_period(end_date):
+    """ Close the books up to the end of `end_date` and snapshot every account. """
+    end = end_date + timedelta(days=1)
+    previous = latest_period()
+    if previous is not None and end <= previous.end_date:
+        raise PeriodError(f"The books are already closed up to {previous.end_date.date().isoformat()}")
+
+    period = AccountingPeriod(start_date=previous.end_date if previous else None, end_date=end)
+    for code, row in balances(as_of=end).items():
+        period.balances.append(AccountBalance(
+            account_code=code,
+            account_name=row["account_name"],
+            debit=row["debit"],
+            credit=row["credit"],
+        ))
+    db.session.add(period)
+    return period
+
+
+def ledger(account_code, start=None, end=None):
+    """ Opening balance at `start` plus the account's lines in [start, end). """
+    opening = balances(as_of=start, account_code=account_code).get(account_code) if start else None
+    running = round(opening["debit"] - opening["credit"], 2) if opening else 0.0
+
+    query = db.session.query(
+        JournalLine.entry_date, JournalEntry.doc_type, JournalEntry.doc_no, JournalLine.debit, JournalLine.credit,
+    ).join(JournalEntry, JournalLine.entry_id == JournalEntry.id).filter(JournalLine.account_code == account_code)
+    if start is not None:
+        query = query.filter(JournalLine.entry_date >= start)
+    if end is not None:
+        query = query.filter(JournalLine.entry_date < end)
+
+    lines = []
+    opening_balance = running
+    for date, doc_type, doc_no, debit, credit in query.order_by(JournalLine.entry_date, JournalLine.id):
+        running = round(running + debit - credit, 2)
+        lines.append({
+            "date": date.isoformat(),
+            "doc_type": doc_type,
+            "doc_no": doc_no,
+            "debit": debit,
+            "credit": credit,
+            "balance": running,
+        })
+    return opening_balance, lines
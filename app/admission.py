@@ -0,0 +1,200 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, jsonify, request
+from flask_login import current_user
+
+# Route class per endpoint; anything else is "write" (POST/PUT/DELETE) or "read" (GET).
+# None means not limited: long-lived streams, and telemetry which has its own queue.
+ROUTE_CLASSES = {
+    'main.login': 'login',
+    'main.get_all_sales': 'report',
+    'main.get_all_purchases': 'report',
+    'main.get_customer_statement': 'report',
+    'main.get_journal_entries': 'report',
+    'main.get_payables_aging': 'report',
+    'main.get_trial_balance': 'report',
+    'main.get_account_balance': 'report',
+    'main.get_account_ledger': 'report',
+    'main.get_station_report': 'report',
+    'main.get_consolidated_trial_balance': 'report',
+    'main.archive_months': 'report',
+    'main.get_reconciliation': 'report',
+    'main.get_margins': 'report',
+    'main.rebuild_costs': 'report',
+    'main.download_report': 'report',
+    'main.stream': None,
+    'main.ingest_readings': None,
+    'main.telemetry_status': None,
+    'main.admission_status': None,
+}
+
+# Classes that give way to sale posting: refused while writes are waiting for a slot
+YIELDS_TO_WRITES = ('report', 'login')
+
+
+def parse_settings(value, convert=float):
+    """ "write=8,report=2" -> {"write": 8.0, "report": 2.0} (values through `convert`). """
+    settings = {}
+    for part in filter(None, (p.strip() for p in value.split(','))):
+        name, _, setting = part.partition('=')
+        if not setting:
+            raise ValueError(f"Admission setting needs CLASS=VALUE: {part}")
+        settings[name.strip()] = convert(setting.strip())
+    return settings
+
+
+def parse_rate(value):
+    """ "2:10" -> (2.0 tokens/s, burst 10.0); a bare "2" allows a burst of the same size. """
+    rate, _, burst = value.partition(':')
+    return float(rate), float(burst or rate)
+
+
+class TokenBuckets:
+    """ One token bucket per (client, route class), dropping the least recently used beyond `max_clients`. """
+
+    def __init__(self, max_clients=10000):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_clients = max_clients
+
+    def take(self, key, rate, burst):
+        """ Take a token; returns 0 when granted, else the seconds until one is available. """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate if rate > 0 else 60.0
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self._max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class ClassLimit:
+    """ At most `limit` requests of a route class in flight; others wait up to a timeout for a slot. """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self.counters = dict.fromkeys(('admitted', 'queued', 'rejected_rate', 'rejected_busy'), 0)
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout):
+        with self._cond:
+            if self.in_flight >= self.limit:
+                if timeout <= 0:
+                    self.counters['rejected_busy'] += 1
+                    return False
+                self.waiting += 1
+                self.counters['queued'] += 1
+                try:
+                    if not self._cond.wait_for(lambda: self.in_flight < self.limit, timeout):
+                        self.counters['rejected_busy'] += 1
+                        return False
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.counters['admitted'] += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def reject(self, reason):
+        with self._cond:
+            self.counters[reason] += 1
+
+    def status(self):
+        with self._cond:
+            return dict(self.counters, limit=self.limit, in_flight=self.in_flight, waiting=self.waiting)
+
+
+def route_class(endpoint, method):
+    if endpoint in ROUTE_CLASSES:
+        return ROUTE_CLASSES[endpoint]
+    return 'read' if method in ('GET', 'HEAD', 'OPTIONS') else 'write'
+
+
+def client_key():
+    """ Who a rate limit applies to.
+
+    X-Client-Id is sent by the client itself, so it only counts for the
+    terminals listed in ADMISSION_CLIENT_IDS; anyone else could dodge a limit
+    by changing it. Otherwise a signed-in user is limited as themselves and
+    anyone else by address (PROXY_COUNT makes that the client's, not the
+    proxy's).
+    """
+    client_id = request.headers.get('X-Client-Id')
+    if client_id and client_id in current_app.config['ADMISSION_CLIENT_IDS']:
+        return 'terminal', client_id
+    if current_user.is_authenticated:
+        return 'user', current_user.get_id()
+    return 'address', request.remote_addr or 'unknown'
+
+
+def _refuse(status, message, retry_after):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def init_app(app):
+    """ Admission control in front of every view, per process.
+
+    Each route class (write, read, report, login) has its own concurrency
+    limit, so reports can never take the slots sale posting needs, and
+    reports and logins are refused outright while writes are queueing.
+    Requests wait up to the class's queue timeout for a slot, then get 503.
+    Optional per-client token buckets (ADMISSION_RATES) answer 429 to a
+    client going over its rate. Both carry Retry-After.
+    """
+    limits = {name: ClassLimit(int(limit)) for name, limit in app.config['ADMISSION_LIMITS'].items()}
+    timeouts = app.config['ADMISSION_QUEUE_TIMEOUTS']
+    rates = app.config['ADMISSION_RATES']
+    buckets = TokenBuckets()
+    app.extensions['admission'] = limits
+
+    @app.before_request
+    def _admit():
+        g.admission_limit = None
+        if not app.config['ADMISSION_CONTROL']:
+            return None
+        name = route_class(request.endpoint, request.method)
+        limit = limits.get(name)
+        if limit is None:
+            return None
+
+        if name in rates:
+            wait = buckets.take((client_key(), name), *rates[name])
+            if wait:
+                limit.reject('rejected_rate')
+                return _refuse(429, f"Too many {name} requests from this client", wait)
+
+        if name in YIELDS_TO_WRITES and 'write' in limits and limits['write'].waiting:
+            limit.reject('rejected_busy')
+            return _refuse(503, "Busy posting sales, try again shortly", 1)
+
+        if not limit.acquire(timeouts.get(name, 0.0)):
+            return _refuse(503, f"Too many {name} requests in progress", 1)
+        g.admission_limit = limit
+
+    @app.teardown_request
+    def _release(exc):
+        limit = g.pop('admission_limit', None)
+        if limit is not None:
+            limit.release()
+
+
+def status(app):
+    return {name: limit.status() for name, limit in app.extensions['admission'].items()}
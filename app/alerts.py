@@ -0,0 +1,104 @@
+import json
+import logging
+import queue
+import threading
+import urllib.request
+from datetime import datetime
+
+from flask import current_app, g
+from flask_mail import Message
+
+from . import db, mail
+from .routing import current_station
+
+logger = logging.getLogger(__name__)
+
+
+class Notifier:
+    """ Sends stock alerts from a background thread.
+
+    Requests only put an alert id on the queue (after their commit), so a
+    sale never waits for SMTP or a webhook. The backend is chosen with the
+    ALERT_NOTIFIER setting: "log" (default), "mail" or "webhook".
+    """
+
+    def __init__(self, maxsize=1000):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._app = None
+
+    def enqueue(self, alert_id):
+        self._start(current_app._get_current_object())
+        try:
+            self._queue.put_nowait((current_station(), alert_id))
+        except queue.Full:
+            logger.warning("Alert queue full, alert %s will stay unnotified", alert_id)
+
+    def _start(self, app):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._app = app
+                self._thread = threading.Thread(target=self._run, name='stock-alert-notifier', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            station, alert_id = self._queue.get()
+            try:
+                with self._app.app_context():
+                    g.station = station
+                    self._send(alert_id)
+            except Exception:
+                logger.exception("Failed to send stock alert %s", alert_id)
+            finally:
+                self._queue.task_done()
+
+    def _send(self, alert_id):
+        from .models import StockAlert
+
+        alert = StockAlert.query.get(alert_id)
+        if alert is None or alert.notified_at is not None:
+            return
+
+        payload = alert.to_dict()
+        backend = current_app.config['ALERT_NOTIFIER']
+        if backend == 'mail':
+            send_mail(payload)
+        elif backend == 'webhook':
+            send_webhook(payload)
+        else:
+            logger.warning("Low stock: %s at %s (minimum %s)", payload['item_name'], payload['qty'], payload['minimum_level'])
+
+        alert.notified_at = datetime.utcnow()
+        db.session.commit()
+
+    def join(self):
+        """ Block until every queued alert has been handled. """
+        self._queue.join()
+
+
+def send_mail(payload):
+    msg = Message(
+        f"Low stock: {payload['item_name']}",
+        recipients=current_app.config['ALERT_RECIPIENTS'],
+    )
+    msg.body = (
+        f"{payload['item_name']} is down to {payload['qty']} "
+        f"(minimum level {payload['minimum_level']}) as of {payload['created_at']}."
+    )
+    mail.send(msg)
+
+
+def send_webhook(payload):
+    req = urllib.request.Request(
+        current_app.config['ALERT_WEBHOOK_URL'],
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    with urllib.request.urlopen(req, timeout=current_app.config['ALERT_WEBHOOK_TIMEOUT']):
+        pass
+
+
+notifier = Notifier()
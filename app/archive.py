@@ -0,0 +1,165 @@
+import heapq
+from datetime import datetime
+from operator import attrgetter, itemgetter
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import selectinload
+
+from . import db, serialization
+from .accounting import latest_period
+from .models import (Sale, Amount, CreditSale, Purchase, ArchivedSale, ArchivedAmount, ArchivedCreditSale,
+                     ArchivedPurchase, ArchiveRun)
+
+# Hot model -> archive model with the same columns
+ARCHIVES = {
+    Sale: ArchivedSale,
+    Amount: ArchivedAmount,
+    CreditSale: ArchivedCreditSale,
+    Purchase: ArchivedPurchase,
+}
+
+
+class ArchiveError(ValueError):
+    """ Raised when a month cannot be archived (books still open, already archived). """
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def horizon():
+    """ Start of the oldest month still entirely hot, or None when nothing was archived.
+
+    Rows dated before it may be in the archive tables (purchases with an
+    open balance stay hot regardless).
+    """
+    return db.session.query(func.max(ArchiveRun.before)).scalar()
+
+
+def reaches(start):
+    """ True when a read from `start` (None = unbounded) has to look at the archive. """
+    limit = horizon()
+    return limit is not None and (start is None or start < limit)
+
+
+def runs():
+    return ArchiveRun.query.order_by(ArchiveRun.before).all()
+
+
+# ---------------------- Read-through ----------------------
+
+def get(model, id):
+    """ The row with this id from the hot table, else from its archive. """
+    return model.query.get(id) or (ARCHIVES[model].query.get(id) if horizon() else None)
+
+
+def find_all(model, criteria):
+    """ Rows matching `criteria(model)` from the archive (oldest) and then the hot table.
+
+    `criteria` is called with each table's model, e.g. lambda m: m.slip_no == slip_no.
+    """
+    rows = []
+    if horizon():
+        archived = ARCHIVES[model]
+        rows = archived.query.filter(criteria(archived)).order_by(archived.id).all()
+    return rows + model.query.filter(criteria(model)).order_by(model.id).all()
+
+
+def exists(model, **filters):
+    """ True when a hot or archived row matches `filters`. """
+    if model.query.filter_by(**filters).first() is not None:
+        return True
+    return horizon() is not None and ARCHIVES[model].query.filter_by(**filters).first() is not None
+
+
+def _in_range(date_column, start, end):
+    criteria = []
+    if start is not None:
+        criteria.append(date_column >= start)
+    if end is not None:
+        criteria.append(date_column < end)
+    return criteria
+
+
+def fetch_rows(model, columns, start=None, end=None):
+    """ serialization.fetch_rows for start <= date < end, reading the archive only when the range reaches it.
+
+    Archived and hot rows are merged in id order, like a single table.
+    """
+    hot = model.__table__
+    if not reaches(start):
+        return serialization.fetch_rows(columns, *_in_range(hot.c.date, start, end))
+
+    names = [c.name for c in columns]
+    with_id = names if 'id' in names else names + ['id']
+    rows = heapq.merge(*(
+        serialization.fetch_rows([table.c[n] for n in with_id], *_in_range(table.c.date, start, end))
+        for table in (ARCHIVES[model].__table__, hot)
+    ), key=itemgetter('id'))
+    if with_id is names:
+        return list(rows)
+    return [{n: row[n] for n in names} for row in rows]
+
+
+def query_range(model, start=None, end=None, load=()):
+    """ ORM rows for start <= date < end, in id order, including archived ones when the range reaches them.
+
+    `load` names relationships to select-in load on both tables.
+    """
+    results = []
+    for m in ([ARCHIVES[model]] if reaches(start) else []) + [model]:
+        query = m.query.options(*(selectinload(getattr(m, name)) for name in load))
+        results.append(query.filter(*_in_range(m.date, start, end)).order_by(m.id).all())
+    return list(heapq.merge(*results, key=attrgetter('id')))
+
+
+# ---------------------- Moving rows ----------------------
+
+def archivable_before():
+    """ First day of the month holding the end of the closed books; everything before it may be archived. """
+    period = latest_period()
+    return month_start(period.end_date) if period else None
+
+
+def _move(model, criteria):
+    """ Copy the matching rows into the archive table, then delete them from the hot table.
+
+    Runs as plain INSERT ... SELECT / DELETE statements: archived rows must
+    not produce change-log tombstones, terminals keep their copies. The hot
+    tables are AUTOINCREMENT, so archived ids are never handed out again.
+    """
+    hot, cold = model.__table__, ARCHIVES[model].__table__
+    names = [c.name for c in hot.columns]
+    db.session.execute(insert(cold).from_select(names, select(*hot.columns).where(criteria)))
+    return db.session.execute(delete(hot).where(criteria)).rowcount
+
+
+def archive(before=None):
+    """ Move sales and fully paid purchases dated before `before` (a month start) to the archive tables.
+
+    Only closed months can be archived, so archived rows never change
+    again. Purchases with an open balance stay hot for supplier payments.
+    Returns the ArchiveRun.
+    """
+    limit = archivable_before()
+    if limit is None:
+        raise ArchiveError("Close an accounting period before archiving")
+    before = month_start(before) if before else limit
+    if before > limit:
+        raise ArchiveError(f"The books are only closed up to {limit.date().isoformat()}")
+    current = horizon()
+    if current is not None and before <= current:
+        raise ArchiveError(f"Already archived up to {current.date().isoformat()}")
+
+    sale_ids = select(Sale.id).where(Sale.date < before)
+    for child in (Amount, CreditSale):
+        # Rows an earlier run kept hot to hold the id sequence go with their sale now
+        _move(child, child.sale_id.in_(sale_ids) | child.sale_id.in_(select(ArchivedSale.id)))
+    sales = _move(Sale, Sale.id.in_(sale_ids))
+
+    purchases = _move(Purchase, (Purchase.date < before) & (func.coalesce(Purchase.balance, 0.0) <= 0.0))
+
+    run = ArchiveRun(before=before, sales=sales, purchases=purchases)
+    db.session.add(run)
+    db.session.flush()
+    return run
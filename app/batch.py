@@ -0,0 +1,107 @@
+import re
+
+from flask import current_app, g
+from werkzeug.exceptions import HTTPException
+
+from . import db
+
+# "${op_id.path.to.value}" inside a body refers to an earlier operation's response
+REFERENCE = re.compile(r'\$\{([A-Za-z0-9_-]+)((?:\.[A-Za-z0-9_-]+)*)\}')
+
+
+class BatchError(ValueError):
+    """ Raised for a malformed batch or an unresolvable reference. """
+
+
+def _lookup(results, op_id, path):
+    if op_id not in results:
+        raise BatchError(f"Unknown operation reference: {op_id}")
+    value = results[op_id]
+    for part in filter(None, path.split('.')):
+        try:
+            value = value[int(part)] if isinstance(value, list) else value[part]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise BatchError(f"Reference ${{{op_id}{path}}} does not resolve")
+    return value
+
+
+def resolve(value, results):
+    """ Replace references in `value` with earlier results.
+
+    A string that is exactly one reference takes the referenced value as-is
+    (so ids stay integers); references embedded in longer strings are
+    formatted into them.
+    """
+    if isinstance(value, dict):
+        return {k: resolve(v, results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve(v, results) for v in value]
+    if isinstance(value, str):
+        whole = REFERENCE.fullmatch(value)
+        if whole:
+            return _lookup(results, whole.group(1), whole.group(2))
+        return REFERENCE.sub(lambda m: str(_lookup(results, m.group(1), m.group(2))), value)
+    return value
+
+
+def _dispatch(method, path, body):
+    """ Run the view function for `method path` in the current transaction. """
+    adapter = current_app.url_map.bind('localhost')
+    try:
+        endpoint, args = adapter.match(path, method=method)
+    except HTTPException as e:
+        return e.code, {'error': e.description}
+
+    if endpoint == 'main.batch':
+        return 400, {'error': 'Batches cannot be nested'}
+
+    with current_app.test_request_context(path, method=method, json=body):
+        try:
+            response = current_app.make_response(current_app.view_functions[endpoint](**args))
+        except HTTPException as e:
+            return e.code, {'error': e.description}
+    return response.status_code, response.get_json(silent=True)
+
+
+def run(operations):
+    """ Run `operations` in order inside one transaction.
+
+    Each operation is {"id"?, "method", "path", "body"?}. Handlers flush
+    instead of committing (see hooks.commit), and everything is committed
+    once at the end, or rolled back as soon as one operation fails.
+    Returns (committed, results).
+    """
+    if not isinstance(operations, list) or not operations:
+        raise BatchError("operations must be a non-empty list")
+    if len(operations) > current_app.config['BATCH_MAX_OPERATIONS']:
+        raise BatchError(f"At most {current_app.config['BATCH_MAX_OPERATIONS']} operations per batch")
+
+    by_id = {}
+    results = []
+    g.in_batch = True
+    try:
+        for index, op in enumerate(operations):
+            op_id = op.get('id', str(index))
+            try:
+                method = op.get('method', 'GET').upper()
+                path = resolve(op['path'], by_id)
+                body = resolve(op.get('body'), by_id)
+                status, payload = _dispatch(method, path, body)
+            except KeyError:
+                status, payload = 400, {'error': 'Each operation needs a path'}
+            except BatchError as e:
+                status, payload = 400, {'error': str(e)}
+            except Exception as e:
+                current_app.logger.exception("Batch operation %s failed", op_id)
+                status, payload = 500, {'error': str(e)}
+
+            results.append({'id': op_id, 'status': status, 'body': payload})
+            if status >= 400:
+                db.session.rollback()
+                return False, results
+            by_id[op_id] = payload
+    finally:
+        g.in_batch = False
+
+    db.session.commit()
+    return True, results
@@ -0,0 +1,138 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, func, insert, select
+
+from . import db, serialization
+from .models import (Item, ItemPrice, Supplier, Customer, Purchase, Sale, Amount, CreditSale, CreditVoucher,
+                     DebitVoucher, ChangeLog)
+from .routing import is_partitioned
+
+# Tables offline terminals keep a copy of
+SYNCED = {model.__tablename__: model for model in (
+    Item, ItemPrice, Supplier, Customer, Purchase, Sale, Amount, CreditSale, CreditVoucher, DebitVoucher,
+)}
+
+
+def _record(connection, target, op):
+    connection.execute(insert(ChangeLog.__table__).values(
+        table_name=target.__tablename__,
+        row_id=target.id,
+        op=op,
+        changed_at=datetime.utcnow(),
+    ))
+
+
+def _register(model):
+    @event.listens_for(model, 'after_insert')
+    def _on_insert(mapper, connection, target):
+        _record(connection, target, 'I')
+
+    @event.listens_for(model, 'after_update')
+    def _on_update(mapper, connection, target):
+        _record(connection, target, 'U')
+
+    @event.listens_for(model, 'after_delete')
+    def _on_delete(mapper, connection, target):
+        _record(connection, target, 'D')
+
+
+for _model in SYNCED.values():
+    _register(_model)
+
+
+def current_version():
+    return db.session.query(func.coalesce(func.max(ChangeLog.version), 0)).scalar()
+
+
+def data_version():
+    """ A string that changes whenever a synced row does: "<version>", or "<shared>.<station>" with station databases. """
+    if current_app.config['STATION_DATABASES']:
+        shared = db.session.execute(select(func.coalesce(func.max(ChangeLog.version), 0)),
+                                    bind_arguments={'bind': db.engines[None]}).scalar()
+        return f"{shared}.{current_version()}"
+    return str(current_version())
+
+
+def changes_since(since, limit=500, tables=None, bind=None):
+    """ The latest change per row with version > `since`, oldest first.
+
+    Rows changed several times appear once, with their current data, or as a
+    tombstone ({"op": "D", "data": null}) when deleted. Returns
+    (changes, cursor, has_more); pass `cursor` back as `since` for the next page.
+    `bind` reads the change log of that engine instead of the routed one.
+    """
+    latest = select(
+        ChangeLog.table_name, ChangeLog.row_id, func.max(ChangeLog.version).label('version'),
+    ).where(ChangeLog.version > since)
+    if tables:
+        latest = latest.where(ChangeLog.table_name.in_(tables))
+    latest = latest.group_by(ChangeLog.table_name, ChangeLog.row_id).subquery()
+
+    stmt = select(latest.c.table_name, latest.c.row_id, latest.c.version, ChangeLog.op) \
+        .join(ChangeLog, ChangeLog.version == latest.c.version) \
+        .order_by(latest.c.version).limit(limit + 1)
+    rows = db.session.execute(stmt, bind_arguments={'bind': bind} if bind is not None else None).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Fetch the current data for every live row, one query per table
+    wanted = {}
+    for table_name, row_id, _, op in rows:
+        if op != 'D':
+            wanted.setdefault(table_name, []).append(row_id)
+    data = {}
+    for table_name, ids in wanted.items():
+        model = SYNCED[table_name]
+        columns = serialization.columns_for(model)
+        for row in serialization.fetch_rows(columns, model.id.in_(ids)):
+            data[(table_name, row['id'])] = row
+
+    changes = []
+    for table_name, row_id, version, op in rows:
+        row = data.get((table_name, row_id))
+        changes.append({
+            'table': table_name,
+            'id': row_id,
+            'version': version,
+            'op': 'D' if row is None else op,
+            'data': row,
+        })
+
+    cursor = rows[-1][2] if rows else since
+    return changes, cursor, has_more
+
+
+def parse_cursor(value):
+    """ "12" -> (12, 0); "12.40" -> (12, 40). The second part is the station change log. """
+    shared, _, station = (value or '0').partition('.')
+    return int(shared), int(station or 0)
+
+
+def station_changes_since(since, station_since, limit=500, tables=None):
+    """ changes_since() when stations have their own databases.
+
+    Master data changes are logged in the default database and station rows
+    in the station's, so both logs are read (master data first) and the
+    cursor is "<default version>.<station version>".
+    """
+    tables = tables or list(SYNCED)
+    shared = [t for t in tables if not is_partitioned(SYNCED[t])]
+    local = [t for t in tables if is_partitioned(SYNCED[t])]
+
+    changes, cursor, has_more = [], since, False
+    if shared:
+        changes, cursor, has_more = changes_since(since, limit, shared, bind=db.engines[None])
+    station_cursor = station_since
+    if local and not has_more:
+        more, station_cursor, has_more = changes_since(station_since, limit - len(changes), local)
+        changes += more
+    return changes, f"{cursor}.{station_cursor}", has_more
+
+
+def sync_page(since, station_since, limit=500, tables=None):
+    """ One /sync page for a parsed cursor; returns (changes, cursor, has_more). """
+    if current_app.config['STATION_DATABASES']:
+        return station_changes_since(since, station_since, limit, tables)
+    changes, cursor, has_more = changes_since(since, limit, tables)
+    return changes, str(cursor), has_more
@@ -0,0 +1,173 @@
+import click
+
+from . import db, stations
+
+
+def _at_each_station(rebuild):
+    """ Run `rebuild()` and commit, once per station database. Returns {station: result}. """
+    def run():
+        result = rebuild()
+        db.session.commit()
+        return result
+    return stations.fan_out(run)
+
+
+def register_commands(app):
+    @app.cli.command('rebuild-payables')
+    def rebuild_payables():
+        """ Recompute supplier payable totals and aging buckets from purchases. """
+        from . import payables
+        for station, count in _at_each_station(payables.rebuild).items():
+            click.echo(f"{station}: rebuilt payables for {count} supplier(s).")
+
+    @app.cli.command('rebuild-journal')
+    def rebuild_journal():
+        """ Post journal entries for sales, purchases and vouchers entered before the journal (safe to re-run). """
+        from . import journal
+        for station, (posted, skipped) in _at_each_station(journal.rebuild).items():
+            click.echo(f"{station}: posted {posted} document(s), skipped {skipped}.")
+
+    @app.cli.command('rebuild-stock')
+    def rebuild_stock():
+        """ Recompute on-hand stock for every item from purchases and sales. """
+        from . import stock
+        for station, count in _at_each_station(stock.rebuild).items():
+            click.echo(f"{station}: rebuilt stock levels for {count} item(s).")
+
+    @app.cli.command('rebuild-shifts')
+    def rebuild_shifts():
+        """ Recompute shift totals from the sales posted on each shift. """
+        from . import shifts
+        for station, count in _at_each_station(shifts.rebuild).items():
+            click.echo(f"{station}: rebuilt totals for {count} shift(s).")
+
+    @app.cli.command('rebuild-kpis')
+    def rebuild_kpis():
+        """ Recompute the dashboard counters from sales, purchases and vouchers. """
+        from . import kpis
+        for station, count in _at_each_station(kpis.rebuild).items():
+            click.echo(f"{station}: rebuilt the dashboard counters from {count} slip(s).")
+
+    @app.cli.command('rebuild-costs')
+    @click.option('--from', 'start', help="YYYY-MM-DD to re-cost from; default the whole history.")
+    @click.option('--item', 'item_ids', type=int, multiple=True, help="Item id; repeat for several, default all.")
+    def rebuild_costs(start, item_ids):
+        """ Re-cost purchases and sales from a date (after back-dated entries or a COSTING_METHOD change). """
+        from . import costing
+        from .accounting import parse_date
+
+        def run():
+            return costing.replay(list(item_ids) or None, parse_date(start))
+
+        for station, count in _at_each_station(run).items():
+            click.echo(f"{station}: costed {count} purchase(s) and sale line(s).")
+
+    @app.cli.command('run-report-jobs')
+    def run_report_jobs():
+        """ Build queued report jobs, and ones a stopped process left running, at every station. """
+        from . import reports
+        for station, jobs in stations.fan_out(reports.run_pending).items():
+            for job in jobs:
+                detail = {'done': f", {job.rows} line(s)", 'failed': f": {job.error}"}.get(job.status, '')
+                click.echo(f"{station}: report job {job.id} ({job.kind}) {job.status}{detail}")
+
+    @app.cli.command('purge-reports')
+    @click.option('--days', default=30, show_default=True, help="Keep jobs created within this many days.")
+    def purge_reports(days):
+        """ Delete finished report jobs and their files once they are older than --days. """
+        from . import reports
+        from datetime import datetime, timedelta
+
+        before = datetime.utcnow() - timedelta(days=days)
+        for station, count in _at_each_station(lambda: reports.purge(before)).items():
+            click.echo(f"{station}: purged {count} report job(s).")
+
+    @app.cli.command('apply-prices')
+    def apply_prices():
+        """ Copy prices that have come into force onto the items' sale_rate (run from cron). """
+        from . import prices
+        changed = prices.apply_due()
+        db.session.commit()
+        click.echo(f"Updated the sale rate of {len(changed)} item(s).")
+
+    @app.cli.command('archive')
+    @click.option('--before', help="YYYY-MM-DD; defaults to the end of the closed books.")
+    def archive_months(before):
+        """ Move closed months of sales and paid purchases into the archive tables, at every station. """
+        from . import archive
+        from .accounting import parse_date
+
+        def run():
+            try:
+                return archive.archive(parse_date(before)).to_dict()
+            except archive.ArchiveError as e:
+                return str(e)
+
+        for station, result in _at_each_station(run).items():
+            if isinstance(result, str):
+                click.echo(f"{station}: {result}")
+            else:
+                click.echo(f"{station}: archived {result['sales']} sale line(s) and "
+                           f"{result['purchases']} purchase(s) before {result['before'][:10]}.")
+
+    @app.cli.command('reconcile')
+    @click.option('--from', 'start', help="YYYY-MM-DD; defaults to 30 days before --to.")
+    @click.option('--to', 'end', help="YYYY-MM-DD, inclusive; defaults to today.")
+    @click.option('--item', 'item_ids', type=int, multiple=True, help="Item id; repeat for several, default all.")
+    def reconcile(start, end, item_ids):
+        """ Reconcile meter sales and deliveries against tank dips, at every station, and list flagged days. """
+        from . import reconciliation
+        from .accounting import parse_date
+        from datetime import timedelta
+
+        end = parse_date(end)
+        start, end = reconciliation.default_range(parse_date(start), end + timedelta(days=1) if end else None)
+        results = stations.fan_out(lambda: reconciliation.reconcile(start, end, list(item_ids), flagged_only=True))
+        for station, items in results.items():
+            for item in items:
+                click.echo(f"{station}: {item['item_name'] or item['item_id']}: sold {item['sales']:,.1f} L, "
+                           f"variance {item['variance']:+,.1f} L ({item['variance_pct'] or 0:+.2f}%), "
+                           f"{item['flagged_days']} flagged day(s).")
+                for day in item['days']:
+                    click.echo(f"    {day['date']}  dip {day['dip']}  book {day['book_stock']}  "
+                               f"variance {day['variance']:+,.1f} L  {', '.join(day['flags'])}")
+
+    @app.cli.command('refresh-snapshots')
+    def refresh_snapshots():
+        """ Refresh the report snapshots of every SQLite database (run from cron). """
+        from . import snapshots
+        for name, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+                snapshots.refresh(engine)
+                click.echo(f"Refreshed the snapshot of {name or 'the default database'}.")
+
+    @app.cli.command('rebuild-search')
+    def rebuild_search():
+        """ Recreate the item/customer/supplier search index. """
+        from . import search
+        count = search.rebuild()
+        db.session.commit()
+        click.echo(f"Indexed {count} record(s).")
+
+    @app.cli.command('seed-admin')
+    def seed_admin():
+        """ Create the admin user if it does not exist yet. """
+        from seed import seed_admin_user
+        seed_admin_user()
+
+    @app.cli.command('init-db')
+    def init_db():
+        """ Create missing tables without migrations (development only) and seed the admin. """
+        from init_db import init_db as create_tables
+        create_tables(app)
+
+    @app.cli.command('upgrade-stations')
+    def upgrade_stations():
+        """ Apply the migrations to every database in STATION_DATABASES. """
+        from flask_migrate import upgrade
+        from . import create_app
+        for station, url in app.config['STATION_DATABASES'].items():
+            station_app = create_app({'SQLALCHEMY_DATABASE_URI': url, 'STATION_DATABASES': {}})
+            with station_app.app_context():
+                upgrade()
+            click.echo(f"Upgraded the {station} database.")
@@ -0,0 +1,284 @@
+from collections import deque
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from . import db, archive
+from .archive import ARCHIVES
+from .models import Item, Customer, Purchase, Sale, ItemCost, CostLayer, SaleCost, CostAllocation
+
+METHODS = ('fifo', 'average')
+
+# Date of the opening-stock layer, before any movement
+OPENING = datetime(1970, 1, 1)
+
+# Dimensions margin reports can be grouped by
+GROUPS = {
+    'item': SaleCost.item_id,
+    'day': func.date(SaleCost.date),
+    'customer': SaleCost.customer_id,
+}
+
+
+def _fifo():
+    method = current_app.config['COSTING_METHOD']
+    if method not in METHODS:
+        raise ValueError(f"COSTING_METHOD must be one of {', '.join(METHODS)}, not {method!r}")
+    return method == 'fifo'
+
+
+def unit_cost(purchase):
+    """ What a litre of this purchase cost, after the discount. """
+    return (purchase.purchase_rate or 0.0) * (1 - (purchase.discount_percent or 0.0) / 100)
+
+
+class _Ledger:
+    """ One item's costing state while its movements are applied in date order. """
+
+    def __init__(self, state, fifo):
+        self.state = state
+        self.fifo = fifo
+        self._layers = None
+
+    def layers(self):
+        """ Layers with litres left, oldest first (FIFO only); loaded on first use. """
+        if self._layers is None:
+            self._layers = deque(CostLayer.query.filter(CostLayer.item_id == self.state.item_id, CostLayer.remaining > 0)
+                                 .order_by(CostLayer.date, CostLayer.id))
+        return self._layers
+
+    def purchase(self, purchase):
+        state, cost = self.state, unit_cost(purchase)
+        layers = self.layers() if self.fifo else None
+        # Litres already sold with nothing on hand come out of this delivery straight away
+        remaining = max(0.0, purchase.qty - max(0.0, -state.qty)) if self.fifo else purchase.qty
+        layer = CostLayer(item_id=state.item_id, purchase_id=purchase.id, date=purchase.date,
+                          qty=purchase.qty, remaining=remaining, unit_cost=cost)
+        db.session.add(layer)
+        db.session.flush()  # allocations refer to the layer id
+        if layers is not None and remaining > 0:
+            layers.append(layer)
+
+        state.qty = round(state.qty + purchase.qty, 6)
+        state.value = round(state.value + purchase.qty * cost, 4)
+        state.last_cost = cost
+        self._moved(purchase.date)
+
+    def sale(self, sale):
+        state, qty = self.state, sale.qty
+        if self.fifo and qty > 0:
+            cost, needed, layers = 0.0, qty, self.layers()
+            while needed > 1e-9 and layers:
+                layer = layers[0]
+                taken = min(needed, layer.remaining)
+                layer.remaining = round(layer.remaining - taken, 6)
+                cost += taken * layer.unit_cost
+                needed -= taken
+                db.session.add(CostAllocation(sale_id=sale.id, layer_id=layer.id, qty=taken))
+                if layer.remaining <= 1e-9:
+                    layers.popleft()
+            # Sold more than was bought: priced at the latest cost, and the next delivery makes up the litres
+            cost += needed * state.last_cost
+        else:
+            cost = qty * state.average_cost
+
+        state.qty = round(state.qty - qty, 6)
+        state.value = round(state.value - cost, 4)
+        db.session.add(SaleCost(sale_id=sale.id, item_id=sale.item_id, customer_id=sale.customer_id, date=sale.date,
+                                qty=qty, revenue=sale.net_amount, cost=round(cost, 4)))
+        self._moved(sale.date)
+
+    def _moved(self, date):
+        if self.state.last_date is None or date > self.state.last_date:
+            self.state.last_date = date
+
+
+def _open(item):
+    """ A new costing state for `item`, holding its opening stock at its purchase rate. """
+    qty, cost = item.opening_stock or 0.0, item.purchase_rate or 0.0
+    state = ItemCost(item_id=item.id, qty=qty, value=round(qty * cost, 4), last_cost=cost, last_date=None)
+    db.session.add(state)
+    if qty:
+        db.session.add(CostLayer(item_id=item.id, purchase_id=None, date=OPENING, qty=qty, remaining=qty,
+                                 unit_cost=cost))
+    return state
+
+
+def _movements(item_ids, start=None):
+    """ Purchases and sales of `item_ids` since `start` (None = all), archived ones included, in costing order. """
+    rows = []
+    for model, kind in ((Purchase, 0), (Sale, 1)):
+        for m in ([ARCHIVES[model]] if archive.reaches(start) else []) + [model]:
+            query = m.query.filter(m.item_id.in_(item_ids), m.date.isnot(None))
+            if start is not None:
+                query = query.filter(m.date >= start)
+            # A delivery comes before a sale at the same moment
+            rows.extend((row.date, kind, row.id, row) for row in query)
+    rows.sort(key=lambda r: r[:3])
+    return [(kind, row) for _, kind, _, row in rows]
+
+
+def _forget(item_ids):
+    layers = select(CostLayer.id).where(CostLayer.item_id.in_(item_ids))
+    CostAllocation.query.filter(CostAllocation.layer_id.in_(layers)).delete(synchronize_session='fetch')
+    for model in (SaleCost, CostLayer, ItemCost):
+        model.query.filter(model.item_id.in_(item_ids)).delete(synchronize_session='fetch')
+
+
+def _rewind(states, start):
+    """ Take back everything costed from `start` on, leaving `states` as they were just before it.
+
+    Quantities and values only ever add up, so subtracting what later
+    purchases and sales contributed is exact; FIFO layers get back the litres
+    those sales took from them.
+    """
+    item_ids = list(states)
+    for item_id, qty, cost in db.session.query(SaleCost.item_id, func.sum(SaleCost.qty), func.sum(SaleCost.cost)) \
+            .filter(SaleCost.item_id.in_(item_ids), SaleCost.date >= start).group_by(SaleCost.item_id):
+        states[item_id].qty = round(states[item_id].qty + qty, 6)
+        states[item_id].value = round(states[item_id].value + cost, 4)
+    for item_id, qty, value in db.session.query(CostLayer.item_id, func.sum(CostLayer.qty),
+                                                func.sum(CostLayer.qty * CostLayer.unit_cost)) \
+            .filter(CostLayer.item_id.in_(item_ids), CostLayer.date >= start).group_by(CostLayer.item_id):
+        states[item_id].qty = round(states[item_id].qty - qty, 6)
+        states[item_id].value = round(states[item_id].value - value, 4)
+
+    later_sales = select(SaleCost.sale_id).where(SaleCost.item_id.in_(item_ids), SaleCost.date >= start)
+    refill = dict(db.session.query(CostAllocation.layer_id, func.sum(CostAllocation.qty))
+                  .filter(CostAllocation.sale_id.in_(later_sales)).group_by(CostAllocation.layer_id))
+    for layer in CostLayer.query.filter(CostLayer.id.in_(refill), CostLayer.date < start):
+        layer.remaining = round(layer.remaining + refill[layer.id], 6)
+
+    CostAllocation.query.filter(CostAllocation.sale_id.in_(later_sales)).delete(synchronize_session='fetch')
+    for model in (SaleCost, CostLayer):
+        model.query.filter(model.item_id.in_(item_ids), model.date >= start).delete(synchronize_session='fetch')
+
+    # The latest remaining purchase sets the cost of any shortfall again
+    last_costs = dict(db.session.query(CostLayer.item_id, CostLayer.unit_cost)
+                      .filter(CostLayer.item_id.in_(item_ids))
+                      .order_by(CostLayer.date, CostLayer.id))
+    latest = {}
+    for model in (SaleCost, CostLayer):
+        for item_id, date in db.session.query(model.item_id, func.max(model.date)) \
+                .filter(model.item_id.in_(item_ids)).group_by(model.item_id):
+            latest[item_id] = max(date, latest.get(item_id, date))
+    for item_id, state in states.items():
+        state.last_cost = last_costs.get(item_id, state.last_cost)
+        state.last_date = latest.get(item_id)
+
+
+def replay(item_ids=None, start=None):
+    """ Re-cost `item_ids` (default all items) from `start`: rewind to it and apply every movement since.
+
+    With no `start`, or for items not costed yet, the whole history is costed
+    from the opening stock. Used after back-dated entries and deletes, and to
+    switch COSTING_METHOD. Returns the number of movements costed; the caller
+    commits.
+    """
+    if item_ids is None:
+        item_ids = [item_id for (item_id,) in db.session.query(Item.id)]
+    if start is not None and start <= OPENING:
+        start = None
+    if start is None:
+        _forget(item_ids)
+    states = {s.item_id: s for s in ItemCost.query.filter(ItemCost.item_id.in_(item_ids))}
+    if states:
+        _rewind(states, start)
+
+    new = [item for item in Item.query.filter(Item.id.in_(item_ids)) if item.id not in states]
+    movements = _movements(list(states), start) if states else []
+    for item in new:
+        states[item.id] = _open(item)
+    if new:
+        movements = sorted(movements + _movements([item.id for item in new]), key=lambda m: (m[1].date, m[0], m[1].id))
+
+    fifo = _fifo()
+    ledgers = {item_id: _Ledger(state, fifo) for item_id, state in states.items()}
+    for kind, row in movements:
+        ledger = ledgers[row.item_id]
+        ledger.purchase(row) if kind == 0 else ledger.sale(row)
+    return len(movements)
+
+
+def _post(item_id, date, apply):
+    """ Cost one movement; returns True when the item was re-costed instead, this movement included. """
+    state = ItemCost.query.get(item_id)
+    if state is None or (state.last_date is not None and date < state.last_date):
+        # First movement of the item (its whole history is costed) or a back-dated one
+        replay([item_id], None if state is None else date)
+        return True
+    apply(_Ledger(state, _fifo()))
+    return False
+
+
+def add_purchase(purchase):
+    """ Cost a new purchase (after it is flushed, before the commit). """
+    if purchase.item_id is not None:
+        _post(purchase.item_id, purchase.date, lambda ledger: ledger.purchase(purchase))
+
+
+def add_sales(sales):
+    """ Cost the lines of a new slip (after they are flushed, before the commit). """
+    recosted = set()
+    for sale in sales:
+        # A re-cost already took in the slip's later lines of the same item
+        if sale.item_id not in recosted and _post(sale.item_id, sale.date, lambda ledger: ledger.sale(sale)):
+            recosted.add(sale.item_id)
+
+
+def remove(item_id, date):
+    """ Re-cost an item from `date` after one of its purchases or sales dated then was deleted and flushed. """
+    if item_id is not None and date is not None and ItemCost.query.get(item_id) is not None:
+        replay([item_id], date)
+
+
+def margins(start=None, end=None, group_by=('item',), item_id=None, customer_id=None):
+    """ Gross margin from the costed sale lines, grouped by item, day and/or customer.
+
+    Returns (rows, totals).
+    """
+    keys = [GROUPS[name].label(name) for name in group_by]
+    query = db.session.query(*keys, func.sum(SaleCost.qty), func.sum(SaleCost.revenue), func.sum(SaleCost.cost))
+    if start is not None:
+        query = query.filter(SaleCost.date >= start)
+    if end is not None:
+        query = query.filter(SaleCost.date < end)
+    if item_id is not None:
+        query = query.filter(SaleCost.item_id == item_id)
+    if customer_id is not None:
+        query = query.filter(SaleCost.customer_id == customer_id)
+    rows = query.group_by(*keys).order_by(*keys).all()
+
+    # Names come from separate lookups: with station databases items and customers live elsewhere
+    items = dict(db.session.query(Item.id, Item.item_name)) if 'item' in group_by else {}
+    customers = dict(db.session.query(Customer.id, Customer.name)) if 'customer' in group_by else {}
+
+    result, totals = [], {'qty': 0.0, 'revenue': 0.0, 'cost': 0.0}
+    for row in rows:
+        entry = dict(zip(group_by, row))
+        if 'item' in entry:
+            entry['item_name'] = items.get(entry['item'])
+        if 'customer' in entry:
+            entry['customer_name'] = customers.get(entry['customer'])
+        qty, revenue, cost = row[len(group_by):]
+        entry.update(_figures(qty, revenue, cost))
+        result.append(entry)
+        totals = {'qty': totals['qty'] + qty, 'revenue': totals['revenue'] + revenue, 'cost': totals['cost'] + cost}
+    return result, _figures(**totals)
+
+
+def _figures(qty, revenue, cost):
+    margin = revenue - cost
+    return {
+        'qty': round(qty, 3),
+        'revenue': round(revenue, 2),
+        'cost': round(cost, 2),
+        'margin': round(margin, 2),
+        'margin_pct': round(margin / revenue * 100, 2) if revenue else None,
+    }
+
+
+def open_layers(item_id):
+    return CostLayer.query.filter(CostLayer.item_id == item_id, CostLayer.remaining > 0) \
+        .order_by(CostLayer.date, CostLayer.id).all()
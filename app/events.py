@@ -0,0 +1,269 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
+
+from . import db
+from .hooks import after_commit
+from .models import StreamEvent, ms_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# How long published events stay in the table for clients resuming on another worker
+KEEP = timedelta(hours=1)
+
+# Seconds between clean-ups of older events
+PRUNE_EVERY = 60
+
+
+class TooManySubscribers(Exception):
+    """ Raised when this worker already streams to STREAM_MAX_CLIENTS clients; the client should retry later. """
+
+
+class EventBroker:
+    """ Fan-out of committed sales, purchases, vouchers and meter readings to SSE clients.
+
+    Events are written to the stream_event table once their transaction has
+    committed, by whichever worker process posted them. Each process tails
+    that table from one thread and keeps the newest events, encoded once, in
+    a ring buffer that its subscribers walk from their last id, so adding a
+    dashboard costs no database queries. Event ids are the table's ids,
+    shared by every worker: a client that reconnects to another worker with
+    Last-Event-ID resumes where it was, from the table if the buffer no
+    longer has those events, and is told to reload only when they are gone.
+
+    Every open stream holds one of the worker's threads, so a worker serves
+    at most STREAM_MAX_CLIENTS of them and keeps the rest for posting.
+    """
+
+    def __init__(self, buffer_size=1000):
+        self._events = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._last = None  # id of the newest event read from the table
+        self._thread = None
+        self._pid = None
+        self._subscribers = 0
+
+    def publish(self, event_type, data):
+        """ Record an event for every worker's subscribers; call it after the commit. Returns its id. """
+        payload = json.dumps(data, default=str, separators=(',', ':'))
+        try:
+            with db.session.get_bind(mapper=StreamEvent).begin() as conn:
+                return conn.execute(insert(StreamEvent.__table__).values(
+                    event_type=event_type, payload=payload, created_at=datetime.utcnow(),
+                )).inserted_primary_key[0]
+        except Exception:
+            # The document is committed already; a dashboard missing one event is not worth failing for
+            logger.exception("Could not publish a %s event", event_type)
+            return None
+
+    @staticmethod
+    def _encode(event_id, event_type, payload):
+        return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+    def _read(self, conn, after, until=None, limit=None):
+        stmt = select(StreamEvent.id, StreamEvent.event_type, StreamEvent.payload) \
+            .where(StreamEvent.id > after).order_by(StreamEvent.id)
+        if until is not None:
+            stmt = stmt.where(StreamEvent.id <= until)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return [(event_id, event_type, json.loads(payload), self._encode(event_id, event_type, payload))
+                for event_id, event_type, payload in conn.execute(stmt)]
+
+    def _start(self, app, engine):
+        """ Start tailing the table in this process (after a fork, the master's thread is not ours). """
+        with self._cond:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            with engine.connect() as conn:
+                self._last = conn.execute(select(func.coalesce(func.max(StreamEvent.id), 0))).scalar()
+            self._events.clear()
+            if self._pid != os.getpid():
+                self._subscribers = 0  # the master's clients are not ours
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._follow, args=(app, engine), name='event-stream',
+                                            daemon=True)
+            self._thread.start()
+
+    def _follow(self, app, engine):
+        interval = app.config['STREAM_POLL_INTERVAL']
+        pruned = time.monotonic()
+        while True:
+            new_events = []
+            try:
+                with engine.connect() as conn:
+                    new_events = self._read(conn, self._last, limit=self._events.maxlen)
+                if new_events:
+                    with self._cond:
+                        self._events.extend(new_events)
+                        self._last = new_events[-1][0]
+                        self._cond.notify_all()
+                if time.monotonic() - pruned > PRUNE_EVERY:
+                    with engine.begin() as conn:
+                        conn.execute(delete(StreamEvent.__table__)
+                                     .where(StreamEvent.created_at < datetime.utcnow() - KEEP))
+                    pruned = time.monotonic()
+            except Exception:
+                logger.exception("Could not read the event stream")
+            if len(new_events) < self._events.maxlen:
+                time.sleep(interval)
+
+    def _start_position(self, last_event_id, engine):
+        """ (id to resume after, events to send first), or (None, []) when the client must reload. """
+        if not last_event_id:
+            return self._last, []
+        if not last_event_id.isdigit():
+            return None, []
+        n = int(last_event_id)
+        if n >= self._last:
+            # It may have seen newer events on another worker than this one has read so far
+            return n, []
+        oldest = self._events[0][0] if self._events else self._last + 1
+        if n >= oldest - 1:
+            return n, []
+        # Older than the buffer: catch up from the table while it still has everything since `n`
+        with engine.connect() as conn:
+            missed = self._read(conn, n, until=self._last, limit=self._events.maxlen + 1)
+            # Events are pruned oldest first, so if `n` itself is still there nothing after it is missing
+            gone = conn.execute(select(StreamEvent.id).where(StreamEvent.id == n)).first() is None
+        if gone or len(missed) > self._events.maxlen:
+            return None, []
+        return self._last, missed
+
+    def subscribe(self, matches=lambda event_type, data: True, last_event_id=None, heartbeat=15.0):
+        """ Generator of SSE text chunks for one client.
+
+        Call it from the view: where to start is worked out now, in the
+        request, while the generator itself runs after the request context
+        is gone and touches neither the app nor the session. Call
+        unsubscribe() once the response is closed. Raises TooManySubscribers.
+        """
+        app = current_app._get_current_object()
+        engine = db.session.get_bind(mapper=StreamEvent)
+        self._start(app, engine)
+        with self._cond:
+            if self._subscribers >= app.config['STREAM_MAX_CLIENTS']:
+                raise TooManySubscribers(f"{self._subscribers} clients are streaming from this worker")
+            position, missed = self._start_position(last_event_id, engine)
+            self._subscribers += 1
+        return self._stream(position, missed, matches, heartbeat)
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    def _stream(self, position, missed, matches, heartbeat):
+        if position is None:
+            position = self._last
+            yield f"id: {position}\nevent: reset\ndata: {{}}\n\n"
+
+        yield "retry: 3000\n\n"
+        pending = [text for _, event_type, data, text in missed if matches(event_type, data)]
+        if pending:
+            yield ''.join(pending)
+        while True:
+            with self._cond:
+                if self._last <= position:
+                    self._cond.wait(timeout=heartbeat)
+                oldest = self._events[0][0] if self._events else position + 1
+                if position < oldest - 1 and self._last > position:
+                    # This client fell behind the buffer; make it reload
+                    position = self._last
+                    pending = [f"id: {position}\nevent: reset\ndata: {{}}\n\n"]
+                else:
+                    pending = [text for event_id, event_type, data, text in self._events
+                               if event_id > position and matches(event_type, data)]
+                    position = max(position, self._last)
+
+            if pending:
+                yield ''.join(pending)
+            else:
+                yield ": keepalive\n\n"
+
+
+def event_filter(types=None, item_id=None, cashier=None):
+    """ Predicate for EventBroker.subscribe from the /stream query parameters. """
+    def matches(event_type, data):
+        if types and event_type not in types:
+            return False
+        if item_id is not None and item_id not in data.get('item_ids', ()):
+            return False
+        if cashier is not None and data.get('cashier') != cashier:
+            return False
+        return True
+    return matches
+
+
+broker = EventBroker()
+
+
+def publish_after_commit(event_type, data):
+    """ Publish once the current transaction has committed (never for rolled-back work). """
+    after_commit(lambda: broker.publish(event_type, data))
+
+
+def sale_event(slip_no, customer, sales, cash):
+    return {
+        "slip_no": slip_no,
+        "customer_id": customer.id,
+        "salesperson": sales[0].salesperson,
+        "cashier": sales[0].cashier,
+        "date": sales[0].date.isoformat() if sales[0].date else None,
+        "cash": cash,
+        "total": round(sum(s.net_amount for s in sales), 2),
+        "item_ids": [s.item_id for s in sales],
+        "items": [{
+            "sale_id": s.id,
+            "item_id": s.item_id,
+            "previous_reading": s.previous_reading,
+            "current_reading": s.current_reading,
+            "qty": s.qty,
+            "unit_rate": s.unit_rate,
+            "net_amount": s.net_amount,
+        } for s in sales],
+    }
+
+
+def purchase_event(purchase_no, supplier, purchases):
+    return {
+        "purchase_no": purchase_no,
+        "supplier_id": supplier.id,
+        "total": round(sum(p.net_amount for p in purchases), 2),
+        "item_ids": [p.item_id for p in purchases],
+        "items": [{
+            "purchase_id": p.id,
+            "bill_no": p.bill_no,
+            "item_id": p.item_id,
+            "qty": p.qty,
+            "net_amount": p.net_amount,
+        } for p in purchases],
+    }
+
+
+def voucher_event(kind, voucher_no, account, total):
+    return {
+        "kind": kind,  # "credit" or "debit"
+        "voucher_no": voucher_no,
+        "account": account,
+        "total": round(total, 2),
+    }
+
+
+def reading_event(readings):
+    """ A batch of meter readings written by the telemetry writer: [(item_id, nozzle, taken_at_ms, reading)]. """
+    return {
+        "item_ids": sorted({item_id for item_id, _, _, _ in readings}),
+        "readings": [{
+            "item_id": item_id,
+            "nozzle": nozzle,
+            "reading": reading,
+            "taken_at": ms_to_datetime(taken_at).isoformat(),
+        } for item_id, nozzle, taken_at, reading in readings],
+    }
@@ -0,0 +1,44 @@
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import db
+
+
+def after_commit(callback):
+    """ Run `callback()` once the current db.session transaction commits.
+
+    Use this for side effects that must not happen if the request rolls back
+    (notifications, pushes to other processes). Callbacks are dropped on
+    rollback and must not use the session themselves.
+    """
+    db.session().info.setdefault('after_commit', []).append(callback)
+
+
+def after_rollback(callback):
+    """ Run `callback()` if the current db.session transaction rolls back. """
+    db.session().info.setdefault('after_rollback', []).append(callback)
+
+
+def commit():
+    """ Commit db.session, or only flush while a /batch request owns the transaction. """
+    if g.get('in_batch'):
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_after_commit(session):
+    session.info.pop('after_rollback', None)
+    callbacks = session.info.pop('after_commit', [])
+    for callback in callbacks:
+        callback()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _run_after_rollback(session):
+    session.info.pop('after_commit', None)
+    callbacks = session.info.pop('after_rollback', [])
+    for callback in callbacks:
+        callback()
@@ -0,0 +1,292 @@
+from datetime import datetime
+
+from sqlalchemy import func
+
+from . import db, archive
+from .accounting import PeriodError, ensure_open, latest_period
+from .models import (JournalEntry, JournalLine, Sale, CreditVoucher, DebitVoucher, Amount, CreditSale, Customer,
+                     Purchase, Supplier, ArchivedAmount, ArchivedCreditSale, ArchivedSale)
+
+# Fixed ledger accounts used by the automatic postings
+CASH = ('CASH', 'Cash in hand')
+BANK = ('BANK', 'Bank')
+SALES = ('SALES', 'Fuel sales')
+PURCHASES = ('PURCHASES', 'Fuel purchases')
+DISCOUNT_RECEIVED = ('DISCOUNT_RECEIVED', 'Discount received')
+
+
+class JournalError(ValueError):
+    """ Raised when a document cannot be posted (unbalanced, duplicate, empty). """
+
+
+def customer_account(customer):
+    return (f"CUST-{customer.id}", customer.name)
+
+
+def customer_id_for(account_code):
+    """ The customer id behind a CUST-<id> account code, else None. """
+    prefix, _, number = account_code.partition('-')
+    return int(number) if prefix == 'CUST' and number.isdigit() else None
+
+
+def supplier_account(supplier):
+    return (f"SUPP-{supplier.id}", supplier.name)
+
+
+def cash_account(mode):
+    """ Map the "online" / "in hand" choice used on vouchers and sales to a ledger account. """
+    return BANK if mode in ('online', True) else CASH
+
+
+def line(account, amount):
+    """ Build a journal line; positive amounts are debits, negative amounts credits. """
+    code, name = account
+    amount = round(amount, 2)
+    return {
+        "account_code": code,
+        "account_name": name,
+        "debit": amount if amount > 0 else 0.0,
+        "credit": -amount if amount < 0 else 0.0,
+    }
+
+
+def post_entry(doc_type, doc_no, lines, date=None, description=None, sale_id=None, purchase_id=None):
+    """ Add a balanced journal entry to the session and return it; the caller commits.
+
+    A document whose lines are all zero (a slip whose meter did not move,
+    paid nothing) moves no money, so nothing is posted and None is returned.
+    """
+    lines = [l for l in lines if l["debit"] or l["credit"]]
+    if not lines:
+        return None
+
+    total_debit = round(sum(l["debit"] for l in lines), 2)
+    total_credit = round(sum(l["credit"] for l in lines), 2)
+    if abs(total_debit - total_credit) >= 0.005:
+        raise JournalError(f"{doc_type} {doc_no} does not balance: debit {total_debit} != credit {total_credit}")
+
+    if get_entry(doc_type, doc_no) is not None:
+        raise JournalError(f"{doc_type} {doc_no} has already been posted")
+
+    date = date or datetime.utcnow()
+    _ensure_open(date)
+    entry = JournalEntry(
+        doc_type=doc_type,
+        doc_no=doc_no,
+        date=date,
+        description=description,
+        total=total_debit,
+        sale_id=sale_id,
+        purchase_id=purchase_id,
+    )
+    for l in lines:
+        entry.lines.append(JournalLine(entry_date=date, customer_id=customer_id_for(l["account_code"]), **l))
+    db.session.add(entry)
+    return entry
+
+
+def _ensure_open(date):
+    try:
+        ensure_open(date)
+    except PeriodError as e:
+        raise JournalError(str(e))
+
+
+def get_entry(doc_type, doc_no):
+    return JournalEntry.query.filter_by(doc_type=doc_type, doc_no=doc_no).first()
+
+
+def entry_total(doc_type, doc_no):
+    """ What the document moved, from its journal entry; 0 when it moved nothing and has none. """
+    entry = get_entry(doc_type, doc_no)
+    return entry.total if entry is not None else 0.0
+
+
+def remove_entry(doc_type, doc_no):
+    entry = get_entry(doc_type, doc_no)
+    if entry is not None:
+        _ensure_open(entry.date)
+        db.session.delete(entry)
+        db.session.flush()
+    return entry
+
+
+# ---------------------- Document postings ----------------------
+
+def post_sale(slip_no, customer, sales, cash, is_online=False, description=None, date=None):
+    """ Invoice the customer for the slip and record whatever was paid up front.
+
+    The customer account is debited with the full amount and credited with
+    the payment, so its balance is the outstanding credit on the slip.
+    """
+    total = sum(s.net_amount for s in sales)
+    paid = min(cash, total)
+    return post_entry('sale', slip_no, [
+        line(customer_account(customer), total),
+        line(SALES, -total),
+        line(cash_account(is_online), paid),
+        line(customer_account(customer), -paid),
+    ], date=date, description=description, sale_id=sales[0].id)
+
+
+def post_purchase(purchase, supplier):
+    return post_entry('purchase', purchase.bill_no, [
+        line(PURCHASES, purchase.net_amount),
+        line(DISCOUNT_RECEIVED, -(purchase.discount or 0.0)),
+        line(cash_account('in hand'), -(purchase.payment or 0.0)),
+        line(supplier_account(supplier), -purchase.balance),
+    ], date=purchase.date, description=purchase.description, purchase_id=purchase.id)
+
+
+def post_supplier_payment(payment_no, supplier, amount, mode='in hand', description=None):
+    return post_entry('supplier_payment', payment_no, [
+        line(supplier_account(supplier), amount),
+        line(cash_account(mode), -amount),
+    ], description=description)
+
+
+def post_credit_voucher(voucher_no, cr_account, vouchers, description=None, date=None):
+    total = sum(v.debit for v in vouchers)
+    lines = [line((v.account_code, v.account_name), v.debit) for v in vouchers]
+    lines.append(line(cash_account(cr_account), -total))
+    return post_entry('credit_voucher', voucher_no, lines, date=date, description=description)
+
+
+def post_debit_voucher(voucher_no, db_account, vouchers, description=None, date=None):
+    total = sum(v.credit for v in vouchers)
+    lines = [line((v.account_code, v.account_name), -v.credit) for v in vouchers]
+    lines.append(line(cash_account(db_account), total))
+    return post_entry('debit_voucher', voucher_no, lines, date=date, description=description)
+
+
+# ---------------------- Re-posting after deletes ----------------------
+
+def repost_sale(slip_no, customer):
+    """ Rebuild a slip's entry from the sale lines that are left. """
+    entry = get_entry('sale', slip_no)
+    is_online = entry is not None and any(l.account_code == BANK[0] for l in entry.lines)
+    remove_entry('sale', slip_no)
+    sales = Sale.query.filter_by(slip_no=slip_no).order_by(Sale.id).all()
+    if sales:
+        post_sale(slip_no, customer, sales, sales[0].cash, is_online,
+                  description=entry.description if entry else None,
+                  date=entry.date if entry else None)
+
+
+def repost_credit_voucher(voucher_no):
+    entry = remove_entry('credit_voucher', voucher_no)
+    vouchers = CreditVoucher.query.filter_by(voucher_no=voucher_no).all()
+    if vouchers:
+        post_credit_voucher(voucher_no, vouchers[0].cr_account, vouchers, vouchers[0].description,
+                            date=entry.date if entry else None)
+
+
+def repost_debit_voucher(voucher_no):
+    entry = remove_entry('debit_voucher', voucher_no)
+    vouchers = DebitVoucher.query.filter_by(voucher_no=voucher_no).all()
+    if vouchers:
+        post_debit_voucher(voucher_no, vouchers[0].db_account, vouchers, vouchers[0].description,
+                           date=entry.date if entry else None)
+
+
+# ---------------------- Posting existing documents ----------------------
+
+def _posted(doc_type):
+    return {doc_no for (doc_no,) in db.session.query(JournalEntry.doc_no).filter(JournalEntry.doc_type == doc_type)}
+
+
+def _post_missing(doc_type, documents, post):
+    """ post(doc_no, rows) for every document without an entry; returns (posted, skipped). """
+    posted, skipped, done = 0, 0, _posted(doc_type)
+    for doc_no, rows in documents.items():
+        if doc_no in done:
+            continue
+        try:
+            if doc_no is None:
+                raise JournalError(f"{doc_type} without a number")
+            if post(doc_no, rows) is not None:
+                posted += 1
+        except JournalError:
+            # Unnumbered, unbalanced or dated in a closed period
+            skipped += len(rows) if doc_no is None else 1
+    return posted, skipped
+
+
+def _drop_damaged():
+    """ Delete lines left without their entry, and entries of documents whose lines no longer match them.
+
+    Entries deleted before their lines were deleted with them left the lines
+    behind, and SQLite could hand the entry id out again, adding those lines
+    to an unrelated entry. Supplier payments have no document to post them
+    from again, so they are left alone.
+    """
+    orphans = JournalLine.query.filter(~JournalLine.entry_id.in_(db.session.query(JournalEntry.id)))
+    orphans.delete(synchronize_session='fetch')
+    damaged = db.session.query(JournalEntry.id).join(JournalLine, JournalLine.entry_id == JournalEntry.id) \
+        .filter(JournalEntry.doc_type != 'supplier_payment', JournalEntry.date >= _open_from()) \
+        .group_by(JournalEntry.id, JournalEntry.total) \
+        .having((func.abs(func.sum(JournalLine.debit) - JournalEntry.total) >= 0.005)
+                | (func.abs(func.sum(JournalLine.credit) - JournalEntry.total) >= 0.005))
+    for entry in JournalEntry.query.filter(JournalEntry.id.in_([entry_id for (entry_id,) in damaged])):
+        db.session.delete(entry)
+    db.session.flush()
+
+
+def _open_from():
+    """ Start of the books still open: entries before it belong to closed periods and stay as they are. """
+    period = latest_period()
+    return period.end_date if period is not None else datetime.min
+
+
+def rebuild():
+    """ Post every sale slip, purchase and voucher that has no journal entry yet, archived ones included.
+
+    For data entered before the journal existed; safe to run again. Entries
+    in open periods whose lines were mixed up by deletes are posted again.
+    Documents that cannot be posted (dated in a closed period, purchases
+    without a bill number) are skipped. Returns (posted, skipped); the caller
+    commits.
+    """
+    _drop_damaged()
+    slips = {}
+    for sale in archive.find_all(Sale, lambda m: m.id.isnot(None)):
+        slips.setdefault(sale.slip_no, []).append(sale)
+
+    def post_slip(slip_no, sales):
+        archived = isinstance(sales[0], ArchivedSale)
+        amounts, credits = (ArchivedAmount, ArchivedCreditSale) if archived else (Amount, CreditSale)
+        ids = [s.id for s in sales]
+        amount = amounts.query.filter(amounts.sale_id.in_(ids)).first()
+        credit = credits.query.filter(credits.sale_id.in_(ids)).first()
+        entry = post_sale(slip_no, Customer.query.get(sales[0].customer_id), sales, sales[0].cash or 0.0,
+                          bool(amount and amount.is_online), description=credit.description if credit else None,
+                          date=sales[0].date)
+        if archived and entry is not None:
+            entry.sale_id = None  # the sale row is not in the hot table any more
+        return entry
+
+    def post_bill(bill_no, purchases):
+        purchase = purchases[0]
+        entry = post_purchase(purchase, Supplier.query.get(purchase.supplier_id))
+        if not isinstance(purchase, Purchase) and entry is not None:
+            entry.purchase_id = None
+        return entry
+
+    bills = {}
+    for purchase in archive.find_all(Purchase, lambda m: m.id.isnot(None)):
+        bills.setdefault(purchase.bill_no, []).append(purchase)
+
+    vouchers = {}
+    for kind, model in (('credit_voucher', CreditVoucher), ('debit_voucher', DebitVoucher)):
+        for voucher in model.query.order_by(model.id):
+            vouchers.setdefault(kind, {}).setdefault(voucher.voucher_no, []).append(voucher)
+
+    results = [
+        _post_missing('sale', slips, post_slip),
+        _post_missing('purchase', bills, post_bill),
+        _post_missing('credit_voucher', vouchers.get('credit_voucher', {}), lambda no, rows: post_credit_voucher(
+            no, rows[0].cr_account, rows, rows[0].description, date=rows[0].date)),
+        _post_missing('debit_voucher', vouchers.get('debit_voucher', {}), lambda no, rows: post_debit_voucher(
+            no, rows[0].db_account, rows, rows[0].description, date=rows[0].date)),
+    ]
+    return sum(r[0] for r in results), sum(r[1] for r in results)
@@ -0,0 +1,185 @@
+from datetime import datetime
+
+from sqlalchemy import func
+
+from . import db, archive, journal
+from .models import ArchivedSale, CreditVoucher, DebitVoucher, Item, KpiCounter, Purchase, Sale
+
+# KpiCounter.period of running balances, as opposed to a day's figures
+TOTAL = 'total'
+
+
+def _period(date=None):
+    return (date or datetime.utcnow()).date().isoformat()
+
+
+def _add(period, name, amount, key=''):
+    if not amount:
+        return
+    row = KpiCounter.query.get((period, name, str(key)))
+    if row is None:
+        row = KpiCounter(period=period, name=name, key=str(key), value=0.0)
+        db.session.add(row)
+    row.value = round(row.value + amount, 3)
+
+
+def _credit_from_scratch():
+    """ Outstanding customer credit from the documents, only used to seed the counter.
+
+    Credit left on every slip (archived ones included), plus customer accounts
+    debited on credit vouchers, less those credited on debit vouchers.
+    """
+    credit = 0.0
+    for model in (Sale, ArchivedSale):
+        for total, cash in db.session.query(func.sum(model.net_amount), func.max(model.cash)).group_by(model.slip_no):
+            credit += total - min(cash or 0.0, total)
+    for model, amount, sign in ((CreditVoucher, CreditVoucher.debit, 1), (DebitVoucher, DebitVoucher.credit, -1)):
+        for code, total in db.session.query(model.account_code, func.sum(amount)).group_by(model.account_code):
+            if journal.customer_id_for(code) is not None:
+                credit += sign * total
+    return credit
+
+
+def _outstanding(delta):
+    """ Move the outstanding credit by `delta`, the net change of one posting or delete.
+
+    Call it once per request, after the documents are added or deleted: the
+    first time, the counter is seeded from them, which by then includes `delta`.
+    """
+    row = KpiCounter.query.get((TOTAL, 'outstanding_credit', ''))
+    if row is None:
+        db.session.flush()
+        db.session.add(KpiCounter(period=TOTAL, name='outstanding_credit', key='',
+                                  value=round(_credit_from_scratch(), 3)))
+    else:
+        row.value = round(row.value + delta, 3)
+
+
+def paid_online(slip_no):
+    """ Whether the slip was paid through the bank, from its journal entry (its Amount row may be deleted). """
+    entry = journal.get_entry('sale', slip_no)
+    return entry is not None and any(line.account_code == journal.BANK[0] for line in entry.lines)
+
+
+def _slip(sales, cash, online, sign=1):
+    """ Add (sign=1) or take back (sign=-1) one slip on its day's figures; returns the change in credit.
+
+    Split like the journal posting: the payment covers at most the slip
+    total, the rest is credit.
+    """
+    if not sales:
+        return 0.0
+    day = _period(sales[0].date)
+    total = sum(s.net_amount for s in sales)
+    paid = min(cash or 0.0, total)
+    _add(day, 'slips', sign)
+    _add(day, 'online' if online else 'cash', sign * paid)
+    _add(day, 'credit', sign * (total - paid))
+    for s in sales:
+        _add(day, 'litres', sign * s.qty, s.item_id)
+        _add(day, 'revenue', sign * s.net_amount, s.item_id)
+    return sign * (total - paid)
+
+
+def _purchase(purchase, sign=1):
+    day = _period(purchase.date)
+    _add(day, 'purchased_litres', sign * purchase.qty, purchase.item_id)
+    _add(day, 'purchases', sign * (purchase.net_amount - (purchase.discount or 0.0)))
+
+
+def _vouchers(kind, vouchers, sign=1):
+    """ Cash paid out (credit vouchers) or received (debit vouchers); returns the change in customer credit. """
+    delta = 0.0
+    for v in vouchers:
+        amount = sign * (v.debit if kind == 'credit' else v.credit)
+        day = _period(v.date)
+        _add(day, 'paid_out' if kind == 'credit' else 'received', amount)
+        if journal.customer_id_for(v.account_code) is not None:
+            if kind == 'debit':
+                _add(day, 'credit_received', amount)
+            # Debiting a customer account adds to what they owe, crediting it settles it
+            delta += amount if kind == 'credit' else -amount
+    return delta
+
+
+# ---------------------- Posting hooks (same transaction, before the commit) ----------------------
+
+def add_slip(sales, cash, online):
+    """ A new slip, after its lines are flushed and its journal entry posted. """
+    _outstanding(_slip(sales, cash, online))
+
+
+def remove_sale(sale, lines, cash, online):
+    """ `sale` was deleted from the slip made of `lines` (all of them, as they were before the delete). """
+    delta = _slip(lines, cash, online, sign=-1)
+    delta += _slip([s for s in lines if s.id != sale.id], cash, online)
+    _outstanding(delta)
+
+
+def add_purchase(purchase, sign=1):
+    _purchase(purchase, sign)
+
+
+def add_vouchers(kind, vouchers, sign=1):
+    """ Credit ("credit") or debit ("debit") voucher lines posted (sign=1) or deleted (sign=-1). """
+    _outstanding(_vouchers(kind, vouchers, sign))
+
+
+# ---------------------- Reading ----------------------
+
+def dashboard(day=None):
+    """ The day's figures (default today) and the running balances, straight from the counters. """
+    period = _period(day)
+    figures, items = {}, {}
+    for row in KpiCounter.query.filter(KpiCounter.period.in_((period, TOTAL))):
+        if row.key:
+            items.setdefault(int(row.key), {})[row.name] = row.value
+        else:
+            figures[row.name] = row.value
+
+    # Items are looked up separately: with station databases they live elsewhere
+    names = dict(db.session.query(Item.id, Item.item_name).filter(Item.id.in_(items))) if items else {}
+    lines = [{
+        "item_id": item_id,
+        "item_name": names.get(item_id),
+        "litres": round(values.get('litres', 0.0), 3),
+        "revenue": round(values.get('revenue', 0.0), 2),
+        "purchased_litres": round(values.get('purchased_litres', 0.0), 3),
+    } for item_id, values in sorted(items.items())]
+
+    def money(name):
+        return round(figures.get(name, 0.0), 2)
+
+    return {
+        "date": period,
+        "slips": int(figures.get('slips', 0)),
+        "litres": round(sum(line['litres'] for line in lines), 3),
+        "revenue": round(sum(line['revenue'] for line in lines), 2),
+        "cash": money('cash'),
+        "online": money('online'),
+        "credit": money('credit'),
+        "credit_received": money('credit_received'),
+        "received": money('received'),
+        "paid_out": money('paid_out'),
+        "purchases": money('purchases'),
+        "outstanding_credit": money('outstanding_credit'),
+        "items": lines,
+    }
+
+
+def rebuild():
+    """ Recompute every counter from sales and purchases (archived ones included) and vouchers. """
+    KpiCounter.query.delete()
+    slips = {}
+    for sale in archive.find_all(Sale, lambda m: m.id.isnot(None)):
+        slips.setdefault(sale.slip_no, []).append(sale)
+    for slip_no, sales in slips.items():
+        _slip(sales, sales[0].cash, paid_online(slip_no))
+        db.session.flush()
+    for purchase in archive.find_all(Purchase, lambda m: m.id.isnot(None)):
+        _purchase(purchase)
+    _vouchers('credit', CreditVoucher.query.all())
+    _vouchers('debit', DebitVoucher.query.all())
+    db.session.flush()
+    _outstanding(0.0)
+    return len(slips)
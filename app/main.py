@@ -1,14 +1,27 @@
-from flask import Blueprint, request, jsonify
+import os
+from flask import Blueprint, Response, current_app, request, jsonify, send_file
 from flask_login import login_user, login_required, logout_user, current_user
 from flask_mail import Message
-from .models import db, User, Item, Supplier, Customer, Purchase,Sale, Amount, CreditSale, CreditVoucher, DebitVoucher
-from . import mail
-from datetime import datetime
+from .models import db, User, Item, Supplier, Customer, Purchase,Sale, Amount, CreditSale, CreditVoucher, DebitVoucher, JournalEntry, AccountingPeriod, SupplierPayable, StockAlert, Shift, TankDip, ItemCost, MeterChain, MeterReading, ReportJob, ms_to_datetime
+from . import mail, journal, accounting, payables, statements, stock, search, serialization, changelog, events, stations, archive, shifts, telemetry, admission, prices, reconciliation, costing, reports, kpis, batch as batches
+from .accounting import PeriodError
+from .archive import ArchiveError
+from .payables import PaymentError
+from .shifts import ShiftError
+from .prices import PriceError
+from .reports import ReportError
+from .telemetry import QueueFull, ReadingError
+from .events import TooManySubscribers
+from .statements import CursorError
+from .serialization import FieldError
+from .journal import JournalError
+from .sequences import allocator
+from .routing import current_station
+from .hooks import commit
+from .snapshots import snapshot_read
+from datetime import datetime, timedelta, timezone
 from flask_cors import CORS
 from sqlalchemy.exc import IntegrityError
-import time  # Add this import at the top of your file
-import random
-import string
 
 main = Blueprint('main', __name__)
 
@@ -60,23 +73,123 @@ def login():
     })
 
 
+@main.route('/admission', methods=['GET'])
+def admission_status():
+    # Counters of this worker process only
+    return jsonify(admission.status(current_app))
+
+
+# ---------------------- BATCH ----------------------
+
+@main.route('/batch', methods=['POST'])
+def batch():
+    data = request.get_json() or {}
+    try:
+        committed, results = batches.run(data.get('operations'))
+    except batches.BatchError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'committed': committed, 'results': results}), 200 if committed else 400
+
+
+# ---------------------- LIVE STREAM ----------------------
+
+@main.route('/stream', methods=['GET'])
+def stream():
+    types = request.args.get('types')
+    matches = events.event_filter(
+        types=set(types.split(',')) if types else None,
+        item_id=request.args.get('item_id', type=int),
+        cashier=request.args.get('cashier'),
+    )
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    try:
+        chunks = events.broker.subscribe(matches, last_event_id)
+    except TooManySubscribers as e:
+        return jsonify({'error': f"Too many live streams, retry later ({e})"}), 503, {'Retry-After': '5'}
+
+    response = Response(
+        chunks,
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+    response.call_on_close(events.broker.unsubscribe)
+    return response
+
+
+# ---------------------- SYNC ----------------------
+
+@main.route('/sync', methods=['GET'])
+def sync():
+    tables = request.args.get('tables')
+    tables = tables.split(',') if tables else None
+    unknown = [t for t in tables or [] if t not in changelog.SYNCED]
+    if unknown:
+        return jsonify({'error': f"Unknown table(s): {', '.join(unknown)}"}), 400
+
+    try:
+        since, station_since = changelog.parse_cursor(request.args.get('since'))
+    except ValueError:
+        return jsonify({'error': 'since must be a cursor returned by /sync'}), 400
+
+    limit = max(1, min(request.args.get('limit', 500, type=int), 5000))
+    changes, cursor, has_more = changelog.sync_page(since, station_since, limit, tables)
+    return serialization.respond({
+        'changes': changes,
+        'cursor': cursor,
+        'has_more': has_more,
+    })
+
+
+# ---------------------- SEARCH ----------------------
+
+@main.route('/search', methods=['GET'])
+# @login_required
+def search_records():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'q is required'}), 400
+
+    kinds = request.args.get('types')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    results = search.search(q, kinds.split(',') if kinds else None, limit)
+    return jsonify({'query': q, 'results': results})
+
+
 # ---------------------- ITEM CRUD ----------------------
 
+def _used_at_any_station(model, **filters):
+    """ True when any station has a `model` row, hot or archived, matching `filters`. """
+    found = stations.fan_out(lambda: archive.exists(model, **filters))
+    return any(found.values())
+
+
+def _date_range_args():
+    """ ?from=YYYY-MM-DD&to=YYYY-MM-DD as (start, end) with `end` exclusive; raises ValueError. """
+    start = accounting.parse_date(request.args.get('from'))
+    end = accounting.parse_date(request.args.get('to'))
+    return start, end + timedelta(days=1) if end else None
+
+
 @main.route('/items', methods=['POST'])
 # @login_required
 def create_item():
     data = request.get_json()
     item = Item(**data)
     db.session.add(item)
-    db.session.commit()
+    commit()
     return jsonify({'message': 'Item created', 'item': item.to_dict()}), 201
 
 
 @main.route('/items', methods=['GET'])
 # @login_required
 def get_items():
-    items = Item.query.all()
-    return jsonify([item.to_dict() for item in items])
+    try:
+        columns = serialization.columns_for(Item, request.args.get('fields'))
+    except FieldError as e:
+        return jsonify({'error': str(e)}), 400
+    return serialization.respond(serialization.fetch_rows(columns))
 
 
 @main.route('/items/<int:item_id>', methods=['GET'])
@@ -90,9 +203,26 @@ def get_item(item_id):
 # @login_required
 def update_item(item_id):
     item = Item.query.get_or_404(item_id)
-    for key, value in request.json.items():
+    old_opening_stock = item.opening_stock or 0.0
+    data = dict(request.json)
+    if data.get('opening_stock', item.opening_stock) != item.opening_stock and not stock.holds_opening_stock():
+        return jsonify({'error': f"Opening stock belongs to station {current_app.config['STATION_CODE']}"}), 400
+    # A new sale rate starts now and is kept in the price history
+    if 'sale_rate' in data:
+        try:
+            sale_rate = float(data.pop('sale_rate'))
+        except (TypeError, ValueError):
+            return jsonify({'error': f"sale_rate for item {item.id} must be numeric"}), 400
+        if sale_rate != item.sale_rate:
+            try:
+                prices.record(item, sale_rate)
+            except PriceError as e:
+                return jsonify({'error': str(e)}), 400
+    for key, value in data.items():
         setattr(item, key, value)
-    db.session.commit()
+    if 'opening_stock' in data or 'minimum_level' in data:
+        stock.apply_movement(item, (item.opening_stock or 0.0) - old_opening_stock)
+    commit()
     return jsonify({'message': 'Item updated', 'item': item.to_dict()})
 
 
@@ -102,23 +232,69 @@ def delete_item(item_id):
     if not item:
         return jsonify({"error": "Item not found"}), 404
 
-    # Check if the item is associated with any purchases
-    if Purchase.query.filter_by(item_id=item.id).count() > 0:
+    # Check if the item is associated with any purchases (at any station)
+    if _used_at_any_station(Purchase, item_id=item.id):
         return jsonify({"error": "Cannot delete item, it is associated with purchases"}), 400
     
     # Check if the item is associated with any sales
-    if Sale.query.filter_by(item_id=item.id).count() > 0:
+    if _used_at_any_station(Sale, item_id=item.id):
         return jsonify({"error": "Cannot delete item, it is associated with sales"}), 400
 
     try:
         db.session.delete(item)
-        db.session.commit()
+        commit()
         return jsonify({"message": "Item deleted successfully"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 
+@main.route('/items/<int:item_id>/prices', methods=['GET'])
+def get_item_prices(item_id):
+    item = Item.query.get_or_404(item_id)
+    if request.args.get('at'):
+        try:
+            at = prices.parse_time(request.args['at'])
+        except ValueError:
+            return jsonify({'error': 'at must be an ISO date or timestamp'}), 400
+        return jsonify({'item_id': item.id, 'at': at.isoformat(), 'sale_rate': prices.rate_at(item, at)})
+    return jsonify([p.to_dict() for p in prices.history(item.id)])
+
+
+@main.route('/prices', methods=['POST'])
+def change_prices():
+    data = request.get_json() or {}
+    try:
+        effective_from = prices.parse_time(data['effective_from']) if data.get('effective_from') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'effective_from must be an ISO timestamp'}), 400
+
+    try:
+        recorded = prices.bulk_change(data.get('prices'), effective_from, data.get('note'))
+    except PriceError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    commit()
+    return jsonify({'message': 'Prices recorded', 'prices': [p.to_dict() for p in recorded]}), 201
+
+
+@main.route('/items/low-stock', methods=['GET'])
+# @login_required
+def get_low_stock_items():
+    return jsonify([
+        dict(item.to_dict(), stock_qty=qty) for item, qty in stock.low_stock()
+    ])
+
+
+@main.route('/alerts', methods=['GET'])
+def get_stock_alerts():
+    query = StockAlert.query
+    if request.args.get('status') == 'open':
+        query = query.filter(StockAlert.resolved_at.is_(None))
+    alerts = query.order_by(StockAlert.created_at.desc()).limit(request.args.get('limit', 100, type=int)).all()
+    return jsonify([a.to_dict() for a in alerts])
+
+
 # ---------------------- SUPPLIER CRUD ----------------------
 
 @main.route('/suppliers', methods=['POST'])
@@ -126,15 +302,18 @@ def delete_item(item_id):
 def create_supplier():
     supplier = Supplier(**request.get_json())
     db.session.add(supplier)
-    db.session.commit()
+    commit()
     return jsonify({'message': 'Supplier created', 'supplier': supplier.to_dict()}), 201
 
 
 @main.route('/suppliers', methods=['GET'])
 # @login_required
 def get_suppliers():
-    suppliers = Supplier.query.all()
-    return jsonify([supplier.to_dict() for supplier in suppliers])
+    try:
+        columns = serialization.columns_for(Supplier, request.args.get('fields'))
+    except FieldError as e:
+        return jsonify({'error': str(e)}), 400
+    return serialization.respond(serialization.fetch_rows(columns))
 
 
 @main.route('/suppliers/<int:supplier_id>', methods=['GET'])
@@ -150,7 +329,7 @@ def update_supplier(supplier_id):
     supplier = Supplier.query.get_or_404(supplier_id)
     for k, v in request.json.items():
         setattr(supplier, k, v)
-    db.session.commit()
+    commit()
     return jsonify({'message': 'Supplier updated', 'supplier': supplier.to_dict()})
 
 
@@ -159,12 +338,12 @@ def delete_supplier(supplier_id):
     supplier = Supplier.query.get_or_404(supplier_id)
 
     # Check if the supplier is associated with any purchases
-    if Purchase.query.filter_by(supplier_id=supplier.id).count() > 0:
+    if _used_at_any_station(Purchase, supplier_id=supplier.id):
         return jsonify({'error': 'Cannot delete supplier, it is associated with one or more purchases.'}), 400
 
     try:
         db.session.delete(supplier)
-        db.session.commit()
+        commit()
         return jsonify({'message': 'Supplier deleted'}), 200
     except Exception as e:
         db.session.rollback()
@@ -177,15 +356,18 @@ def delete_supplier(supplier_id):
 def create_customer():
     customer = Customer(**request.get_json())
     db.session.add(customer)
-    db.session.commit()
+    commit()
     return jsonify({'message': 'Customer created', 'customer': customer.to_dict()}), 201
 
 
 @main.route('/customers', methods=['GET'])
 # @login_required
 def get_customers():
-    customers = Customer.query.all()
-    return jsonify([customer.to_dict() for customer in customers])
+    try:
+        columns = serialization.columns_for(Customer, request.args.get('fields'))
+    except FieldError as e:
+        return jsonify({'error': str(e)}), 400
+    return serialization.respond(serialization.fetch_rows(columns))
 
 
 @main.route('/customers/<int:customer_id>', methods=['GET'])
@@ -201,7 +383,7 @@ def update_customer(customer_id):
     customer = Customer.query.get_or_404(customer_id)
     for k, v in request.json.items():
         setattr(customer, k, v)
-    db.session.commit()
+    commit()
     return jsonify({'message': 'Customer updated', 'customer': customer.to_dict()})
 
 
@@ -211,29 +393,51 @@ def delete_customer(customer_id):
     customer = Customer.query.get_or_404(customer_id)
 
     # Check if the customer is associated with any sales
-    sale_count = Sale.query.filter_by(customer_id=customer.id).count()
-
-    if sale_count > 0:
+    if _used_at_any_station(Sale, customer_id=customer.id):
         return jsonify({
             'error': 'Cannot delete customer, they are associated with purchases or sales'
         }), 400
 
     try:
         db.session.delete(customer)
-        db.session.commit()
+        commit()
         return jsonify({'message': 'Customer deleted'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
-def generate_bill_no(item_name):
-    """ Generate a unique bill number by appending a timestamp or random string to avoid collisions. """
-    import random
-    import string
-    timestamp = str(int(time.time()))
-    random_suffix = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f"{item_name[:3].upper()}_{timestamp}_{random_suffix}"
+@main.route('/customers/<int:customer_id>/statement', methods=['GET'])
+@snapshot_read
+# @login_required
+def get_customer_statement(customer_id):
+    customer = Customer.query.get_or_404(customer_id)
+
+    try:
+        start = accounting.parse_date(request.args.get('from'))
+        end = accounting.parse_date(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD'}), 400
+    if end:
+        end += timedelta(days=1)
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+
+    try:
+        carried, lines, next_cursor = statements.statement_page(
+            customer, start, end, request.args.get('cursor'), limit)
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'customer_id': customer.id,
+        'customer_name': customer.name,
+        'from': request.args.get('from'),
+        'to': request.args.get('to'),
+        'opening_balance': carried,
+        'lines': lines,
+        'closing_balance': lines[-1]['balance'] if lines else carried,
+        'next_cursor': next_cursor,
+    })
 
 
 @main.route('/purchases', methods=['POST'])
@@ -249,8 +453,12 @@ def create_purchase():
         return jsonify({'error': 'Invalid supplier name'}), 400
 
     purchases = []
+    purchase_records = []
 
-    for item_data in data['items']:
+    # Reserve one bill number per line before anything is written
+    bill_nos = allocator.next_numbers('bill', len(data['items']))
+
+    for item_data, bill_no in zip(data['items'], bill_nos):
         if not all(k in item_data for k in ['item_name', 'qty']):
             return jsonify({'error': 'Each item must have item_name and qty'}), 400
 
@@ -273,15 +481,6 @@ def create_purchase():
         discount = net_amount * (discount_percent / 100)
         balance = net_amount - discount - payment
 
-        # Generate a unique bill_no
-        bill_no = generate_bill_no(item.item_name)
-        
-        # Check if the generated bill_no already exists
-        existing_purchase = Purchase.query.filter_by(bill_no=bill_no).first()
-        if existing_purchase:
-            # If the bill_no already exists, regenerate the bill_no
-            bill_no = generate_bill_no(item.item_name)
-
         purchase = Purchase(
             purchase_no=data['purchase_no'],
             bill_no=bill_no,
@@ -299,9 +498,21 @@ def create_purchase():
         )
 
         db.session.add(purchase)
+        db.session.flush()
+        try:
+            journal.post_purchase(purchase, supplier)
+        except JournalError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        payables.add_purchase(purchase)
+        stock.apply_movement(item, qty)
+        costing.add_purchase(purchase)
+        kpis.add_purchase(purchase)
         purchases.append({'item_name': item.item_name, 'bill_no': bill_no})
+        purchase_records.append(purchase)
 
-    db.session.commit()
+    events.publish_after_commit('purchase', events.purchase_event(data['purchase_no'], supplier, purchase_records))
+    commit()
 
     return jsonify({'message': 'Purchase(s) added', 'purchases': purchases})
 
@@ -311,7 +522,19 @@ def create_purchase():
 
 @main.route('/purchases', methods=['GET'])
 def get_all_purchases():
-    purchases = Purchase.query.all()
+    try:
+        start, end = _date_range_args()
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD'}), 400
+
+    if request.args.get('fields'):
+        try:
+            columns = serialization.columns_for(Purchase, request.args.get('fields'))
+        except FieldError as e:
+            return jsonify({'error': str(e)}), 400
+        return serialization.respond(archive.fetch_rows(Purchase, columns, start, end))
+
+    purchases = archive.query_range(Purchase, start, end, load=('supplier', 'item'))
     result = []
     for p in purchases:
         # Check if the supplier exists
@@ -338,10 +561,12 @@ def get_all_purchases():
 
 @main.route('/purchases/<int:id>', methods=['GET'])
 def get_purchase(id):
-    purchase = Purchase.query.get_or_404(id)
+    purchase = archive.get(Purchase, id)
+    if not purchase:
+        return jsonify({'error': 'Purchase not found'}), 404
 
-    # All line items with the same purchase_no
-    related_items = Purchase.query.filter_by(purchase_no=purchase.purchase_no).all()
+    # All line items with the same purchase_no, including archived ones
+    related_items = archive.find_all(Purchase, lambda m: m.purchase_no == purchase.purchase_no)
 
     if not related_items:
         return jsonify({'error': 'No items found for this purchase number'}), 404
@@ -364,7 +589,7 @@ def get_purchase(id):
             'description': related_item.description or ''
         })
 
-    return jsonify({
+    return serialization.respond({
         'purchase_id': purchase.id,
         'purchase_no': purchase.purchase_no,
         'bill_no': purchase.bill_no,
@@ -379,12 +604,24 @@ def get_purchase(id):
         'items': items_details
     })
 
-@main.route('/purchases', methods=['DELETE'])
+@main.route('/purchases/<int:id>', methods=['DELETE'])
 # @login_required
 def delete_purchase(id):
     purchase = Purchase.query.get_or_404(id)
+    try:
+        journal.remove_entry('purchase', purchase.bill_no)
+    except JournalError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    payables.remove_purchase(purchase)
+    item = purchase.item
     db.session.delete(purchase)
-    db.session.commit()
+    db.session.flush()
+    if item:
+        stock.apply_movement(item, -purchase.qty)
+    costing.remove(purchase.item_id, purchase.date)
+    kpis.add_purchase(purchase, sign=-1)
+    commit()
     return jsonify({'message': 'Purchase deleted'})
 
 
@@ -404,6 +641,17 @@ def create_sale():
 
     sale_records = []
 
+    # The cashier's open shift, if they opened one, accumulates the slip
+    try:
+        shift = shifts.for_sale(data['cashier'], data.get('nozzle'), data.get('shift_id'))
+    except ShiftError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Slip numbers only ever come from the allocator, so they cannot collide
+    slip_no = allocator.next_number('slip')
+    # Every line is priced at the rate in force when the slip is posted
+    posted_at = datetime.utcnow()
+
     # Iterate over each item in the request
     for item_data in data['items']:
         item = Item.query.get(item_data['item_id'])
@@ -411,36 +659,46 @@ def create_sale():
             return jsonify({"error": f"Item with ID {item_data['item_id']} not found"}), 404
 
         previous = item_data['previous_reading']
-        current = item_data['current_reading']
+        current = item_data.get('current_reading')
+        if current is None:
+            # Pumps streaming their meter (POST /telemetry/readings) can leave the closing reading out
+            current = telemetry.latest_reading(item.id, item_data.get('nozzle') or data.get('nozzle'))
+            if current is None:
+                return jsonify({"error": f"current_reading is required for item {item.id}"}), 400
         qty = current - previous
-        net_amount = qty * item.sale_rate
+        unit_rate = prices.rate_at(item, posted_at)
+        net_amount = qty * unit_rate
         balance = net_amount - data['cash']  # Remaining balance after cash is paid
 
         # Create a Sale entry for each item
         sale = Sale(
-            slip_no=data['slip_no'],
+            slip_no=slip_no,
+            date=posted_at,
             salesperson=data['salesperson'],
             cashier=data['cashier'],
+            shift_id=shift.id if shift else None,
             customer_id=customer.id,
             item_id=item.id,
             previous_reading=previous,
             current_reading=current,
             qty=qty,
-            unit_rate=item.sale_rate,
+            unit_rate=unit_rate,
             net_amount=net_amount,
             cash=data['cash'],
             balance=balance
         )
         db.session.add(sale)
         sale_records.append(sale)
+        stock.apply_movement(item, -qty)
 
         # Accumulate totals
         total_qty += qty
         total_net_amount += net_amount
         total_balance += balance
 
-    # Commit all the Sale records
-    db.session.commit()
+    # Flush to get the Sale ids; everything below commits together
+    db.session.flush()
+    costing.add_sales(sale_records)
 
     # Create Amount entry for tracking payment method (assuming only one amount entry for the sale)
     amount = Amount(
@@ -451,7 +709,6 @@ def create_sale():
         account_number=data.get('account_number')
     )
     db.session.add(amount)
-    db.session.commit()
 
     # If the total net amount is greater than cash, add a credit sale entry
     if total_net_amount > total_cash:
@@ -465,30 +722,54 @@ def create_sale():
             description=credit_description
         )
         db.session.add(credit_sale)
-        db.session.commit()
 
-    return jsonify({"message": "Sale created successfully."})
+    if shift:
+        shifts.apply_slip(shift, sale_records, total_cash, shifts.payment_bank(data.get('is_online'), data.get('bank_name')))
+
+    try:
+        journal.post_sale(slip_no, customer, sale_records, total_cash, data.get('is_online', False),
+                          description=data.get('credit_description'))
+    except JournalError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    kpis.add_slip(sale_records, total_cash, data.get('is_online', False))
+
+    events.publish_after_commit('sale', events.sale_event(slip_no, customer, sale_records, total_cash))
+    commit()
+
+    return jsonify({"message": "Sale created successfully.", "slip_no": slip_no})
+
+
+# Same keys as Sale.to_dict()
+SALE_LIST_FIELDS = ['id', 'slip_no', 'salesperson', 'cashier', 'customer_id', 'item_id', 'previous_reading',
+                    'current_reading', 'qty', 'unit_rate', 'net_amount', 'cash', 'balance']
 
 
 @main.route('/sales', methods=['GET'])
 def get_all_sales():
-    sales = Sale.query.all()
-    sales_data = [sale.to_dict() for sale in sales]
-    return jsonify(sales_data)
+    try:
+        columns = serialization.columns_for(Sale, request.args.get('fields'), default=SALE_LIST_FIELDS)
+        start, end = _date_range_args()
+    except FieldError as e:
+        return jsonify({'error': str(e)}), 400
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD'}), 400
+    return serialization.respond(archive.fetch_rows(Sale, columns, start, end))
 
 
 @main.route('/sales/<int:sale_id>', methods=['GET'])
 def get_sale(sale_id):
-    sale = Sale.query.get(sale_id)
+    sale = archive.get(Sale, sale_id)
     if not sale:
         return jsonify({"error": "Sale not found"}), 404
 
     slip_no = sale.slip_no
-    # Fetch all sales with the same slip_no
-    sales = Sale.query.filter_by(slip_no=slip_no).all()
+    # Fetch all sales with the same slip_no (a slip is archived as a whole)
+    sales = archive.find_all(Sale, lambda m: m.slip_no == slip_no)
     
     # Fetch the amounts for the sales with the same slip_no
-    amounts = Amount.query.join(Sale).filter(Sale.slip_no == slip_no).all()
+    sale_ids = [s.id for s in sales]
+    amounts = archive.find_all(Amount, lambda m: m.sale_id.in_(sale_ids))
 
     # Calculate totals
     total_qty = sum(s.qty for s in sales)
@@ -502,7 +783,7 @@ def get_sale(sale_id):
         "cashier": sales[0].cashier,
         "customer_id": sales[0].customer_id,
         "cash": sales[0].cash,
-        "date": sale.date,  # Assuming you have a 'date' field in your Sale model
+        "date": sale.date.isoformat() if sale.date else None,
         "items": [
             {
                 "item_id": s.item_id,
@@ -520,7 +801,7 @@ def get_sale(sale_id):
                 "cash_in_hand": a.cash_in_hand,
                 "bank_name": a.bank_name,
                 "account_number": a.account_number,
-                "timestamp": a.timestamp
+                "timestamp": a.timestamp.isoformat() if a.timestamp else None
             }
             for a in amounts
         ],
@@ -529,7 +810,7 @@ def get_sale(sale_id):
         "total_balance": total_balance
     }
 
-    return jsonify(response)
+    return serialization.respond(response)
 
 
 
@@ -539,12 +820,38 @@ def delete_sale(sale_id):
     if not sale:
         return jsonify({"error": "Sale not found"}), 404
 
+    shift = Shift.query.get(sale.shift_id) if sale.shift_id else None
+    try:
+        shifts.ensure_open(shift)
+    except ShiftError as e:
+        return jsonify({"error": str(e)}), 400
+    if shift:
+        # Take the whole slip off the shift, then put back the lines that are left
+        slip = Sale.query.filter_by(slip_no=sale.slip_no, shift_id=shift.id).order_by(Sale.id).all()
+        bank = shifts.slip_bank(slip)
+        shifts.apply_slip(shift, slip, sale.cash, bank, sign=-1)
+    # The dashboard counters swap the whole slip for the lines that are left, once the journal is reposted
+    lines = Sale.query.filter_by(slip_no=sale.slip_no).order_by(Sale.id).all()
+    online = kpis.paid_online(sale.slip_no)
+
     # Optional: Delete related Amount and CreditSale records if needed
-    Amount.query.filter_by(sale_id=sale.id).delete()
-    CreditSale.query.filter_by(sale_id=sale.id).delete()
+    # (row by row, so the change log records a tombstone for each)
+    for related in Amount.query.filter_by(sale_id=sale.id).all() + CreditSale.query.filter_by(sale_id=sale.id).all():
+        db.session.delete(related)
 
     db.session.delete(sale)
-    db.session.commit()
+    db.session.flush()
+    stock.apply_movement(Item.query.get(sale.item_id), sale.qty)
+    costing.remove(sale.item_id, sale.date)
+    if shift:
+        shifts.apply_slip(shift, [s for s in slip if s.id != sale.id], sale.cash, bank)
+    try:
+        journal.repost_sale(sale.slip_no, Customer.query.get(sale.customer_id))
+    except JournalError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    kpis.remove_sale(sale, lines, sale.cash, online)
+    commit()
     return jsonify({"message": "Sale deleted successfully."})
 
 
@@ -555,7 +862,7 @@ def delete_sale(sale_id):
 def create_voucher():
     data = request.json
 
-    voucher_no = data["voucher_no"]
+    voucher_no = allocator.next_number("voucher")
     cr_account = data["cr_account"]
     description = data.get("description")
 
@@ -577,7 +884,16 @@ def create_voucher():
         db.session.add(voucher)
         vouchers.append(voucher)
 
-    db.session.commit()
+    try:
+        journal.post_credit_voucher(voucher_no, cr_account, vouchers, description)
+    except JournalError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    kpis.add_vouchers('credit', vouchers)
+
+    events.publish_after_commit('voucher', events.voucher_event('credit', voucher_no, cr_account, sum(v.debit for v in vouchers)))
+
+    commit()
     return jsonify([v.to_dict() for v in vouchers]), 201
 
 
@@ -596,8 +912,8 @@ def get_voucher(voucher_id):
     # Fetch associated accounts using the voucher_no or another relationship method
     accounts = CreditVoucher.query.filter_by(voucher_no=voucher.voucher_no).all()
 
-    # Calculate totals (e.g., total debit from account details)
-    total_debit = sum(acc.debit for acc in accounts)
+    # The total is what the voucher posted to the books
+    total_debit = journal.entry_total('credit_voucher', voucher.voucher_no)
 
     # Prepare the response
     response = {
@@ -664,7 +980,14 @@ def delete_voucher(voucher_id):
     if not voucher:
         return jsonify({"error": "Voucher not found"}), 404
     db.session.delete(voucher)
-    db.session.commit()
+    db.session.flush()
+    try:
+        journal.repost_credit_voucher(voucher.voucher_no)
+    except JournalError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    kpis.add_vouchers('credit', [voucher], sign=-1)
+    commit()
     return jsonify({"message": "Voucher deleted"})
 
 
@@ -674,7 +997,7 @@ def delete_voucher(voucher_id):
 def create_debit_voucher():
     data = request.json
 
-    voucher_no = data["voucher_no"]
+    voucher_no = allocator.next_number("debit_voucher")
     db_account = data["db_account"]
     description = data.get("description")
 
@@ -696,7 +1019,16 @@ def create_debit_voucher():
         db.session.add(voucher)
         vouchers.append(voucher)
 
-    db.session.commit()
+    try:
+        journal.post_debit_voucher(voucher_no, db_account, vouchers, description)
+    except JournalError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    kpis.add_vouchers('debit', vouchers)
+
+    events.publish_after_commit('voucher', events.voucher_event('debit', voucher_no, db_account, sum(v.credit for v in vouchers)))
+
+    commit()
     return jsonify([v.to_dict() for v in vouchers]), 201
 
 
@@ -717,8 +1049,8 @@ def get_debit_voucher(voucher_id):
     # Fetch associated accounts using the voucher_no or another relationship method
     accounts = DebitVoucher.query.filter_by(voucher_no=voucher.voucher_no).all()
 
-    # Calculate totals (e.g., total debit from account details)
-    total_credit = sum(acc.credit for acc in accounts)
+    # The total is what the voucher posted to the books
+    total_credit = journal.entry_total('debit_voucher', voucher.voucher_no)
 
     # Prepare the response
     response = {
@@ -764,10 +1096,550 @@ def delete_debit_voucher(voucher_id):
     if not debit_voucher:
         return jsonify({"error": "Debit Voucher not found"}), 404
     db.session.delete(debit_voucher)
-    db.session.commit()
+    db.session.flush()
+    try:
+        journal.repost_debit_voucher(debit_voucher.voucher_no)
+    except JournalError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    kpis.add_vouchers('debit', [debit_voucher], sign=-1)
+    commit()
     return jsonify({"message": "Debit Voucher deleted"})
 
 
+# ---------------------- JOURNAL ----------------------
+
+@main.route('/journal', methods=['GET'])
+@snapshot_read
+def get_journal_entries():
+    query = JournalEntry.query
+    doc_type = request.args.get('doc_type')
+    if doc_type:
+        query = query.filter_by(doc_type=doc_type)
+
+    page = query.order_by(JournalEntry.date.desc(), JournalEntry.id.desc()).paginate(
+        page=request.args.get('page', 1, type=int),
+        per_page=request.args.get('per_page', 50, type=int),
+        max_per_page=500,
+        error_out=False,
+    )
+    return jsonify({
+        "entries": [entry.to_dict() for entry in page.items],
+        "page": page.page,
+        "pages": page.pages,
+        "total": page.total,
+    })
+
+
+@main.route('/journal/<int:entry_id>', methods=['GET'])
+def get_journal_entry(entry_id):
+    entry = JournalEntry.query.get(entry_id)
+    if not entry:
+        return jsonify({"error": "Journal entry not found"}), 404
+    return jsonify(entry.to_dict(with_lines=True))
+
+
+@main.route('/journal/<doc_type>/<path:doc_no>', methods=['GET'])
+def get_journal_document(doc_type, doc_no):
+    entry = journal.get_entry(doc_type, doc_no)
+    if not entry:
+        return jsonify({"error": "Document not found"}), 404
+    return jsonify(entry.to_dict(with_lines=True))
+
+
+# ---------------------- SHIFTS ----------------------
+
+@main.route('/shifts', methods=['POST'])
+def open_shift():
+    data = request.get_json() or {}
+    try:
+        opening_float = float(data.get('opening_float') or 0.0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'opening_float must be numeric'}), 400
+
+    try:
+        shift = shifts.open_shift(data.get('cashier'), data.get('nozzle'), opening_float)
+    except ShiftError as e:
+        return jsonify({'error': str(e)}), 400
+    commit()
+    return jsonify({'message': 'Shift opened', 'shift': shift.to_dict()}), 201
+
+
+@main.route('/shifts', methods=['GET'])
+def get_shifts():
+    query = Shift.query.filter(Shift.station == current_station())
+    if request.args.get('cashier'):
+        query = query.filter(Shift.cashier == request.args['cashier'])
+    if request.args.get('open') == '1':
+        query = query.filter(Shift.closed_at.is_(None))
+    return jsonify([s.to_dict() for s in query.order_by(Shift.id.desc()).limit(200)])
+
+
+@main.route('/shifts/<int:shift_id>', methods=['GET'])
+def get_shift(shift_id):
+    shift = Shift.query.get_or_404(shift_id)
+    return jsonify(shifts.report(shift))
+
+
+@main.route('/shifts/<int:shift_id>/close', methods=['POST'])
+def close_shift(shift_id):
+    shift = Shift.query.get_or_404(shift_id)
+    data = request.get_json() or {}
+    try:
+        declared_cash = float(data['declared_cash'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'declared_cash is required and must be numeric'}), 400
+
+    try:
+        shifts.close(shift, declared_cash)
+    except ShiftError as e:
+        return jsonify({'error': str(e)}), 400
+    commit()
+    return jsonify(shifts.report(shift))
+
+
+# ---------------------- PUMP TELEMETRY ----------------------
+
+@main.route('/telemetry/readings', methods=['POST'])
+def ingest_readings():
+    try:
+        readings = telemetry.parse_readings(request.get_json(silent=True))
+        telemetry.writer.submit(readings)
+    except ReadingError as e:
+        return jsonify({'error': str(e)}), 400
+    except QueueFull as e:
+        retry_after = max(1, round(current_app.config['TELEMETRY_FLUSH_INTERVAL']))
+        return jsonify({'error': f"Ingestion is behind, retry later ({e})"}), 503, {'Retry-After': str(retry_after)}
+    return jsonify({'accepted': len(readings)}), 202
+
+
+@main.route('/telemetry/status', methods=['GET'])
+def telemetry_status():
+    return jsonify(telemetry.writer.status())
+
+
+@main.route('/meters', methods=['GET'])
+def get_meters():
+    chains = MeterChain.query.order_by(MeterChain.item_id, MeterChain.nozzle).all()
+    return jsonify([c.to_dict() for c in chains])
+
+
+@main.route('/meters/<int:chain_id>/readings', methods=['GET'])
+def get_meter_readings(chain_id):
+    chain = MeterChain.query.get_or_404(chain_id)
+    try:
+        start, end = _date_range_args()
+        limit = min(int(request.args.get('limit', 1000)), 10000)
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD, limit a number'}), 400
+
+    query = db.session.query(MeterReading.taken_at, MeterReading.reading).filter(MeterReading.chain_id == chain.id)
+    if start is not None:
+        query = query.filter(MeterReading.taken_at >= start.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    if end is not None:
+        query = query.filter(MeterReading.taken_at < end.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    rows = query.order_by(MeterReading.taken_at.desc()).limit(limit).all()
+    return jsonify({
+        'meter': chain.to_dict(),
+        'readings': [{'taken_at': ms_to_datetime(t).isoformat(), 'reading': r} for t, r in reversed(rows)],
+    })
+
+
+# ---------------------- WET STOCK ----------------------
+
+@main.route('/tank-dips', methods=['POST'])
+def create_tank_dip():
+    data = request.get_json() or {}
+    try:
+        item_id, qty = int(data['item_id']), float(data['qty'])
+        date = prices.parse_time(data['date']) if data.get('date') else datetime.utcnow()
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'item_id and a numeric qty are required; date must be ISO'}), 400
+    if qty < 0:
+        return jsonify({'error': 'qty cannot be negative'}), 400
+    if not Item.query.get(item_id):
+        return jsonify({'error': f'Item {item_id} not found'}), 404
+
+    dip = TankDip(item_id=item_id, date=date, qty=qty, recorded_by=data.get('recorded_by'))
+    db.session.add(dip)
+    commit()
+    return jsonify({'message': 'Tank dip recorded', 'dip': dip.to_dict()}), 201
+
+
+@main.route('/tank-dips', methods=['GET'])
+def get_tank_dips():
+    try:
+        start, end = _date_range_args()
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD'}), 400
+
+    query = TankDip.query
+    if request.args.get('item_id'):
+        query = query.filter(TankDip.item_id == request.args.get('item_id', type=int))
+    if start is not None:
+        query = query.filter(TankDip.date >= start)
+    if end is not None:
+        query = query.filter(TankDip.date < end)
+    return jsonify([d.to_dict() for d in query.order_by(TankDip.date.desc()).limit(1000)])
+
+
+@main.route('/reconciliation', methods=['GET'])
+@snapshot_read
+def get_reconciliation():
+    try:
+        start, end = reconciliation.default_range(*_date_range_args())
+        item_ids = [int(i) for i in request.args.getlist('item_id')]
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD, item_id a number'}), 400
+    if start >= end:
+        return jsonify({'error': 'from must be before to'}), 400
+
+    items = reconciliation.reconcile(start, end, item_ids, flagged_only=request.args.get('flagged') == '1')
+    return jsonify({
+        'from': start.date().isoformat(),
+        'to': (end - timedelta(days=1)).date().isoformat(),
+        'items': items,
+    })
+
+
+# ---------------------- COSTS AND MARGINS ----------------------
+
+@main.route('/margins', methods=['GET'])
+@snapshot_read
+def get_margins():
+    group_by = [g.strip() for g in request.args.get('group', 'item').split(',') if g.strip()]
+    unknown = [g for g in group_by if g not in costing.GROUPS]
+    if not group_by or unknown:
+        return jsonify({'error': f"group must be a comma-separated list of {', '.join(costing.GROUPS)}"}), 400
+    try:
+        start, end = _date_range_args()
+        item_id = int(request.args['item_id']) if request.args.get('item_id') else None
+        customer_id = int(request.args['customer_id']) if request.args.get('customer_id') else None
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD, item_id and customer_id numbers'}), 400
+
+    rows, totals = costing.margins(start, end, group_by, item_id, customer_id)
+    return jsonify({'method': current_app.config['COSTING_METHOD'], 'rows': rows, 'total': totals})
+
+
+@main.route('/items/<int:item_id>/cost', methods=['GET'])
+def get_item_cost(item_id):
+    Item.query.get_or_404(item_id)
+    state = ItemCost.query.get(item_id)
+    method = current_app.config['COSTING_METHOD']
+    return jsonify({
+        'item_id': item_id,
+        'method': method,
+        'cost': state.to_dict() if state else None,
+        # Layers are only drawn down under FIFO
+        'layers': [layer.to_dict() for layer in costing.open_layers(item_id)] if method == 'fifo' else [],
+    })
+
+
+@main.route('/costs/rebuild', methods=['POST'])
+def rebuild_costs():
+    data = request.get_json(silent=True) or {}
+    try:
+        start = accounting.parse_date(data.get('from'))
+        item_ids = [int(data['item_id'])] if data.get('item_id') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'from must be YYYY-MM-DD and item_id a number'}), 400
+
+    count = costing.replay(item_ids, start)
+    commit()
+    return jsonify({'message': 'Costs rebuilt', 'movements': count})
+
+
+# ---------------------- DASHBOARD ----------------------
+
+@main.route('/dashboard', methods=['GET'])
+def get_dashboard():
+    try:
+        day = accounting.parse_date(request.args.get('date'))
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    return jsonify(dict(kpis.dashboard(day), station=current_station()))
+
+
+# ---------------------- REPORT JOBS ----------------------
+
+@main.route('/reports/jobs', methods=['POST'])
+def submit_report_job():
+    data = request.get_json(silent=True) or {}
+    try:
+        job, created = reports.submit(data.get('kind'), data.get('params'))
+    except ReportError as e:
+        return jsonify({'error': str(e)}), 400
+    commit()
+    return jsonify({'job': job.to_dict(), 'cached': not created}), 202 if job.status != 'done' else 200
+
+
+@main.route('/reports/jobs', methods=['GET'])
+def get_report_jobs():
+    query = ReportJob.query
+    if request.args.get('status'):
+        query = query.filter(ReportJob.status == request.args['status'])
+    return jsonify([job.to_dict() for job in query.order_by(ReportJob.id.desc()).limit(100)])
+
+
+@main.route('/reports/jobs/<int:job_id>', methods=['GET'])
+def get_report_job(job_id):
+    return jsonify(ReportJob.query.get_or_404(job_id).to_dict())
+
+
+@main.route('/reports/jobs/<int:job_id>/download', methods=['GET'])
+def download_report(job_id):
+    job = ReportJob.query.get_or_404(job_id)
+    if job.status != 'done':
+        return jsonify({'error': f"Report is {job.status}", 'job': job.to_dict()}), 409
+    if not os.path.exists(job.path):
+        return jsonify({'error': 'Report file is gone, submit the report again'}), 410
+    return send_file(job.path, mimetype='text/csv', as_attachment=True, download_name=f"{job.kind}-{job.id}.csv",
+                     etag=job.content_hash, conditional=True)
+
+
+# ---------------------- PAYABLES ----------------------
+
+@main.route('/suppliers/<int:supplier_id>/payments', methods=['POST'])
+def create_supplier_payment(supplier_id):
+    supplier = Supplier.query.get_or_404(supplier_id)
+    data = request.get_json() or {}
+
+    try:
+        amount = float(data['amount'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'amount is required and must be numeric'}), 400
+
+    payment_no = allocator.next_number('payment')
+    try:
+        applied = payables.apply_payment(supplier, amount, data.get('purchase_id'))
+        journal.post_supplier_payment(payment_no, supplier, amount, data.get('mode', 'in hand'), data.get('description'))
+    except (PaymentError, JournalError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+    commit()
+    return jsonify({
+        'message': 'Payment applied',
+        'payment_no': payment_no,
+        'applied': [{'purchase_id': p.id, 'bill_no': p.bill_no, 'amount': a, 'balance': p.balance} for p, a in applied],
+    }), 201
+
+
+@main.route('/suppliers/<int:supplier_id>/payables', methods=['GET'])
+def get_supplier_payables(supplier_id):
+    supplier = Supplier.query.get_or_404(supplier_id)
+    total = SupplierPayable.query.get(supplier.id)
+    open_purchases = Purchase.query.filter(Purchase.supplier_id == supplier.id, Purchase.balance > 0) \
+        .order_by(Purchase.date, Purchase.id).all()
+
+    return jsonify({
+        'supplier_id': supplier.id,
+        'supplier_name': supplier.name,
+        'outstanding': total.outstanding if total else 0.0,
+        'aging': (payables.aging(supplier_id=supplier.id) or [{'buckets': {}}])[0]['buckets'],
+        'open_purchases': [{
+            'id': p.id,
+            'bill_no': p.bill_no,
+            'date': p.date.isoformat(),
+            'net_amount': p.net_amount,
+            'payment': p.payment,
+            'balance': p.balance,
+        } for p in open_purchases],
+    })
+
+
+@main.route('/payables/aging', methods=['GET'])
+@snapshot_read
+def get_payables_aging():
+    try:
+        as_of = accounting.parse_date(request.args.get('as_of'))
+    except ValueError:
+        return jsonify({'error': 'as_of must be YYYY-MM-DD'}), 400
+
+    rows = payables.aging(as_of.date() if as_of else None)
+    totals = {label: round(sum(r['buckets'][label] for r in rows), 2) for label, _, _ in payables.AGING_BUCKETS}
+    return jsonify({
+        'suppliers': rows,
+        'totals': totals,
+        'total': round(sum(totals.values()), 2),
+    })
+
+
+# ---------------------- PERIODS & BALANCES ----------------------
+
+@main.route('/periods', methods=['GET'])
+def get_periods():
+    periods = AccountingPeriod.query.order_by(AccountingPeriod.end_date).all()
+    return jsonify([p.to_dict() for p in periods])
+
+
+@main.route('/periods/close', methods=['POST'])
+def close_period():
+    data = request.get_json() or {}
+    try:
+        end_date = accounting.parse_date(data.get('end_date'))
+    except ValueError:
+        return jsonify({"error": "end_date must be YYYY-MM-DD"}), 400
+    if not end_date:
+        return jsonify({"error": "end_date is required"}), 400
+
+    try:
+        period = accounting.close_period(end_date)
+    except PeriodError as e:
+        return jsonify({"error": str(e)}), 400
+
+    commit()
+    return jsonify({"message": "Period closed", "period": period.to_dict()}), 201
+
+
+def _as_of_arg():
+    """ ?as_of=YYYY-MM-DD means "up to the end of that day". """
+    as_of = accounting.parse_date(request.args.get('as_of'))
+    return as_of + timedelta(days=1) if as_of else None
+
+
+@main.route('/trial-balance', methods=['GET'])
+@snapshot_read
+def get_trial_balance():
+    try:
+        as_of = _as_of_arg()
+    except ValueError:
+        return jsonify({"error": "as_of must be YYYY-MM-DD"}), 400
+
+    return jsonify(_trial_balance(accounting.balances(as_of=as_of)))
+
+
+def _trial_balance(balances):
+    rows = []
+    for code, row in sorted(balances.items()):
+        balance = round(row["debit"] - row["credit"], 2)
+        rows.append({
+            "account_code": code,
+            "account_name": row["account_name"],
+            "debit": balance if balance > 0 else 0.0,
+            "credit": -balance if balance < 0 else 0.0,
+        })
+
+    return {
+        "accounts": rows,
+        "total_debit": round(sum(r["debit"] for r in rows), 2),
+        "total_credit": round(sum(r["credit"] for r in rows), 2),
+    }
+
+
+@main.route('/accounts/<account_code>/balance', methods=['GET'])
+@snapshot_read
+def get_account_balance(account_code):
+    try:
+        as_of = _as_of_arg()
+    except ValueError:
+        return jsonify({"error": "as_of must be YYYY-MM-DD"}), 400
+
+    row = accounting.balances(as_of=as_of, account_code=account_code).get(account_code)
+    if not row:
+        return jsonify({"error": "No postings for this account"}), 404
+
+    return jsonify({
+        "account_code": account_code,
+        "account_name": row["account_name"],
+        "debit": row["debit"],
+        "credit": row["credit"],
+        "balance": round(row["debit"] - row["credit"], 2),
+    })
+
+
+@main.route('/accounts/<account_code>/ledger', methods=['GET'])
+@snapshot_read
+def get_account_ledger(account_code):
+    try:
+        start = accounting.parse_date(request.args.get('from'))
+        end = accounting.parse_date(request.args.get('to'))
+    except ValueError:
+        return jsonify({"error": "from and to must be YYYY-MM-DD"}), 400
+    if end:
+        end += timedelta(days=1)
+
+    opening_balance, lines = accounting.ledger(account_code, start, end)
+    return jsonify({
+        "account_code": account_code,
+        "opening_balance": opening_balance,
+        "lines": lines,
+        "closing_balance": lines[-1]["balance"] if lines else opening_balance,
+    })
+
+
+# ---------------------- ARCHIVE ----------------------
+
+@main.route('/archive', methods=['GET'])
+def get_archive():
+    before = archive.archivable_before()
+    return jsonify({
+        "horizon": archive.horizon().isoformat() if archive.horizon() else None,
+        "archivable_before": before.isoformat() if before else None,
+        "runs": [run.to_dict() for run in archive.runs()],
+    })
+
+
+@main.route('/archive', methods=['POST'])
+def archive_months():
+    data = request.get_json() or {}
+    try:
+        before = accounting.parse_date(data.get('before'))
+    except ValueError:
+        return jsonify({"error": "before must be YYYY-MM-DD"}), 400
+
+    try:
+        run = archive.archive(before)
+    except ArchiveError as e:
+        return jsonify({"error": str(e)}), 400
+
+    commit()
+    return jsonify({"message": "Archived", "run": run.to_dict()}), 201
+
+
+# ---------------------- STATION ROLL-UPS ----------------------
+
+@main.route('/stations', methods=['GET'])
+def get_stations():
+    return jsonify({
+        "current": current_station(),
+        "stations": stations.codes(),
+        "partitioned": bool(current_app.config['STATION_DATABASES']),
+    })
+
+
+@main.route('/reports/stations', methods=['GET'])
+@snapshot_read
+def get_station_report():
+    try:
+        start, end = _date_range_args()
+    except ValueError:
+        return jsonify({"error": "from and to must be YYYY-MM-DD"}), 400
+
+    rows, totals = stations.rollup(start, end)
+    return jsonify({"stations": rows, "total": totals})
+
+
+@main.route('/reports/trial-balance', methods=['GET'])
+@snapshot_read
+def get_consolidated_trial_balance():
+    try:
+        as_of = _as_of_arg()
+    except ValueError:
+        return jsonify({"error": "as_of must be YYYY-MM-DD"}), 400
+
+    # Every station's books, read in parallel and added up account by account
+    combined = {}
+    for balances in stations.fan_out(lambda: accounting.balances(as_of=as_of)).values():
+        for code, row in balances.items():
+            total = combined.setdefault(code, {"account_name": row["account_name"], "debit": 0.0, "credit": 0.0})
+            total["debit"] = round(total["debit"] + row["debit"], 2)
+            total["credit"] = round(total["credit"] + row["credit"], 2)
+
+    return jsonify(_trial_balance(combined))
+
+
 @main.route('/logout', methods=['POST'])
 @login_required
 def logout():
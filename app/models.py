@@ -1,3 +1,4 @@
+import json
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from . import db, login_manager
@@ -5,6 +6,7 @@ from itsdangerous import URLSafeTimedSerializer as Serializer, BadSignature, Sig
 from flask import current_app
 from datetime import datetime,timedelta
 from sqlalchemy import Enum
+from .routing import current_station
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -70,11 +72,36 @@ class Item(db.Model):
     unit = db.Column(db.String(20))
 
     purchases = db.relationship('Purchase', backref='item', passive_deletes=True)
+    prices = db.relationship('ItemPrice', cascade='all, delete-orphan', order_by='ItemPrice.effective_from')
 
     def to_dict(self):
         return {col.name: getattr(self, col.name) for col in self.__table__.columns}
 
 
+class ItemPrice(db.Model):
+    """ Sale rate of an item from `effective_from` until the item's next price (see app/prices.py). """
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), nullable=False)
+    effective_from = db.Column(db.DateTime, nullable=False)
+    sale_rate = db.Column(db.Float, nullable=False)
+    note = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('item_id', 'effective_from', name='uq_item_price_item_effective'),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "item_id": self.item_id,
+            "effective_from": self.effective_from.isoformat(),
+            "sale_rate": self.sale_rate,
+            "note": self.note,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
 class Supplier(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -105,10 +132,13 @@ class Customer(db.Model):
         return {col.name: getattr(self, col.name) for col in self.__table__.columns}
     
 class Purchase(db.Model):
+    __station_partitioned__ = True
+
     id = db.Column(db.Integer, primary_key=True)
     purchase_no = db.Column(db.String(50), nullable=False)
     bill_no = db.Column(db.String(100), unique=True)
     date = db.Column(db.DateTime, default=datetime.utcnow)
+    station = db.Column(db.String(20), nullable=False, default=current_station)  # station that recorded the row
 
     supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id', ondelete='SET NULL'), nullable=True)
     item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='SET NULL'), nullable=True)
@@ -123,18 +153,28 @@ class Purchase(db.Model):
     payment = db.Column(db.Float, default=0.0)
     balance = db.Column(db.Float)
 
+    # Ids are never reused after rows move to the archive (see app/archive.py)
+    __table_args__ = (
+        db.Index('ix_purchase_supplier_date', 'supplier_id', 'date'),
+        {'sqlite_autoincrement': True},
+    )
+
     def to_dict(self):
         return {col.name: getattr(self, col.name) for col in self.__table__.columns}
 
 
 
 class Sale(db.Model):
+    __station_partitioned__ = True
+
     id = db.Column(db.Integer, primary_key=True)
-    slip_no = db.Column(db.String(20), nullable=False)
+    slip_no = db.Column(db.String(50), nullable=False, index=True)  # PREFIX-STATION-NUMBER, station codes up to 20
     date = db.Column(db.DateTime, default=datetime.utcnow)
+    station = db.Column(db.String(20), nullable=False, default=current_station)
 
     salesperson = db.Column(db.String(100), nullable=False)
     cashier = db.Column(db.String(100), nullable=False)
+    shift_id = db.Column(db.Integer, db.ForeignKey('shift.id'), nullable=True, index=True)
 
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
 
@@ -149,6 +189,9 @@ class Sale(db.Model):
     cash = db.Column(db.Float, nullable=False)
     balance = db.Column(db.Float, nullable=False)
 
+    # Ids are never reused after rows move to the archive (see app/archive.py)
+    __table_args__ = {'sqlite_autoincrement': True}
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -168,6 +211,8 @@ class Sale(db.Model):
 
 
 class Amount(db.Model):
+    __station_partitioned__ = True
+
     id = db.Column(db.Integer, primary_key=True)
     sale_id = db.Column(db.Integer, db.ForeignKey('sale.id'), nullable=False)
     is_online = db.Column(db.Boolean, default=False)
@@ -176,7 +221,11 @@ class Amount(db.Model):
     account_number = db.Column(db.String(100))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = {'sqlite_autoincrement': True}
+
 class CreditSale(db.Model):
+    __station_partitioned__ = True
+
     id = db.Column(db.Integer, primary_key=True)
     sale_id = db.Column(db.Integer, db.ForeignKey('sale.id'), nullable=False)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
@@ -188,10 +237,15 @@ class CreditSale(db.Model):
     customer = db.relationship("Customer", backref="credit_sales")
     sale = db.relationship("Sale", backref="credit_sales")
 
+    __table_args__ = {'sqlite_autoincrement': True}
+
 class CreditVoucher(db.Model):
+    __station_partitioned__ = True
+
     id = db.Column(db.Integer, primary_key=True)
-    voucher_no = db.Column(db.String(50), nullable=False)
+    voucher_no = db.Column(db.String(50), nullable=False, index=True)
     date = db.Column(db.DateTime, default=datetime.utcnow)
+    station = db.Column(db.String(20), nullable=False, default=current_station)
     cr_account = db.Column(db.String(50), nullable=False)  # "online" or "in hand"
     account_code = db.Column(db.String(50), nullable=False)
     account_name = db.Column(db.String(100), nullable=False)
@@ -212,9 +266,12 @@ class CreditVoucher(db.Model):
     
 
 class DebitVoucher(db.Model):
+    __station_partitioned__ = True
+
     id = db.Column(db.Integer, primary_key=True)
-    voucher_no = db.Column(db.String(50), nullable=False)
+    voucher_no = db.Column(db.String(50), nullable=False, index=True)
     date = db.Column(db.DateTime, default=datetime.utcnow)
+    station = db.Column(db.String(20), nullable=False, default=current_station)
     db_account = db.Column(db.String(50), nullable=False)  # "online" or "in hand"
     account_code = db.Column(db.String(50), nullable=False)
     account_name = db.Column(db.String(100), nullable=False)
@@ -234,3 +291,547 @@ class DebitVoucher(db.Model):
         }
     
 
+
+class DocumentSequence(db.Model):
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    doc_type = db.Column(db.String(30), nullable=False)  # "bill", "slip", "voucher", "debit_voucher"
+    station = db.Column(db.String(20), nullable=False)
+    next_hi = db.Column(db.Integer, nullable=False, default=0)  # last block handed out
+
+    __table_args__ = (
+        db.UniqueConstraint('doc_type', 'station', name='uq_document_sequence_type_station'),
+    )
+
+
+class JournalEntry(db.Model):
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    doc_type = db.Column(db.String(30), nullable=False)  # "credit_voucher", "debit_voucher", "sale", "purchase", "supplier_payment"
+    doc_no = db.Column(db.String(100), nullable=False)  # voucher_no, slip_no, bill_no or payment number
+    date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    station = db.Column(db.String(20), nullable=False, default=current_station)
+    description = db.Column(db.String(255))
+    total = db.Column(db.Float, nullable=False)  # sum of debits (== sum of credits)
+
+    sale_id = db.Column(db.Integer, db.ForeignKey('sale.id', ondelete='SET NULL'), nullable=True)
+    purchase_id = db.Column(db.Integer, db.ForeignKey('purchase.id', ondelete='SET NULL'), nullable=True)
+
+    # Lines are deleted by the ORM: SQLite does not enforce the ON DELETE CASCADE unless foreign keys are on
+    lines = db.relationship('JournalLine', backref='entry', cascade='all, delete-orphan',
+                            order_by='JournalLine.id')
+
+    __table_args__ = (
+        db.UniqueConstraint('doc_type', 'doc_no', name='uq_journal_entry_doc'),
+        db.Index('ix_journal_entry_type_date', 'doc_type', 'date'),
+        db.Index('ix_journal_entry_date', 'date'),
+    )
+
+    def to_dict(self, with_lines=False):
+        data = {
+            "id": self.id,
+            "doc_type": self.doc_type,
+            "doc_no": self.doc_no,
+            "date": self.date.isoformat(),
+            "description": self.description,
+            "total": self.total,
+            "sale_id": self.sale_id,
+            "purchase_id": self.purchase_id,
+        }
+        if with_lines:
+            data["lines"] = [line.to_dict() for line in self.lines]
+        return data
+
+
+class JournalLine(db.Model):
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, db.ForeignKey('journal_entry.id', ondelete='CASCADE'), nullable=False, index=True)
+    account_code = db.Column(db.String(50), nullable=False)
+    account_name = db.Column(db.String(100))
+    debit = db.Column(db.Float, nullable=False, default=0.0)
+    credit = db.Column(db.Float, nullable=False, default=0.0)
+    entry_date = db.Column(db.DateTime, nullable=False)  # copy of JournalEntry.date for per-account range scans
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=True)  # set on CUST-<id> lines
+
+    __table_args__ = (
+        db.Index('ix_journal_line_account_date', 'account_code', 'entry_date'),
+        db.Index('ix_journal_line_customer_date', 'customer_id', 'entry_date', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            "account_code": self.account_code,
+            "account_name": self.account_name,
+            "debit": self.debit,
+            "credit": self.credit,
+        }
+
+
+class AccountingPeriod(db.Model):
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    start_date = db.Column(db.DateTime, nullable=True)  # None for the first period
+    end_date = db.Column(db.DateTime, nullable=False, unique=True)  # exclusive; entries before it are closed
+    closed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    balances = db.relationship('AccountBalance', backref='period', cascade='all, delete-orphan')
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "start_date": self.start_date.isoformat() if self.start_date else None,
+            "end_date": self.end_date.isoformat(),
+            "closed_at": self.closed_at.isoformat() if self.closed_at else None,
+        }
+
+
+class AccountBalance(db.Model):
+    """ Cumulative debit/credit totals per account as at the end of a closed period. """
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    period_id = db.Column(db.Integer, db.ForeignKey('accounting_period.id', ondelete='CASCADE'), nullable=False)
+    account_code = db.Column(db.String(50), nullable=False)
+    account_name = db.Column(db.String(100))
+    debit = db.Column(db.Float, nullable=False, default=0.0)
+    credit = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('period_id', 'account_code', name='uq_account_balance_period_account'),
+    )
+
+
+class SupplierPayable(db.Model):
+    """ Running total of what we owe each supplier. """
+    __station_partitioned__ = True
+
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id', ondelete='CASCADE'), primary_key=True)
+    outstanding = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class SupplierPayableDay(db.Model):
+    """ Outstanding purchase balances per supplier and purchase day, used for aging. """
+    __station_partitioned__ = True
+
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    outstanding = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class StockLevel(db.Model):
+    """ Quantity on hand per item, kept current as purchases and sales are posted. """
+    __station_partitioned__ = True
+
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), primary_key=True)
+    qty = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class StockAlert(db.Model):
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), nullable=False)
+    qty = db.Column(db.Float, nullable=False)  # stock when the level was crossed
+    minimum_level = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    notified_at = db.Column(db.DateTime)
+    resolved_at = db.Column(db.DateTime)  # set once stock is back at or above the minimum
+
+    item = db.relationship('Item')
+
+    __table_args__ = (
+        db.Index('ix_stock_alert_item_resolved', 'item_id', 'resolved_at'),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "item_id": self.item_id,
+            "item_name": self.item.item_name if self.item else None,
+            "qty": self.qty,
+            "minimum_level": self.minimum_level,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "notified_at": self.notified_at.isoformat() if self.notified_at else None,
+            "resolved_at": self.resolved_at.isoformat() if self.resolved_at else None,
+        }
+
+
+class ItemCost(db.Model):
+    """ Costed stock per item: quantity and value on hand, kept current as purchases and sales are posted.
+
+    The average cost is value / qty; see app/costing.py.
+    """
+    __station_partitioned__ = True
+
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), primary_key=True)
+    qty = db.Column(db.Float, nullable=False, default=0.0)
+    value = db.Column(db.Float, nullable=False, default=0.0)
+    last_cost = db.Column(db.Float, nullable=False, default=0.0)  # unit cost of the latest purchase
+    last_date = db.Column(db.DateTime)  # latest movement costed; anything older is back-dated
+
+    @property
+    def average_cost(self):
+        return self.value / self.qty if self.qty > 0 else self.last_cost
+
+    def to_dict(self):
+        return {
+            "item_id": self.item_id,
+            "qty": round(self.qty, 3),
+            "value": round(self.value, 2),
+            "average_cost": round(self.average_cost, 4),
+            "last_cost": self.last_cost,
+            "last_date": self.last_date.isoformat() if self.last_date else None,
+        }
+
+
+class CostLayer(db.Model):
+    """ Litres bought at one unit cost; FIFO costing consumes `remaining` oldest first.
+
+    purchase_id is None for the opening stock. No foreign key: purchases may move to the archive.
+    """
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), nullable=False)
+    purchase_id = db.Column(db.Integer)
+    date = db.Column(db.DateTime, nullable=False)
+    qty = db.Column(db.Float, nullable=False)
+    remaining = db.Column(db.Float, nullable=False)
+    unit_cost = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_cost_layer_item_date', 'item_id', 'date'),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "purchase_id": self.purchase_id,
+            "date": self.date.isoformat(),
+            "qty": self.qty,
+            "remaining": round(self.remaining, 3),
+            "unit_cost": self.unit_cost,
+        }
+
+
+class SaleCost(db.Model):
+    """ Revenue and cost of goods sold of one sale line; margin reports add these up.
+
+    No foreign key to sale: lines are kept when sales move to the archive.
+    """
+    __station_partitioned__ = True
+
+    sale_id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), nullable=False)
+    customer_id = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    qty = db.Column(db.Float, nullable=False)
+    revenue = db.Column(db.Float, nullable=False)
+    cost = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_sale_cost_date', 'date'),
+        db.Index('ix_sale_cost_item_date', 'item_id', 'date'),
+    )
+
+
+class CostAllocation(db.Model):
+    """ Litres a sale line took from a FIFO layer, so the layer can be refilled when costs are rewound. """
+    __station_partitioned__ = True
+
+    sale_id = db.Column(db.Integer, primary_key=True)
+    layer_id = db.Column(db.Integer, db.ForeignKey('cost_layer.id', ondelete='CASCADE'), primary_key=True)
+    qty = db.Column(db.Float, nullable=False)
+
+
+class Shift(db.Model):
+    """ A cashier's turn at a nozzle. The totals are kept current as sales are posted (see app/shifts.py). """
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    station = db.Column(db.String(20), nullable=False, default=current_station)
+    cashier = db.Column(db.String(100), nullable=False)
+    nozzle = db.Column(db.String(20), nullable=False)
+    opened_at = db.Column(db.DateTime, default=datetime.utcnow)
+    closed_at = db.Column(db.DateTime)
+    opening_float = db.Column(db.Float, nullable=False, default=0.0)  # cash in the drawer at the start
+
+    slips = db.Column(db.Integer, nullable=False, default=0)
+    sales_total = db.Column(db.Float, nullable=False, default=0.0)
+    cash_total = db.Column(db.Float, nullable=False, default=0.0)
+    online_total = db.Column(db.Float, nullable=False, default=0.0)
+    credit_total = db.Column(db.Float, nullable=False, default=0.0)
+
+    declared_cash = db.Column(db.Float)  # counted by the cashier at close
+    variance = db.Column(db.Float)  # declared_cash - expected cash
+
+    items = db.relationship('ShiftItemTotal', cascade='all, delete-orphan', order_by='ShiftItemTotal.item_id')
+    banks = db.relationship('ShiftBankTotal', cascade='all, delete-orphan', order_by='ShiftBankTotal.bank_name')
+
+    __table_args__ = (
+        # At most one open shift per cashier and nozzle
+        db.Index('uq_shift_open', 'station', 'cashier', 'nozzle', unique=True,
+                 sqlite_where=db.text('closed_at IS NULL')),
+    )
+
+    @property
+    def expected_cash(self):
+        return round(self.opening_float + self.cash_total, 2)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "station": self.station,
+            "cashier": self.cashier,
+            "nozzle": self.nozzle,
+            "opened_at": self.opened_at.isoformat() if self.opened_at else None,
+            "closed_at": self.closed_at.isoformat() if self.closed_at else None,
+            "opening_float": self.opening_float,
+            "slips": self.slips,
+            "sales_total": self.sales_total,
+            "cash_total": self.cash_total,
+            "online_total": self.online_total,
+            "credit_total": self.credit_total,
+            "expected_cash": self.expected_cash,
+            "declared_cash": self.declared_cash,
+            "variance": self.variance,
+        }
+
+
+class ShiftItemTotal(db.Model):
+    """ Litres and amount sold per item during a shift. """
+    __station_partitioned__ = True
+
+    shift_id = db.Column(db.Integer, db.ForeignKey('shift.id', ondelete='CASCADE'), primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), primary_key=True)
+    qty = db.Column(db.Float, nullable=False, default=0.0)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class ShiftBankTotal(db.Model):
+    """ Online payments taken during a shift, per bank. """
+    __station_partitioned__ = True
+
+    shift_id = db.Column(db.Integer, db.ForeignKey('shift.id', ondelete='CASCADE'), primary_key=True)
+    bank_name = db.Column(db.String(100), primary_key=True)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class TankDip(db.Model):
+    """ Litres measured in an item's tank (dipstick or gauge) at a moment; see app/reconciliation.py. """
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), nullable=False)
+    date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    qty = db.Column(db.Float, nullable=False)
+    recorded_by = db.Column(db.String(100))
+
+    __table_args__ = (
+        db.Index('ix_tank_dip_item_date', 'item_id', 'date'),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "item_id": self.item_id,
+            "date": self.date.isoformat(),
+            "qty": self.qty,
+            "recorded_by": self.recorded_by,
+        }
+
+
+class MeterChain(db.Model):
+    """ One pump meter: an item dispensed through a nozzle, as in Sale.previous_reading/current_reading.
+
+    `last_reading` follows the newest streamed reading (see app/telemetry.py).
+    """
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), nullable=False)
+    nozzle = db.Column(db.String(20), nullable=False)
+    last_reading = db.Column(db.Float)
+    last_taken_at = db.Column(db.BigInteger)  # epoch milliseconds
+
+    __table_args__ = (
+        db.UniqueConstraint('item_id', 'nozzle', name='uq_meter_chain_item_nozzle'),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "item_id": self.item_id,
+            "nozzle": self.nozzle,
+            "last_reading": self.last_reading,
+            "last_taken_at": ms_to_datetime(self.last_taken_at).isoformat() if self.last_taken_at else None,
+        }
+
+
+class MeterReading(db.Model):
+    """ A streamed meter reading; kept to three small columns as there are many of them. """
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    chain_id = db.Column(db.Integer, db.ForeignKey('meter_chain.id', ondelete='CASCADE'), nullable=False)
+    taken_at = db.Column(db.BigInteger, nullable=False)  # epoch milliseconds
+    reading = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_meter_reading_chain_taken', 'chain_id', 'taken_at'),
+    )
+
+
+def ms_to_datetime(ms):
+    """ Epoch milliseconds (MeterChain/MeterReading) -> naive UTC datetime. """
+    return datetime.utcfromtimestamp(ms / 1000) if ms is not None else None
+
+
+class ChangeLog(db.Model):
+    """ One row per insert/update/delete of a synced table; `version` only ever grows. """
+    __station_partitioned__ = True
+
+    version = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(1), nullable=False)  # "I", "U" or "D"
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_change_log_table_row', 'table_name', 'row_id'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+
+class StreamEvent(db.Model):
+    """ A committed sale, purchase, voucher or batch of meter readings for /stream clients (see app/events.py).
+
+    Kept in the shared database so every worker process serves the same
+    events under the same ids.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(20), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    # Ids are never reused after old events are pruned
+    __table_args__ = {'sqlite_autoincrement': True}
+
+# ---------------------- Archive (see app/archive.py) ----------------------
+
+def _archive_table(model, *indexes):
+    """ Copy of `model`'s columns, without foreign keys, for rows moved out of the hot table. """
+    columns = [db.Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+               for c in model.__table__.columns]
+    return db.Table(f'{model.__tablename__}_archive', db.metadata, *columns, *indexes)
+
+
+class ArchivedSale(db.Model):
+    __station_partitioned__ = True
+    __table__ = _archive_table(Sale, db.Index('ix_sale_archive_date', 'date'),
+                               db.Index('ix_sale_archive_slip_no', 'slip_no'))
+
+
+class ArchivedAmount(db.Model):
+    __station_partitioned__ = True
+    __table__ = _archive_table(Amount, db.Index('ix_amount_archive_sale_id', 'sale_id'))
+
+
+class ArchivedCreditSale(db.Model):
+    __station_partitioned__ = True
+    __table__ = _archive_table(CreditSale, db.Index('ix_credit_sale_archive_sale_id', 'sale_id'))
+
+
+class ArchivedPurchase(db.Model):
+    __station_partitioned__ = True
+    __table__ = _archive_table(Purchase, db.Index('ix_purchase_archive_date', 'date'),
+                               db.Index('ix_purchase_archive_purchase_no', 'purchase_no'))
+
+    # Same names as the backrefs on Purchase, so list and detail code can treat both alike
+    supplier = db.relationship('Supplier', primaryjoin='foreign(ArchivedPurchase.supplier_id) == Supplier.id',
+                               viewonly=True)
+    item = db.relationship('Item', primaryjoin='foreign(ArchivedPurchase.item_id) == Item.id', viewonly=True)
+
+    def to_dict(self):
+        return {col.name: getattr(self, col.name) for col in self.__table__.columns}
+
+
+class ArchiveRun(db.Model):
+    """ One archival pass: sales and paid purchases dated before `before` were moved to the archive tables. """
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    before = db.Column(db.DateTime, nullable=False)  # first day of the first month still hot
+    sales = db.Column(db.Integer, nullable=False, default=0)
+    purchases = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "before": self.before.isoformat(),
+            "sales": self.sales,
+            "purchases": self.purchases,
+            "archived_at": self.archived_at.isoformat() if self.archived_at else None,
+        }
+
+
+class ReportJob(db.Model):
+    """ A report built in the background into a file; see app/reports.py. """
+    __station_partitioned__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False)  # JSON, normalized
+    params_hash = db.Column(db.String(64), nullable=False)
+    data_version = db.Column(db.String(40), nullable=False)  # change log version the output was built from
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    path = db.Column(db.String(255))
+    content_hash = db.Column(db.String(64))  # sha256 of the file
+    size = db.Column(db.Integer)
+    rows = db.Column(db.Integer)
+    error = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('ix_report_job_params_version', 'params_hash', 'data_version'),
+        db.Index('ix_report_job_status', 'status'),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": json.loads(self.params),
+            "status": self.status,
+            "data_version": self.data_version,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "content_hash": self.content_hash,
+            "size": self.size,
+            "rows": self.rows,
+            "error": self.error,
+        }
+
+
+class KpiCounter(db.Model):
+    """ One figure of the manager dashboard, kept current as sales, purchases and vouchers are posted.
+
+    `period` is the UTC day the figure covers (YYYY-MM-DD), or "total" for
+    running balances; `key` is the item id of per-item figures. See app/kpis.py.
+    """
+    __station_partitioned__ = True
+
+    period = db.Column(db.String(10), primary_key=True)
+    name = db.Column(db.String(30), primary_key=True)
+    key = db.Column(db.String(20), primary_key=True, default='')
+    value = db.Column(db.Float, nullable=False, default=0.0)
@@ -0,0 +1,142 @@
+from datetime import date, timedelta
+
+from sqlalchemy import case, func
+
+from . import db
+from .models import Purchase, Supplier, SupplierPayable, SupplierPayableDay
+
+# (label, min age in days, max age in days or None)
+AGING_BUCKETS = [
+    ('0_30', 0, 30),
+    ('31_60', 31, 60),
+    ('61_90', 61, 90),
+    ('90_plus', 91, None),
+]
+
+
+class PaymentError(ValueError):
+    """ Raised when a supplier payment cannot be applied. """
+
+
+def _adjust(supplier_id, day, amount):
+    """ Move the supplier total and the purchase-day bucket by `amount`. """
+    total = SupplierPayable.query.get(supplier_id)
+    if total is None:
+        total = SupplierPayable(supplier_id=supplier_id, outstanding=0.0)
+        db.session.add(total)
+    total.outstanding = round(total.outstanding + amount, 2)
+
+    bucket = SupplierPayableDay.query.get((supplier_id, day))
+    if bucket is None:
+        bucket = SupplierPayableDay(supplier_id=supplier_id, day=day, outstanding=0.0)
+        db.session.add(bucket)
+    bucket.outstanding = round(bucket.outstanding + amount, 2)
+    if abs(bucket.outstanding) < 0.005:
+        db.session.delete(bucket)
+        db.session.flush()
+
+
+def _open_amount(purchase):
+    return max(purchase.balance or 0.0, 0.0)
+
+
+def add_purchase(purchase):
+    """ Record a newly posted purchase bill. The purchase must be flushed. """
+    if purchase.supplier_id and _open_amount(purchase):
+        _adjust(purchase.supplier_id, purchase.date.date(), _open_amount(purchase))
+
+
+def remove_purchase(purchase):
+    if purchase.supplier_id and _open_amount(purchase):
+        _adjust(purchase.supplier_id, purchase.date.date(), -_open_amount(purchase))
+
+
+def apply_payment(supplier, amount, purchase_id=None):
+    """ Settle open purchase balances for `supplier`, oldest first.
+
+    With `purchase_id` the whole amount goes to that one bill. Returns a list
+    of (purchase, applied) pairs. The caller commits.
+    """
+    amount = round(amount, 2)
+    if amount <= 0:
+        raise PaymentError("Payment amount must be positive")
+
+    query = Purchase.query.filter(Purchase.supplier_id == supplier.id, Purchase.balance > 0)
+    if purchase_id is not None:
+        query = query.filter(Purchase.id == purchase_id)
+    open_purchases = query.order_by(Purchase.date, Purchase.id).all()
+
+    outstanding = round(sum(p.balance for p in open_purchases), 2)
+    if amount > outstanding:
+        raise PaymentError(f"Payment of {amount} exceeds the outstanding balance of {outstanding}")
+
+    applied = []
+    remaining = amount
+    for purchase in open_purchases:
+        if remaining <= 0:
+            break
+        portion = round(min(remaining, purchase.balance), 2)
+        purchase.payment = round((purchase.payment or 0.0) + portion, 2)
+        purchase.balance = round(purchase.balance - portion, 2)
+        _adjust(supplier.id, purchase.date.date(), -portion)
+        applied.append((purchase, portion))
+        remaining = round(remaining - portion, 2)
+    return applied
+
+
+def aging(as_of=None, supplier_id=None):
+    """ Outstanding payables per supplier split into age buckets.
+
+    Reads only SupplierPayableDay, which holds one row per supplier and
+    purchase day with an open balance.
+    """
+    as_of = as_of or date.today()
+    columns = []
+    for label, low, high in AGING_BUCKETS:
+        condition = SupplierPayableDay.day <= as_of - timedelta(days=low)
+        if high is not None:
+            condition &= SupplierPayableDay.day >= as_of - timedelta(days=high)
+        columns.append(func.sum(case((condition, SupplierPayableDay.outstanding), else_=0.0)).label(label))
+
+    query = db.session.query(SupplierPayableDay.supplier_id, *columns) \
+        .group_by(SupplierPayableDay.supplier_id)
+    if supplier_id is not None:
+        query = query.filter(SupplierPayableDay.supplier_id == supplier_id)
+    totals = query.all()
+
+    # Suppliers are looked up separately: with station databases they live elsewhere
+    names = dict(db.session.query(Supplier.id, Supplier.name)
+                 .filter(Supplier.id.in_([row.supplier_id for row in totals])))
+
+    rows = []
+    for row in totals:
+        if row.supplier_id not in names:
+            continue
+        buckets = {label: round(getattr(row, label) or 0.0, 2) for label, _, _ in AGING_BUCKETS}
+        rows.append({
+            "supplier_id": row.supplier_id,
+            "supplier_name": names[row.supplier_id],
+            "buckets": buckets,
+            "total": round(sum(buckets.values()), 2),
+        })
+    return rows
+
+
+def rebuild():
+    """ Recompute totals and day buckets from Purchase, e.g. for data posted before payables existed. """
+    SupplierPayableDay.query.delete()
+    SupplierPayable.query.delete()
+
+    day = func.date(Purchase.date)
+    query = db.session.query(Purchase.supplier_id, day, func.sum(Purchase.balance)) \
+        .filter(Purchase.supplier_id.isnot(None), Purchase.balance > 0) \
+        .group_by(Purchase.supplier_id, day)
+
+    totals = {}
+    for supplier_id, purchase_day, outstanding in query:
+        purchase_day = date.fromisoformat(purchase_day) if isinstance(purchase_day, str) else purchase_day
+        db.session.add(SupplierPayableDay(supplier_id=supplier_id, day=purchase_day, outstanding=round(outstanding, 2)))
+        totals[supplier_id] = totals.get(supplier_id, 0.0) + outstanding
+    for supplier_id, outstanding in totals.items():
+        db.session.add(SupplierPayable(supplier_id=supplier_id, outstanding=round(outstanding, 2)))
+    return len(totals)
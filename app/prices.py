@@ -0,0 +1,165 @@
+import threading
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+
+from flask import g
+from sqlalchemy import func
+
+from . import db
+from .hooks import after_commit
+from .models import Item, ItemPrice
+
+# effective_from of the rate an item had before its first recorded change
+BEGINNING = datetime(1970, 1, 1)
+
+# How far in the past a new price may start (clock skew between terminals and server)
+BACKDATE_TOLERANCE = timedelta(minutes=5)
+
+
+class PriceError(ValueError):
+    """ Raised for an invalid price change. """
+
+
+def parse_time(value):
+    """ ISO date or timestamp -> naive UTC datetime (the way dates are stored). """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _baseline(item):
+    """ Record the item's current rate as its opening price, unless it already has a history. """
+    if item.sale_rate is not None and not ItemPrice.query.filter_by(item_id=item.id).first():
+        db.session.add(ItemPrice(item_id=item.id, effective_from=BEGINNING, sale_rate=item.sale_rate))
+
+
+def record(item, sale_rate, effective_from=None, note=None):
+    """ Add a price for `item` from `effective_from` (default now); the caller commits.
+
+    A price that is already in force also becomes Item.sale_rate; future
+    ones are picked up by apply_due().
+    """
+    now = datetime.utcnow()
+    effective_from = effective_from or now
+    if sale_rate is None or sale_rate <= 0:
+        raise PriceError(f"sale_rate for item {item.id} must be positive")
+    if effective_from < now - BACKDATE_TOLERANCE:
+        raise PriceError("Prices cannot be back-dated; posted slips keep the rate they were sold at")
+    if ItemPrice.query.filter_by(item_id=item.id, effective_from=effective_from).first():
+        raise PriceError(f"Item {item.id} already has a price from {effective_from.isoformat()}")
+
+    _baseline(item)
+    price = ItemPrice(item_id=item.id, effective_from=effective_from, sale_rate=sale_rate, note=note)
+    db.session.add(price)
+    if effective_from <= now:
+        item.sale_rate = sale_rate
+    g.pop('price_history', None)  # later lines of this request see it too
+    after_commit(cache.invalidate)
+    return price
+
+
+def bulk_change(changes, effective_from=None, note=None):
+    """ Record [{"item_id", "sale_rate"}, ...] with one effective time; all or nothing, the caller commits. """
+    if not changes:
+        raise PriceError("prices must be a non-empty list")
+    item_ids = []
+    for change in changes:
+        try:
+            item_ids.append(int(change['item_id']))
+        except (KeyError, TypeError, ValueError):
+            raise PriceError("Each price needs an item_id")
+    if len(set(item_ids)) != len(item_ids):
+        raise PriceError("An item appears more than once")
+
+    items = {item.id: item for item in Item.query.filter(Item.id.in_(item_ids))}
+    missing = [i for i in item_ids if i not in items]
+    if missing:
+        raise PriceError(f"Unknown item(s): {', '.join(map(str, missing))}")
+
+    effective_from = effective_from or datetime.utcnow()
+    recorded = []
+    for item_id, change in zip(item_ids, changes):
+        try:
+            sale_rate = float(change['sale_rate'])
+        except (KeyError, TypeError, ValueError):
+            raise PriceError(f"sale_rate for item {item_id} must be numeric")
+        recorded.append(record(items[item_id], sale_rate, effective_from, note))
+    return recorded
+
+
+def history(item_id):
+    return ItemPrice.query.filter_by(item_id=item_id).order_by(ItemPrice.effective_from).all()
+
+
+def apply_due(now=None):
+    """ Copy prices that have come into force onto Item.sale_rate (run from cron). Returns the items changed. """
+    now = now or datetime.utcnow()
+    changed = []
+    for item in Item.query.all():
+        rate = cache.rate_at(item, now)
+        if rate is not None and rate != item.sale_rate:
+            item.sale_rate = rate
+            changed.append(item)
+    return changed
+
+
+class PriceCache:
+    """ Every item's price history in memory, for rate_at() without a query per sale line.
+
+    Each request (or app context, for commands) checks a count/max(id) stamp
+    once, with one indexed query, before its first lookup, so a slip is
+    priced with every change committed by any worker before it started
+    however many lines it has. Prices are only ever added, so the stamp
+    moves with every change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._history = None  # item_id -> ([effective_from, ...], [sale_rate, ...])
+        self._stamp = None
+
+    def invalidate(self):
+        with self._lock:
+            self._stamp = None
+
+    def _current(self):
+        history = g.get('price_history')
+        if history is not None:
+            return history
+        # Query and load outside the lock; it only guards swapping in a newer history
+        stamp = tuple(db.session.query(func.count(ItemPrice.id), func.max(ItemPrice.id)).one())
+        cached_stamp, history = self._stamp, self._history
+        if history is None or stamp != cached_stamp:
+            history = self._load()
+            with self._lock:
+                # Another thread may have loaded a newer one meanwhile
+                if self._stamp is None or self._stamp < stamp:
+                    self._history, self._stamp = history, stamp
+        g.price_history = history
+        return history
+
+    @staticmethod
+    def _load():
+        history = {}
+        rows = db.session.query(ItemPrice.item_id, ItemPrice.effective_from, ItemPrice.sale_rate) \
+            .order_by(ItemPrice.item_id, ItemPrice.effective_from)
+        for item_id, effective_from, sale_rate in rows:
+            dates, rates = history.setdefault(item_id, ([], []))
+            dates.append(effective_from)
+            rates.append(sale_rate)
+        return history
+
+    def rate_at(self, item, when=None):
+        """ The item's sale rate in force at `when` (default now); Item.sale_rate when it has no history. """
+        when = when or datetime.utcnow()
+        dates, rates = self._current().get(item.id, ((), ()))
+        index = bisect_right(dates, when) - 1
+        return rates[index] if index >= 0 else item.sale_rate
+
+
+cache = PriceCache()
+
+
+def rate_at(item, when=None):
+    return cache.rate_at(item, when)
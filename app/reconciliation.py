@@ -0,0 +1,200 @@
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, select
+
+from . import db, archive
+from .archive import ARCHIVES
+from .models import Item, Purchase, Sale, TankDip
+
+
+# One row of a bulk column pull: item, day as YYYY-MM-DD, litres
+_ROW = np.dtype([('item_id', np.int64), ('day', 'U10'), ('qty', np.float64)])
+
+
+def _columns(model, start, end, item_ids=None):
+    """ (item_id, day, qty) arrays for start <= date < end, from the archive too when the range reaches it.
+
+    Rows go straight from the DBAPI cursor into one structured array, without
+    a Row object per sale line; that is most of the time on a long range.
+    """
+    parts = []
+    for m in ([ARCHIVES[model]] if archive.reaches(start) else []) + [model]:
+        table = m.__table__
+        stmt = select(table.c.item_id, func.date(table.c.date), table.c.qty) \
+            .where(table.c.date >= start, table.c.date < end, table.c.item_id.isnot(None))
+        if item_ids:
+            stmt = stmt.where(table.c.item_id.in_(item_ids))
+        result = db.session.execute(stmt)
+        try:
+            parts.append(np.array(result.cursor.fetchall(), dtype=_ROW))
+        finally:
+            result.close()
+    rows = np.concatenate(parts)
+    return rows['item_id'], rows['day'].astype('datetime64[D]'), rows['qty']
+
+
+def _dips(start, end, item_ids=None):
+    """ Dips in the range as (item_id, moment, qty) arrays, plus {item_id: qty} of the last dip before it. """
+    stmt = select(TankDip.item_id, TankDip.date, TankDip.qty).where(TankDip.date >= start, TankDip.date < end)
+    last = select(TankDip.item_id, func.max(TankDip.date).label('date')).where(TankDip.date < start)
+    if item_ids:
+        stmt = stmt.where(TankDip.item_id.in_(item_ids))
+        last = last.where(TankDip.item_id.in_(item_ids))
+    last = last.group_by(TankDip.item_id).subquery()
+    opening = dict(db.session.execute(
+        select(TankDip.item_id, TankDip.qty).join(last, (TankDip.item_id == last.c.item_id) & (TankDip.date == last.c.date))
+    ).all())
+
+    rows = db.session.execute(stmt).all()
+    if not rows:
+        return (np.empty(0, np.int64), np.empty(0, 'datetime64[us]'), np.empty(0, np.float64)), opening
+    i, d, q = zip(*rows)
+    return (np.array(i, dtype=np.int64), np.array(d, dtype='datetime64[us]'), np.array(q, dtype=np.float64)), opening
+
+
+def variance_grid(sold, delivered, closing, opening):
+    """ The reconciliation itself, on (items x days) arrays.
+
+    `sold` and `delivered` are litres per day, `closing` the last dip of each
+    day (NaN without one), `opening` the dip before the first day (NaN when
+    there is none). Between two dips the tank should have gone down by the
+    litres sold and up by the litres delivered; the variance on a dip day is
+    the dip minus that book stock (negative means litres went missing).
+    Returns a dict of (items x days) arrays.
+    """
+    n_items, n_days = sold.shape
+    flow = np.cumsum(delivered - sold, axis=1)
+    sales = np.cumsum(sold, axis=1)
+
+    # Column 0 stands for "before the first day", so every day can look back to the last dip
+    dips = np.hstack([opening[:, None], closing])
+    flow0 = np.hstack([np.zeros((n_items, 1)), flow])
+    sales0 = np.hstack([np.zeros((n_items, 1)), sales])
+    positions = np.where(~np.isnan(dips), np.arange(n_days + 1), -1)
+    last_dip = np.maximum.accumulate(positions, axis=1)[:, :-1]  # last dip strictly before each day
+    anchored = last_dip >= 0
+    anchor = np.clip(last_dip, 0, None)
+
+    book = np.where(anchored, np.take_along_axis(dips, anchor, 1) + flow - np.take_along_axis(flow0, anchor, 1), np.nan)
+    variance = np.where(anchored & ~np.isnan(closing), closing - book, np.nan)
+    interval_sales = sales - np.take_along_axis(sales0, anchor, 1)
+    cumulative = np.cumsum(np.nan_to_num(variance), axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN rows in nanmedian
+        variance_pct = np.where(interval_sales > 0, variance / interval_sales * 100, np.nan)
+        cumulative_pct = np.where(sales > 0, cumulative / sales * 100, np.nan)
+        # Robust z-score against each item's own history: median and MAD resist the outliers themselves
+        median = np.nanmedian(variance, axis=1, keepdims=True)
+        mad = np.nanmedian(np.abs(variance - median), axis=1, keepdims=True)
+        score = np.abs(0.6745 * (variance - median) / mad)
+
+    return {
+        'book': book,
+        'variance': variance,
+        'variance_pct': variance_pct,
+        'cumulative': cumulative,
+        'cumulative_pct': cumulative_pct,
+        'score': score,
+    }
+
+
+def _grid(index, n_days, items, days, values, start_day):
+    flat = np.searchsorted(index, items) * n_days + (days - start_day).astype(np.int64)
+    return np.bincount(flat, weights=values, minlength=len(index) * n_days).reshape(len(index), n_days)
+
+
+def _closing(index, n_days, dips, start_day):
+    """ Last dip of each item and day, NaN on days without one. """
+    items, moments, qty = dips
+    closing = np.full((len(index), n_days), np.nan)
+    if len(items):
+        flat = np.searchsorted(index, items) * n_days + (moments.astype('datetime64[D]') - start_day).astype(np.int64)
+        order = np.lexsort((moments, flat))
+        flat, qty = flat[order], qty[order]
+        last = np.append(flat[1:] != flat[:-1], True)
+        closing.flat[flat[last]] = qty[last]
+    return closing
+
+
+def _value(x, digits=3):
+    return None if np.isnan(x) else round(float(x), digits)
+
+
+def reconcile(start, end, item_ids=None, flagged_only=False):
+    """ Daily wet-stock reconciliation per item for start <= day < end (dates at midnight).
+
+    Meter sales, deliveries and dips are pulled as whole columns and the
+    variance worked out with array operations (variance_grid). A day is
+    flagged "outlier" when its variance is far from the item's usual one
+    (robust z-score above RECONCILIATION_OUTLIER_Z) and "drift" when the
+    cumulative variance exceeds RECONCILIATION_TOLERANCE_PCT of the litres
+    sold plus RECONCILIATION_TOLERANCE_LITRES, which points at a leak or a
+    meter reading off.
+    """
+    n_days = (end - start).days
+    start_day = np.datetime64(start.date(), 'D')
+    sales = _columns(Sale, start, end, item_ids)
+    deliveries = _columns(Purchase, start, end, item_ids)
+    dips, opening = _dips(start, end, item_ids)
+
+    index = np.unique(np.concatenate([
+        np.array(item_ids or [], dtype=np.int64), sales[0], deliveries[0], dips[0],
+        np.array(list(opening), dtype=np.int64),
+    ]))
+    sold = _grid(index, n_days, *sales, start_day)
+    delivered = _grid(index, n_days, *deliveries, start_day)
+    closing = _closing(index, n_days, dips, start_day)
+    opening_dips = np.array([opening.get(int(i), np.nan) for i in index], dtype=np.float64)
+    result = variance_grid(sold, delivered, closing, opening_dips)
+
+    outlier = result['score'] > current_app.config['RECONCILIATION_OUTLIER_Z']
+    allowed = np.cumsum(sold, axis=1) * current_app.config['RECONCILIATION_TOLERANCE_PCT'] / 100 \
+        + current_app.config['RECONCILIATION_TOLERANCE_LITRES']
+    drift = ~np.isnan(result['variance']) & (np.abs(result['cumulative']) > allowed)
+
+    # Items are looked up separately: with station databases they live elsewhere
+    names = dict(db.session.query(Item.id, Item.item_name).filter(Item.id.in_(index.tolist())))
+    report = []
+    for row, item_id in enumerate(index.tolist()):
+        days = []
+        for day in range(n_days):
+            flags = [f for f, on in (('outlier', outlier[row, day]), ('drift', drift[row, day])) if on]
+            if flagged_only and not flags:
+                continue
+            days.append({
+                'date': (start + timedelta(days=day)).date().isoformat(),
+                'sales': round(float(sold[row, day]), 3),
+                'deliveries': round(float(delivered[row, day]), 3),
+                'dip': _value(closing[row, day]),
+                'book_stock': _value(result['book'][row, day]),
+                'variance': _value(result['variance'][row, day]),
+                'variance_pct': _value(result['variance_pct'][row, day], 2),
+                'cumulative_variance': round(float(result['cumulative'][row, day]), 3),
+                'cumulative_variance_pct': _value(result['cumulative_pct'][row, day], 2),
+                'flags': flags,
+            })
+        total_sales = float(sold[row].sum())
+        total_variance = float(result['cumulative'][row, -1]) if n_days else 0.0
+        report.append({
+            'item_id': item_id,
+            'item_name': names.get(item_id),
+            'opening_dip': _value(opening_dips[row]),
+            'sales': round(total_sales, 3),
+            'deliveries': round(float(delivered[row].sum()), 3),
+            'variance': round(total_variance, 3),
+            'variance_pct': round(total_variance / total_sales * 100, 2) if total_sales else None,
+            'flagged_days': int((outlier[row] | drift[row]).sum()),
+            'days': days,
+        })
+    return report
+
+
+def default_range(start=None, end=None):
+    """ (start, end) at midnight, end exclusive; the last 30 days by default. """
+    end = end or datetime.combine(datetime.utcnow().date() + timedelta(days=1), datetime.min.time())
+    start = start or end - timedelta(days=30)
+    return start, end
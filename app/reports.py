@@ -0,0 +1,292 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app, g
+from sqlalchemy import update
+
+from . import db, accounting, changelog, statements
+from .hooks import after_commit
+from .models import Customer, JournalEntry, JournalLine, ReportJob
+from .routing import current_station
+
+logger = logging.getLogger(__name__)
+
+# A job still "running" after this long was lost with its process and may be run again
+STALE_AFTER = timedelta(hours=1)
+
+# Rows fetched per round trip while a report streams
+CHUNK = 1000
+
+
+class ReportError(ValueError):
+    """ Raised for an unknown report kind or invalid report parameters. """
+
+
+def _date(params, name, required=False):
+    try:
+        value = accounting.parse_date(params.get(name))
+    except (TypeError, ValueError):
+        raise ReportError(f"{name} must be YYYY-MM-DD")
+    if value is None and required:
+        raise ReportError(f"{name} is required")
+    return value.date().isoformat() if value else None
+
+
+def _range(params):
+    """ Normalized from/to dates (to inclusive) -> (start, end) datetimes with `end` exclusive. """
+    start = accounting.parse_date(params.get('from'))
+    end = accounting.parse_date(params.get('to'))
+    return start, end + timedelta(days=1) if end else None
+
+
+# ---------------------- Report kinds ----------------------
+
+def _statements_params(params):
+    try:
+        customer_ids = sorted({int(i) for i in params.get('customer_ids') or []})
+    except (TypeError, ValueError):
+        raise ReportError("customer_ids must be a list of ids")
+    return {'from': _date(params, 'from', required=True), 'to': _date(params, 'to', required=True),
+            'customer_ids': customer_ids}
+
+
+def _statements(params, writer):
+    """ Statement lines with running balances for every customer (or `customer_ids`) with activity or a balance. """
+    start, end = _range(params)
+    writer.writerow(['customer_id', 'customer_name', 'date', 'doc_type', 'doc_no', 'description', 'debit', 'credit',
+                     'balance'])
+    customers = Customer.query.order_by(Customer.id)
+    if params['customer_ids']:
+        customers = customers.filter(Customer.id.in_(params['customer_ids']))
+
+    rows = 0
+    for customer in customers.all():
+        opening, lines, cursor = statements.statement_page(customer, start, end, limit=CHUNK)
+        if not lines and not opening:
+            continue
+        writer.writerow([customer.id, customer.name, params['from'], 'opening', '', 'Opening balance', '', '', opening])
+        while True:
+            for line in lines:
+                writer.writerow([customer.id, customer.name, line['date'], line['doc_type'], line['doc_no'],
+                                 line['description'], line['debit'], line['credit'], line['balance']])
+            rows += len(lines)
+            if not cursor:
+                break
+            _, lines, cursor = statements.statement_page(customer, start, end, cursor, limit=CHUNK)
+    return rows
+
+
+def _ledger_params(params):
+    account_code = params.get('account_code')
+    if account_code is not None and not isinstance(account_code, str):
+        raise ReportError("account_code must be a string")
+    return {'from': _date(params, 'from'), 'to': _date(params, 'to'), 'account_code': account_code or None}
+
+
+def _ledger(params, writer):
+    """ Journal lines with running balances, one account or all of them account by account. """
+    start, end = _range(params)
+    account_code = params['account_code']
+    writer.writerow(['account_code', 'account_name', 'date', 'doc_type', 'doc_no', 'debit', 'credit', 'balance'])
+
+    opening = accounting.balances(as_of=start, account_code=account_code) if start else {}
+    query = db.session.query(
+        JournalLine.account_code, JournalLine.account_name, JournalLine.entry_date, JournalEntry.doc_type,
+        JournalEntry.doc_no, JournalLine.debit, JournalLine.credit,
+    ).join(JournalEntry, JournalLine.entry_id == JournalEntry.id)
+    if account_code:
+        query = query.filter(JournalLine.account_code == account_code)
+    if start is not None:
+        query = query.filter(JournalLine.entry_date >= start)
+    if end is not None:
+        query = query.filter(JournalLine.entry_date < end)
+
+    rows, current, balance = 0, None, 0.0
+    for code, name, date, doc_type, doc_no, debit, credit in query \
+            .order_by(JournalLine.account_code, JournalLine.entry_date, JournalLine.id).yield_per(CHUNK):
+        if code != current:
+            current = code
+            carried = opening.get(code)
+            balance = round(carried['debit'] - carried['credit'], 2) if carried else 0.0
+            writer.writerow([code, name, params['from'] or '', 'opening', '', '', '', balance])
+        balance = round(balance + debit - credit, 2)
+        writer.writerow([code, name, date.isoformat(), doc_type, doc_no, debit, credit, balance])
+        rows += 1
+    return rows
+
+
+# kind -> (normalize and validate params, write the report as CSV rows and return the number of lines)
+KINDS = {
+    'customer-statements': (_statements_params, _statements),
+    'ledger': (_ledger_params, _ledger),
+}
+
+
+# ---------------------- Jobs ----------------------
+
+def normalize(kind, params):
+    if kind not in KINDS:
+        raise ReportError(f"kind must be one of {', '.join(KINDS)}")
+    if params is None:
+        params = {}
+    if not isinstance(params, dict):
+        raise ReportError("params must be an object")
+    return KINDS[kind][0](params)
+
+
+def params_hash(kind, params):
+    return hashlib.sha256(json.dumps([kind, params], sort_keys=True).encode()).hexdigest()
+
+
+def submit(kind, params):
+    """ A job for this report: an identical one for the current data if there is one, else a new queued job.
+
+    Returns (job, created); the caller commits, after which a queued job is
+    handed to the worker pool, whether it is new or an earlier one nobody
+    is building (its worker stopped before starting it).
+    """
+    params = normalize(kind, params)
+    key, version = params_hash(kind, params), changelog.data_version()
+    existing = ReportJob.query.filter(ReportJob.params_hash == key, ReportJob.data_version == version,
+                                      ReportJob.status.in_(('queued', 'running', 'done'))) \
+        .order_by(ReportJob.id.desc()).first()
+    if existing is not None and existing.status == 'running' and existing.started_at < datetime.utcnow() - STALE_AFTER:
+        # Its process died while building it
+        _requeue(ReportJob.id == existing.id)
+        db.session.refresh(existing)
+    if existing and (existing.status != 'done' or os.path.exists(existing.path)):
+        if existing.status == 'queued':
+            _dispatch(existing.id)
+        return existing, False
+
+    job = ReportJob(kind=kind, params=json.dumps(params, sort_keys=True), params_hash=key, data_version=version,
+                    status='queued')
+    db.session.add(job)
+    db.session.flush()
+    _dispatch(job.id)
+    return job, True
+
+
+def _dispatch(job_id):
+    """ Start the job on the pool once the transaction commits; a job already being built is left alone (_claim). """
+    app, station = current_app._get_current_object(), current_station()
+    after_commit(lambda: runner.submit(app, station, job_id))
+
+
+def _requeue(*criteria):
+    """ Put running jobs matching `criteria` that have been at it longer than STALE_AFTER back in the queue. """
+    db.session.execute(update(ReportJob).where(ReportJob.status == 'running',
+                                               ReportJob.started_at < datetime.utcnow() - STALE_AFTER, *criteria)
+                       .values(status='queued', started_at=None))
+
+
+def _claim(job_id):
+    """ Mark a queued job running; False when another worker got to it first. """
+    claimed = db.session.execute(
+        update(ReportJob).where(ReportJob.id == job_id, ReportJob.status == 'queued')
+        .values(status='running', started_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def run(job_id):
+    """ Build a queued job's file, in the current app context and station. Returns the job. """
+    if not _claim(job_id):
+        return ReportJob.query.get(job_id)
+    job = ReportJob.query.get(job_id)
+    directory = current_app.config['REPORT_DIR']
+    path = os.path.join(directory, f"{current_station()}-{job.id}-{job.kind}.csv")
+    tmp = f"{path}.tmp"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Labelled with the version from before the build: if data changes meanwhile, the next
+        # request for the same report sees a newer version and builds it again
+        version = changelog.data_version()
+        with open(tmp, 'w', newline='', encoding='utf-8') as f:
+            rows = KINDS[job.kind][1](json.loads(job.params), csv.writer(f))
+        digest = hashlib.sha256()
+        with open(tmp, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                digest.update(block)
+        os.replace(tmp, path)
+    except Exception as e:
+        logger.exception("Report job %s failed", job_id)
+        db.session.rollback()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        job = ReportJob.query.get(job_id)
+        job.status, job.error, job.finished_at = 'failed', str(e), datetime.utcnow()
+        db.session.commit()
+        return job
+
+    job.status, job.data_version, job.path = 'done', version, path
+    job.content_hash, job.size, job.rows = digest.hexdigest(), os.path.getsize(path), rows
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def run_pending():
+    """ Run every queued job, and jobs left running by a process that died. Returns the jobs run. """
+    _requeue()
+    db.session.commit()
+    ids = [job_id for (job_id,) in db.session.query(ReportJob.id).filter(ReportJob.status == 'queued')
+           .order_by(ReportJob.id)]
+    return [run(job_id) for job_id in ids]
+
+
+def purge(before):
+    """ Delete finished jobs created before `before`, and their files. Returns how many. """
+    jobs = ReportJob.query.filter(ReportJob.status.in_(('done', 'failed')), ReportJob.created_at < before).all()
+    for job in jobs:
+        if job.path and os.path.exists(job.path):
+            os.remove(job.path)
+        db.session.delete(job)
+    return len(jobs)
+
+
+class JobRunner:
+    """ Runs report jobs on a pool of REPORT_WORKERS threads per process.
+
+    Builds mostly wait on SQLite and the disk, so threads are enough and
+    share the app; with REPORT_WORKERS=0 jobs stay queued for
+    "flask run-report-jobs" in a separate process.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, app, station, job_id):
+        workers = app.config['REPORT_WORKERS']
+        if workers <= 0:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-job')
+            self._executor.submit(self._run, app, station, job_id)
+
+    def _run(self, app, station, job_id):
+        with app.app_context():
+            g.station = station
+            try:
+                run(job_id)
+            except Exception:
+                logger.exception("Report job %s could not be run", job_id)
+
+    def stop(self, wait=False):
+        """ Stop taking jobs; ones not started stay queued for the next "flask run-report-jobs". """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+
+runner = JobRunner()
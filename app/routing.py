@@ -0,0 +1,76 @@
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
+from sqlalchemy.sql.util import find_tables
+
+from . import snapshots
+
+# SQLALCHEMY_BINDS key of a station's own database
+BIND_PREFIX = 'station:'
+
+
+class StationError(ValueError):
+    """ Raised for an unknown station or a statement mixing station and shared tables. """
+
+
+def current_station():
+    """ Station the current request or task works for: g.station, else STATION_CODE. """
+    return g.get('station') or current_app.config['STATION_CODE']
+
+
+def is_partitioned(model):
+    """ True for models whose rows belong to one station (`__station_partitioned__`). """
+    return getattr(model, '__station_partitioned__', False)
+
+
+class StationSession(Session):
+    """ db.session that sends station tables to the current station's database.
+
+    Models flagged with `__station_partitioned__` (sales, purchases, vouchers
+    and the books derived from them) live in the database configured for the
+    station in STATION_DATABASES; master data (items, customers, suppliers,
+    users) stays in the default database. A station without its own entry
+    keeps its rows in the default database. Statements touching both kinds
+    of table cannot run on one connection and raise StationError.
+
+    Within a snapshot_read view every engine is swapped for its read-only
+    snapshot (see app/snapshots.py).
+    """
+
+    _partitioned_tables = None
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None or not has_app_context():
+            return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+        engine = None
+        if current_app.config.get('STATION_DATABASES'):
+            engine = self._station_engine(mapper, clause)
+        if engine is None:
+            engine = super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        if g.get('read_snapshot'):
+            # Inside a snapshots.snapshot_read view
+            return snapshots.engine_for(engine)
+        return engine
+
+    def _station_engine(self, mapper, clause):
+        tables = set()
+        if mapper is not None:
+            tables.add(inspect(mapper).local_table)
+        if clause is not None:
+            tables.update(find_tables(clause, include_crud=True))
+
+        partitioned = tables & self._partitioned()
+        if not partitioned:
+            return None
+        if partitioned != tables:
+            names = ', '.join(sorted(t.name for t in tables))
+            raise StationError(f"Cannot query station and shared tables together: {names}")
+        return self._db.engines.get(BIND_PREFIX + current_station())
+
+    def _partitioned(self):
+        if StationSession._partitioned_tables is None:
+            StationSession._partitioned_tables = frozenset(
+                m.local_table for m in self._db.Model.registry.mappers if is_partitioned(m.class_)
+            )
+        return StationSession._partitioned_tables
@@ -0,0 +1,155 @@
+import re
+
+from sqlalchemy import event, or_, text
+
+from . import db
+from .models import Item, Customer, Supplier
+
+# kind -> (model, title column, extra column)
+INDEXED = {
+    'item': (Item, 'item_name', 'item_code'),
+    'customer': (Customer, 'name', 'mobile'),
+    'supplier': (Supplier, 'name', None),
+}
+
+# Each record's index row has rowid = id * len(INDEXED) + its kind's position, so writes find it by
+# rowid instead of scanning the whole table for kind and ref_id (FTS5 cannot index those)
+KIND_CODES = {kind: code for code, kind in enumerate(INDEXED)}
+
+CREATE_INDEX = text(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "kind UNINDEXED, ref_id UNINDEXED, title, extra, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')"
+)
+
+_available = set()
+
+
+def fts_available(connection):
+    """ True when the connection is SQLite and the FTS table exists.
+
+    Only databases that have the table are remembered: "flask rebuild-search"
+    may create it from another process at any time, and a cached miss would
+    keep this one writing past it.
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    key = str(connection.engine.url)
+    if key not in _available and connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'")).first():
+        _available.add(key)
+    return key in _available
+
+
+def create_index(connection):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(CREATE_INDEX)
+        _available.add(str(connection.engine.url))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_index_with_schema(target, connection, **kw):
+    create_index(connection)
+
+
+# ---------------------- Keeping the index in sync ----------------------
+
+INSERT_ROW = text("INSERT INTO search_index (rowid, kind, ref_id, title, extra) "
+                  "VALUES (:rowid, :kind, :ref_id, :title, :extra)")
+
+def _rowid(kind, ref_id):
+    return ref_id * len(INDEXED) + KIND_CODES[kind]
+
+
+def _row(kind, obj):
+    _, title, extra = INDEXED[kind]
+    return {
+        'rowid': _rowid(kind, obj.id),
+        'kind': kind,
+        'ref_id': obj.id,
+        'title': getattr(obj, title) or '',
+        'extra': (getattr(obj, extra) or '') if extra else '',
+    }
+
+
+def _delete(connection, kind, ref_id):
+    connection.execute(text("DELETE FROM search_index WHERE rowid = :rowid"), {'rowid': _rowid(kind, ref_id)})
+
+
+def _upsert(connection, kind, obj):
+    _delete(connection, kind, obj.id)
+    connection.execute(INSERT_ROW, _row(kind, obj))
+
+
+def _register(kind, model):
+    @event.listens_for(model, 'after_insert')
+    @event.listens_for(model, 'after_update')
+    def _on_write(mapper, connection, target):
+        if fts_available(connection):
+            _upsert(connection, kind, target)
+
+    @event.listens_for(model, 'after_delete')
+    def _on_delete(mapper, connection, target):
+        if fts_available(connection):
+            _delete(connection, kind, target.id)
+
+
+for _kind, (_model, _, _) in INDEXED.items():
+    _register(_kind, _model)
+
+
+def rebuild():
+    """ Drop and refill the index from the source tables. Returns the number of rows indexed. """
+    connection = db.session.connection()
+    connection.execute(text("DROP TABLE IF EXISTS search_index"))
+    create_index(connection)
+    count = 0
+    for kind, (model, _, _) in INDEXED.items():
+        rows = [_row(kind, obj) for obj in model.query.all()]
+        if rows:
+            connection.execute(INSERT_ROW, rows)
+        count += len(rows)
+    return count
+
+
+# ---------------------- Querying ----------------------
+
+def _match_expression(q):
+    """ Every word must match as a prefix: 'pet 95' -> '"pet"* "95"*'. """
+    words = re.findall(r'\w+', q, flags=re.UNICODE)
+    return ' '.join(f'"{w}"*' for w in words)
+
+
+def search(q, kinds=None, limit=10):
+    """ Ranked typeahead results as dicts with kind, id, title and extra. """
+    kinds = [k for k in (kinds or INDEXED) if k in INDEXED]
+    match = _match_expression(q)
+    if not match or not kinds:
+        return []
+
+    connection = db.session.connection()
+    if not fts_available(connection):
+        return _search_like(q, kinds, limit)
+
+    params = {'match': match, 'limit': limit}
+    params.update({f'kind{i}': k for i, k in enumerate(kinds)})
+    kind_list = ', '.join(f':kind{i}' for i in range(len(kinds)))
+    rows = connection.execute(text(
+        "SELECT kind, ref_id, title, extra FROM search_index "
+        f"WHERE search_index MATCH :match AND kind IN ({kind_list}) "
+        "ORDER BY bm25(search_index, 0.0, 0.0, 10.0, 2.0) LIMIT :limit"
+    ), params)
+    return [{'kind': r.kind, 'id': r.ref_id, 'title': r.title, 'extra': r.extra} for r in rows]
+
+
+def _search_like(q, kinds, limit):
+    """ Prefix match with LIKE for databases without FTS5. """
+    results = []
+    for kind in kinds:
+        model, title, extra = INDEXED[kind]
+        columns = [getattr(model, title)] + ([getattr(model, extra)] if extra else [])
+        condition = or_(*[c.ilike(f'{q}%') for c in columns])
+        for obj in model.query.filter(condition).limit(limit):
+            row = _row(kind, obj)
+            results.append({'kind': kind, 'id': obj.id, 'title': row['title'], 'extra': row['extra']})
+    return results[:limit]
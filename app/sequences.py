@@ -0,0 +1,129 @@
+import os
+import threading
+
+from flask import current_app, g
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .hooks import after_commit
+from .models import DocumentSequence
+from .routing import current_station
+
+# Printed prefix for each document type
+PREFIXES = {
+    'bill': 'BILL',
+    'slip': 'SLIP',
+    'voucher': 'CV',
+    'debit_voucher': 'DV',
+    'payment': 'PAY',
+}
+
+
+class SequenceAllocator:
+    """ Hands out document numbers in blocks (hi/lo).
+
+    Each worker reserves a block of `block_size` numbers with one short
+    database transaction and then serves numbers from memory until the block
+    runs out. Numbers never collide across workers; a worker that exits
+    leaves a gap, which is fine for bills, slips and vouchers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blocks = {}
+        self._pid = os.getpid()
+
+    def next_values(self, doc_type, count=1, station=None):
+        if doc_type not in PREFIXES:
+            raise ValueError(f"Unknown document type: {doc_type}")
+
+        station = station or current_station()
+        block_size = current_app.config['SEQUENCE_BLOCK_SIZE']
+        key = (str(self._engine().url), doc_type, station)
+
+        with self._lock:
+            # Blocks copied into a forked worker belong to the parent
+            if self._pid != os.getpid():
+                self._blocks.clear()
+                self._pid = os.getpid()
+
+            values = []
+            while len(values) < count:
+                blocks = self._blocks
+                lo, limit = blocks.get(key, (0, 0))
+                if lo >= limit and g.get('in_batch'):
+                    # A block reserved in a /batch transaction is not ours until it commits, so
+                    # the request keeps it to itself until then (see _reserve_block)
+                    blocks = g.setdefault('sequence_blocks', {})
+                    lo, limit = blocks.get(key, (0, 0))
+                if lo >= limit:
+                    hi = self._reserve_block(doc_type, station, key, blocks)
+                    lo, limit = (hi - 1) * block_size + 1, hi * block_size + 1
+                take = min(count - len(values), limit - lo)
+                values.extend(range(lo, lo + take))
+                blocks[key] = (lo + take, limit)
+            return values
+
+    def next_numbers(self, doc_type, count=1, station=None):
+        station = station or current_station()
+        return [format_number(doc_type, station, n)
+                for n in self.next_values(doc_type, count, station)]
+
+    def next_number(self, doc_type, station=None):
+        return self.next_numbers(doc_type, 1, station)[0]
+
+    def _reserve_block(self, doc_type, station, key, blocks):
+        """ Bump the stored hi value in its own transaction and return it.
+
+        This runs on a separate connection so the reservation is committed
+        even if the request that asked for it rolls back. Callers must
+        therefore reserve numbers before they write through db.session,
+        otherwise SQLite would make this connection wait for the session's
+        write lock. Inside /batch the session's own connection is used.
+        """
+        if g.get('in_batch'):
+            # A /batch request may already hold the write lock, so reserve the block inside its
+            # transaction. `blocks` is the request's own: if the batch rolls back, the same block is
+            # reserved again, so other threads must not have handed out any of it. Once the batch
+            # commits, what is left of the block is shared with them.
+            after_commit(lambda: self._adopt(key, blocks))
+            return self._bump(db.session.connection(bind_arguments={'mapper': DocumentSequence}), doc_type, station)
+
+        with self._engine().begin() as conn:
+            return self._bump(conn, doc_type, station)
+
+    def _adopt(self, key, blocks):
+        """ Take over the rest of a block a committed /batch reserved, unless this process has one going. """
+        with self._lock:
+            block = blocks.pop(key, None)
+            lo, limit = self._blocks.get(key, (0, 0))
+            if block is not None and lo >= limit:
+                self._blocks[key] = block
+
+    @staticmethod
+    def _engine():
+        # The current station's database when it has its own
+        return db.session.get_bind(mapper=DocumentSequence)
+
+    @staticmethod
+    def _bump(conn, doc_type, station):
+        table = DocumentSequence.__table__
+        match = (table.c.doc_type == doc_type) & (table.c.station == station)
+
+        result = conn.execute(update(table).where(match).values(next_hi=table.c.next_hi + 1))
+        if result.rowcount == 0:
+            try:
+                with conn.begin_nested():
+                    conn.execute(insert(table).values(doc_type=doc_type, station=station, next_hi=1))
+            except IntegrityError:
+                # Another worker created the row first
+                conn.execute(update(table).where(match).values(next_hi=table.c.next_hi + 1))
+        return conn.execute(select(table.c.next_hi).where(match)).scalar_one()
+
+
+def format_number(doc_type, station, value):
+    return f"{PREFIXES[doc_type]}-{station}-{value:06d}"
+
+
+allocator = SequenceAllocator()
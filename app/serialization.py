@@ -0,0 +1,102 @@
+from datetime import date, datetime
+
+from flask import Response, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+from . import db
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional content type
+    msgpack = None
+
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+
+class FieldError(ValueError):
+    """ Raised for a fields= parameter naming columns the model does not have. """
+
+
+def columns_for(model, fields=None, default=None):
+    """ Table columns to select for a `fields=a,b,c` parameter.
+
+    Without `fields` the `default` names are used, or every column.
+    """
+    table = model.__table__
+    if fields:
+        names = [f.strip() for f in fields.split(',') if f.strip()]
+    else:
+        names = default or [c.name for c in table.columns]
+
+    unknown = [n for n in names if n not in table.columns]
+    if unknown:
+        raise FieldError(f"Unknown field(s): {', '.join(unknown)}")
+    return [table.columns[n] for n in names]
+
+
+def fetch_rows(columns, *criteria, order_by=None):
+    """ Plain dicts straight from the result tuples, without loading ORM objects.
+
+    Dates come out as ISO 8601 strings, as to_dict() gives them, whichever
+    encoder (JSON or MessagePack) the response then goes through.
+    """
+    stmt = select(*columns).where(*criteria)
+    stmt = stmt.order_by(*(order_by if order_by is not None else columns[0].table.primary_key.columns))
+    names = [c.name for c in columns]
+    dates = [c.name for c in columns if c.type.python_type in (datetime, date)]
+    rows = [dict(zip(names, row)) for row in db.session.execute(stmt)]
+    for row in rows:
+        for name in dates:
+            if row[name] is not None:
+                row[name] = row[name].isoformat()
+    return rows
+
+
+def respond(data, status=200):
+    """ jsonify, or MessagePack when the client asks for it and msgpack is installed. """
+    if msgpack is not None and request.accept_mimetypes.best_match(['application/json', MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE:
+        body = msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
+        return Response(body, status=status, mimetype=MSGPACK_MIMETYPE)
+    return jsonify(data), status
+
+
+def _msgpack_default(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    raise TypeError(f"Object of type {type(o).__name__} is not MessagePack serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """ Flask JSON provider that encodes with orjson when it is available.
+
+    Output matches the default provider: sorted keys, dates as HTTP dates,
+    and the same fallback for types orjson does not know. Set JSON_BACKEND to
+    "stdlib" to turn it off.
+    """
+
+    def _use_orjson(self):
+        return orjson is not None and self._app.config.get('JSON_BACKEND', 'auto') != 'stdlib'
+
+    def dumps(self, obj, **kwargs):
+        if not self._use_orjson() or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._orjson_dumps(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        if not self._use_orjson():
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._orjson_dumps(obj), mimetype=self.mimetype)
+
+    def _orjson_dumps(self, obj):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option)
+
@@ -0,0 +1,166 @@
+from datetime import datetime
+
+from flask import current_app
+
+from . import db, archive
+from .models import Amount, ArchivedAmount, ArchivedSale, Item, Sale, Shift, ShiftBankTotal, ShiftItemTotal
+from .routing import current_station
+
+# ShiftBankTotal key for online payments without a bank name
+UNKNOWN_BANK = 'Unspecified'
+
+
+class ShiftError(ValueError):
+    """ Raised when a shift cannot be opened or closed, or a sale cannot be put on one. """
+
+
+def open_shift(cashier, nozzle, opening_float=0.0):
+    """ Start a shift for `cashier` at `nozzle`; the caller commits. """
+    if not cashier or not nozzle:
+        raise ShiftError("cashier and nozzle are required")
+    if open_shifts(cashier, nozzle):
+        raise ShiftError(f"{cashier} already has an open shift at nozzle {nozzle}")
+    shift = Shift(cashier=cashier, nozzle=nozzle, opening_float=round(opening_float or 0.0, 2))
+    db.session.add(shift)
+    return shift
+
+
+def open_shifts(cashier=None, nozzle=None):
+    query = Shift.query.filter(Shift.station == current_station(), Shift.closed_at.is_(None))
+    if cashier is not None:
+        query = query.filter(Shift.cashier == cashier)
+    if nozzle is not None:
+        query = query.filter(Shift.nozzle == nozzle)
+    return query.order_by(Shift.id).all()
+
+
+def for_sale(cashier, nozzle=None, shift_id=None):
+    """ The open shift a new sale belongs to, or None when the cashier has not opened one.
+
+    `shift_id` picks the shift explicitly; otherwise the cashier's open shift
+    (at `nozzle`, if given) is used.
+    """
+    if shift_id is not None:
+        shift = Shift.query.get(shift_id)
+        if shift is None or shift.closed_at is not None:
+            raise ShiftError(f"Shift {shift_id} is not open")
+        return shift
+
+    candidates = open_shifts(cashier, nozzle)
+    if len(candidates) > 1:
+        raise ShiftError(f"{cashier} has {len(candidates)} open shifts; send nozzle or shift_id")
+    return candidates[0] if candidates else None
+
+
+def _item_total(shift, item_id):
+    row = ShiftItemTotal.query.get((shift.id, item_id))
+    if row is None:
+        row = ShiftItemTotal(shift_id=shift.id, item_id=item_id, qty=0.0, amount=0.0)
+        db.session.add(row)
+    return row
+
+
+def _bank_total(shift, bank):
+    row = ShiftBankTotal.query.get((shift.id, bank))
+    if row is None:
+        row = ShiftBankTotal(shift_id=shift.id, bank_name=bank, amount=0.0)
+        db.session.add(row)
+    return row
+
+
+def apply_slip(shift, sales, cash, bank=None, sign=1):
+    """ Add (sign=1) or take back (sign=-1) one slip's sale lines on the shift counters.
+
+    Split like the journal posting: the payment covers at most the slip
+    total, the rest is credit. `bank` is the bank of an online payment, None
+    for cash.
+    """
+    if not sales:
+        return
+    total = sum(s.net_amount for s in sales)
+    paid = min(cash, total)
+
+    shift.slips += sign
+    shift.sales_total = round(shift.sales_total + sign * total, 2)
+    shift.credit_total = round(shift.credit_total + sign * (total - paid), 2)
+    if bank is None:
+        shift.cash_total = round(shift.cash_total + sign * paid, 2)
+    else:
+        shift.online_total = round(shift.online_total + sign * paid, 2)
+        row = _bank_total(shift, bank)
+        row.amount = round(row.amount + sign * paid, 2)
+    for s in sales:
+        row = _item_total(shift, s.item_id)
+        row.qty = round(row.qty + sign * s.qty, 3)
+        row.amount = round(row.amount + sign * s.net_amount, 2)
+
+
+def payment_bank(is_online, bank_name):
+    """ ShiftBankTotal key for a payment, None for cash. """
+    return (bank_name or UNKNOWN_BANK) if is_online else None
+
+
+def slip_bank(sales, model=Amount):
+    """ Bank the slip was paid through, from its Amount row, or None for cash. """
+    amount = model.query.filter(model.sale_id.in_([s.id for s in sales])).order_by(model.id).first()
+    return payment_bank(amount.is_online, amount.bank_name) if amount else None
+
+
+def ensure_open(shift):
+    if shift is not None and shift.closed_at is not None:
+        raise ShiftError(f"Shift {shift.id} is closed")
+
+
+def close(shift, declared_cash):
+    """ Close the shift with the cash counted in the drawer; the caller commits. """
+    ensure_open(shift)
+    shift.declared_cash = round(declared_cash, 2)
+    shift.variance = round(shift.declared_cash - shift.expected_cash, 2)
+    shift.closed_at = datetime.utcnow()
+    return shift
+
+
+def variance_status(variance):
+    if variance is None:
+        return None
+    if abs(variance) <= current_app.config['SHIFT_VARIANCE_TOLERANCE']:
+        return 'balanced'
+    return 'over' if variance > 0 else 'short'
+
+
+def report(shift):
+    """ Close report straight from the stored counters. """
+    # Items are looked up separately: with station databases they live elsewhere
+    names = dict(db.session.query(Item.id, Item.item_name)
+                 .filter(Item.id.in_([t.item_id for t in shift.items])))
+    return dict(
+        shift.to_dict(),
+        status=variance_status(shift.variance),
+        items=[{
+            "item_id": t.item_id,
+            "item_name": names.get(t.item_id),
+            "qty": t.qty,
+            "amount": t.amount,
+        } for t in shift.items if t.qty or t.amount],
+        online_by_bank={t.bank_name: t.amount for t in shift.banks if t.amount},
+    )
+
+
+def rebuild():
+    """ Recompute every shift's counters from its sales, archived ones included. """
+    ShiftItemTotal.query.delete()
+    ShiftBankTotal.query.delete()
+    shifts = Shift.query.all()
+    for shift in shifts:
+        shift.slips = 0
+        shift.sales_total = shift.cash_total = shift.online_total = shift.credit_total = 0.0
+        slips = {}
+        for sale in archive.find_all(Sale, lambda m: m.shift_id == shift.id):
+            slips.setdefault(sale.slip_no, []).append(sale)
+        for sales in slips.values():
+            amounts = ArchivedAmount if isinstance(sales[0], ArchivedSale) else Amount
+            apply_slip(shift, sales, sales[0].cash, slip_bank(sales, amounts))
+            db.session.flush()
+        if shift.declared_cash is not None:
+            shift.variance = round(shift.declared_cash - shift.expected_cash, 2)
+    return len(shifts)
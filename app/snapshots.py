@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import NullPool
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; refreshes are then only serialised within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_engines = {}
+
+
+def init_app(app):
+    """ Put the app's SQLite databases in WAL mode (when SQLITE_WAL is on).
+
+    In WAL mode readers, including the snapshot backup, never block the
+    writer, so a refresh costs the POS nothing but disk reads.
+    """
+    if not app.config['SQLITE_WAL']:
+        return
+    from . import db
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _use_wal)
+
+
+def _use_wal(dbapi_connection, connection_record):
+    dbapi_connection.execute('PRAGMA journal_mode=WAL')
+
+
+def _path(source):
+    key = hashlib.sha1(str(source.url).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(current_app.config['SNAPSHOT_DIR'], f'snapshot-{key}.sqlite3')
+
+
+def _taken(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def refresh(source):
+    """ Copy `source` into its snapshot file with the SQLite online backup API.
+
+    The copy is written next to the snapshot and renamed over it, so readers
+    always open a complete database; its mtime is the moment the copy started.
+    """
+    path = _path(source)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    started = time.time()
+
+    raw = source.raw_connection()
+    try:
+        target = sqlite3.connect(tmp)
+        try:
+            raw.driver_connection.backup(target)
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+    finally:
+        raw.close()
+
+    os.utime(tmp, (started, started))
+    os.replace(tmp, path)
+    logger.info("Refreshed snapshot of %s in %.2fs", source.url, time.time() - started)
+    return started
+
+
+def _refresh_if_stale(source, path, max_age):
+    """ Refresh unless another thread or worker did so while we waited for the lock. """
+    with _lock:
+        lock_file = open(f'{path}.lock', 'a') if fcntl else None
+        try:
+            if lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            taken = _taken(path)
+            if taken is None or time.time() - taken > max_age:
+                taken = refresh(source)
+            return taken
+        finally:
+            if lock_file:
+                lock_file.close()
+
+
+def engine_for(source):
+    """ Read-only engine on the snapshot of `source`, refreshed when older than SNAPSHOT_MAX_AGE. """
+    if source.dialect.name != 'sqlite' or source.url.database in (None, '', ':memory:'):
+        return source
+
+    path = _path(source)
+    max_age = current_app.config['SNAPSHOT_MAX_AGE']
+    taken = _taken(path)
+    if taken is None or time.time() - taken > max_age:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        taken = _refresh_if_stale(source, path, max_age)
+    note_taken(taken)
+
+    engine = _engines.get(path)
+    if engine is None:
+        # immutable: the file is replaced, never written, so SQLite can skip locking entirely.
+        # NullPool, so each checkout opens whatever file is current.
+        engine = _engines.setdefault(path, create_engine(
+            f'sqlite:///file:{path}?mode=ro&immutable=1&uri=true', poolclass=NullPool,
+        ))
+    return engine
+
+
+def note_taken(taken):
+    """ Remember the oldest snapshot a request read, for its freshness headers. """
+    if taken is not None:
+        g.snapshot_taken = min(g.get('snapshot_taken') or taken, taken)
+
+
+def snapshot_read(view):
+    """ Run a heavy read-only view against the snapshots when SNAPSHOT_MAX_AGE is set.
+
+    Responses carry X-Snapshot-Taken and X-Snapshot-Age. "Cache-Control:
+    no-cache" on the request, or a /batch that may have written, reads the
+    live database instead.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config['SNAPSHOT_MAX_AGE'] or g.get('in_batch') or request.cache_control.no_cache:
+            return view(*args, **kwargs)
+
+        g.read_snapshot, g.snapshot_taken = True, None
+        try:
+            response = make_response(view(*args, **kwargs))
+        finally:
+            g.read_snapshot = False
+        taken = g.pop('snapshot_taken', None)
+        if taken is not None:
+            response.headers['X-Snapshot-Taken'] = datetime.fromtimestamp(taken, timezone.utc).isoformat()
+            response.headers['X-Snapshot-Age'] = str(int(time.time() - taken))
+        return response
+    return wrapper
@@ -0,0 +1,120 @@
+from datetime import datetime
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import and_, func, or_
+
+from . import db, accounting
+from .journal import customer_account
+from .models import JournalEntry, JournalLine
+
+
+class CursorError(ValueError):
+    """ Raised for a statement cursor that was tampered with or is malformed. """
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='statement-cursor')
+
+
+def _scope(customer, start, end):
+    """ What a cursor is only good for: one customer's statement over one date range. """
+    return [customer.id, start.isoformat() if start else None, end.isoformat() if end else None]
+
+
+def encode_cursor(customer, start, end, entry_date, line_id, balance):
+    return _serializer().dumps(_scope(customer, start, end) + [entry_date.isoformat(), line_id, balance])
+
+
+def decode_cursor(cursor, customer, start, end):
+    """ (entry_date, line_id, balance) from a cursor issued for this customer and range. """
+    try:
+        *scope, entry_date, line_id, balance = _serializer().loads(cursor)
+        position = datetime.fromisoformat(entry_date), int(line_id), float(balance)
+    except (BadSignature, TypeError, ValueError):
+        raise CursorError("Invalid cursor")
+    # The balance it carries is only right for the statement it came from
+    if scope != _scope(customer, start, end):
+        raise CursorError("Cursor belongs to a different customer or date range")
+    return position
+
+
+def master_opening_balance(customer):
+    """ Customer.cash_balance as a signed amount: receivable positive, payable negative. """
+    amount = customer.cash_balance or 0.0
+    return -amount if customer.cash_balance_type == 'Payable' else amount
+
+
+def opening_balance(customer, start):
+    """ Balance carried into the statement from before `start`.
+
+    Uses the latest period snapshot plus the lines posted since, so it does
+    not re-add the customer's whole history.
+    """
+    balance = master_opening_balance(customer)
+    if start is not None:
+        code, _ = customer_account(customer)
+        row = accounting.balances(as_of=start, account_code=code).get(code)
+        if row:
+            balance += row["debit"] - row["credit"]
+    return round(balance, 2)
+
+
+def statement_page(customer, start=None, end=None, cursor=None, limit=100):
+    """ One page of a customer statement with a running balance.
+
+    The running balance is a SQL window over the page's rows, read in
+    (customer_id, entry_date, id) index order. The balance at the end of a
+    page travels in the signed cursor, so later pages never re-read the rows
+    before them.
+    Returns (opening_balance, lines, next_cursor).
+    """
+    if cursor:
+        after_date, after_id, carried = decode_cursor(cursor, customer, start, end)
+    else:
+        after_date, after_id, carried = None, None, opening_balance(customer, start)
+
+    query = db.session.query(
+        JournalLine.id,
+        JournalLine.entry_date,
+        JournalEntry.doc_type,
+        JournalEntry.doc_no,
+        JournalEntry.description,
+        JournalLine.debit,
+        JournalLine.credit,
+    ).join(JournalEntry, JournalLine.entry_id == JournalEntry.id) \
+        .filter(JournalLine.customer_id == customer.id)
+
+    if start is not None:
+        query = query.filter(JournalLine.entry_date >= start)
+    if end is not None:
+        query = query.filter(JournalLine.entry_date < end)
+    if after_date is not None:
+        query = query.filter(or_(
+            JournalLine.entry_date > after_date,
+            and_(JournalLine.entry_date == after_date, JournalLine.id > after_id),
+        ))
+
+    # The window runs over this page's rows only, not every row after the cursor
+    page = query.order_by(JournalLine.entry_date, JournalLine.id).limit(limit + 1).subquery()
+    running = func.sum(page.c.debit - page.c.credit).over(order_by=(page.c.entry_date, page.c.id), rows=(None, 0))
+    rows = db.session.query(page, running.label('running')).order_by(page.c.entry_date, page.c.id).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    lines = [{
+        "date": row.entry_date.isoformat(),
+        "doc_type": row.doc_type,
+        "doc_no": row.doc_no,
+        "description": row.description,
+        "debit": row.debit,
+        "credit": row.credit,
+        "balance": round(carried + row.running, 2),
+    } for row in rows]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(customer, start, end, last.entry_date, last.id, lines[-1]["balance"])
+
+    return carried, lines, next_cursor
@@ -0,0 +1,149 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g, jsonify, request
+from sqlalchemy import func
+
+from . import db, archive, snapshots
+from .archive import ARCHIVES
+from .models import Purchase, Sale, CreditVoucher, DebitVoucher
+from .routing import BIND_PREFIX
+
+STATION_CODE = re.compile(r'^[A-Z0-9_-]{1,20}$')
+
+
+def parse_databases(value):
+    """ "NORTH=sqlite:///north.sqlite3,SOUTH=sqlite:///south.sqlite3" -> {"NORTH": ..., "SOUTH": ...} """
+    databases = {}
+    for part in filter(None, (p.strip() for p in value.split(','))):
+        code, _, url = part.partition('=')
+        if not url:
+            raise ValueError(f"STATION_DATABASES entry needs CODE=URL: {part}")
+        databases[code.strip().upper()] = url.strip()
+    return databases
+
+
+def binds(databases):
+    """ SQLALCHEMY_BINDS entries for the station databases. """
+    return {BIND_PREFIX + code: url for code, url in databases.items()}
+
+
+def codes():
+    """ Every configured station, the default one first. """
+    return list(dict.fromkeys([current_app.config['STATION_CODE'], *current_app.config['STATION_DATABASES']]))
+
+
+def init_app(app):
+    @app.before_request
+    def _route_to_station():
+        """ X-Station header (or ?station=) picks the station a request works for. """
+        station = request.headers.get('X-Station') or request.args.get('station')
+        g.station = None
+        if not station:
+            return None
+        station = station.strip().upper()
+        partitioned = bool(app.config['STATION_DATABASES'])
+        if not STATION_CODE.match(station) or (partitioned and station not in codes()):
+            return jsonify({'error': f"Unknown station: {station}"}), 400
+        g.station = station
+
+
+def fan_out(fn):
+    """ Run `fn()` once per station against that station's database, in parallel.
+
+    Each call gets its own app context and session with g.station set (and
+    the caller's snapshot mode), so the usual queries inside `fn` are routed
+    to that station. Returns
+    {station: result}. Without station databases `fn` runs once, inline.
+    """
+    stations = codes()
+    if not current_app.config['STATION_DATABASES']:
+        return {stations[0]: fn()}
+
+    app = current_app._get_current_object()
+    read_snapshot = g.get('read_snapshot')
+
+    def run(station):
+        with app.app_context():
+            g.station, g.read_snapshot = station, read_snapshot
+            try:
+                return fn(), g.get('snapshot_taken')
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=len(stations), thread_name_prefix='station-fan-out') as pool:
+        futures = {station: pool.submit(run, station) for station in stations}
+        results = {}
+        for station, future in futures.items():
+            results[station], taken = future.result()
+            snapshots.note_taken(taken)
+        return results
+
+
+# ---------------------- Head-office roll-ups ----------------------
+
+SUMMARY_FIELDS = ('sales_total', 'sales_qty', 'slips', 'purchases_total', 'credit_vouchers', 'debit_vouchers')
+
+
+def _grouped(query, model, start, end):
+    if start is not None:
+        query = query.filter(model.date >= start)
+    if end is not None:
+        query = query.filter(model.date < end)
+    return query.group_by(model.station).all()
+
+
+def summary(start=None, end=None):
+    """ Per-station totals for start <= date < end in the current database.
+
+    Grouped by the station column, so it also splits a database shared by
+    several stations, and reads the archive tables when the range reaches
+    them. Returns {station: {field: value}}.
+    """
+    result = {}
+
+    def row(station):
+        return result.setdefault(station, dict.fromkeys(SUMMARY_FIELDS, 0))
+
+    def models(model):
+        return [ARCHIVES[model], model] if archive.reaches(start) else [model]
+
+    for m in models(Sale):
+        # A slip is archived as a whole, so counting per table does not double count
+        query = db.session.query(m.station, func.sum(m.net_amount), func.sum(m.qty),
+                                 func.count(func.distinct(m.slip_no)))
+        for station, total, qty, slips in _grouped(query, m, start, end):
+            totals = row(station)
+            totals['sales_total'] += total or 0.0
+            totals['sales_qty'] += qty or 0.0
+            totals['slips'] += slips
+
+    for m in models(Purchase):
+        for station, total in _grouped(db.session.query(m.station, func.sum(m.net_amount)), m, start, end):
+            row(station)['purchases_total'] += total or 0.0
+
+    credits = db.session.query(CreditVoucher.station, func.sum(CreditVoucher.debit))
+    for station, total in _grouped(credits, CreditVoucher, start, end):
+        row(station)['credit_vouchers'] = total or 0.0
+
+    debits = db.session.query(DebitVoucher.station, func.sum(DebitVoucher.credit))
+    for station, total in _grouped(debits, DebitVoucher, start, end):
+        row(station)['debit_vouchers'] = total or 0.0
+
+    return result
+
+
+def rollup(start=None, end=None):
+    """ summary() across every station database, as a list plus grand totals. """
+    merged = {}
+    for partial in fan_out(lambda: summary(start, end)).values():
+        for station, values in partial.items():
+            row = merged.setdefault(station, dict.fromkeys(SUMMARY_FIELDS, 0))
+            for field in SUMMARY_FIELDS:
+                row[field] += values[field]
+
+    rows = [dict(station=station, **{f: round(v, 2) for f, v in values.items()})
+            for station, values in sorted(merged.items())]
+    totals = {f: round(sum(r[f] for r in rows), 2) for f in SUMMARY_FIELDS}
+    return rows, totals
+
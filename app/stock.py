@@ -0,0 +1,84 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func
+
+from . import db
+from .alerts import notifier
+from .hooks import after_commit
+from .routing import current_station
+from .models import Item, Purchase, Sale, ArchivedPurchase, ArchivedSale, StockAlert, StockLevel
+
+
+def holds_opening_stock():
+    """ True when the current station's stock includes Item.opening_stock.
+
+    Items are shared, so their opening stock is the default station's
+    (STATION_CODE). A station with its own database keeps its own StockLevel
+    and starts from zero: its stock comes from its purchases only.
+    """
+    station = current_station()
+    return station == current_app.config['STATION_CODE'] or station not in current_app.config['STATION_DATABASES']
+
+
+def computed_qty(item):
+    """ Stock from scratch: opening stock + purchases - sales, archived ones included. Only used to seed StockLevel. """
+    qty = (item.opening_stock or 0.0) if holds_opening_stock() else 0.0
+    for model, sign in ((Purchase, 1), (Sale, -1), (ArchivedPurchase, 1), (ArchivedSale, -1)):
+        qty += sign * db.session.query(func.coalesce(func.sum(model.qty), 0.0)).filter(model.item_id == item.id).scalar()
+    return qty
+
+
+def apply_movement(item, delta):
+    """ Change the item's stock by `delta` and check it against the reorder level.
+
+    Call this after the Sale/Purchase row causing the movement has been added
+    or deleted, before the commit. Returns the new StockAlert, if one was raised.
+    """
+    level = StockLevel.query.get(item.id)
+    if level is None:
+        # First movement for this item: seed from history, which (once flushed)
+        # already includes the row being posted
+        db.session.flush()
+        level = StockLevel(item_id=item.id, qty=computed_qty(item))
+        db.session.add(level)
+    else:
+        level.qty = round(level.qty + delta, 3)
+    return check_level(item, level)
+
+
+def check_level(item, level=None):
+    """ Raise an alert when stock is below the minimum, resolve it when it recovers. """
+    level = level or StockLevel.query.get(item.id)
+    if level is None or item.minimum_level is None:
+        return None
+
+    below = level.qty < item.minimum_level
+    open_alert = StockAlert.query.filter_by(item_id=item.id, resolved_at=None).first()
+
+    if below and open_alert is None:
+        alert = StockAlert(item_id=item.id, qty=level.qty, minimum_level=item.minimum_level)
+        db.session.add(alert)
+        db.session.flush()
+        alert_id = alert.id
+        after_commit(lambda: notifier.enqueue(alert_id))
+        return alert
+
+    if not below and open_alert is not None:
+        open_alert.resolved_at = datetime.utcnow()
+    return None
+
+
+def low_stock():
+    """ (item, qty) for items currently below their minimum level, from StockLevel only. """
+    levels = dict(db.session.query(StockLevel.item_id, StockLevel.qty))
+    items = Item.query.filter(Item.minimum_level.isnot(None), Item.id.in_(levels)).order_by(Item.item_name)
+    return [(item, levels[item.id]) for item in items if levels[item.id] < item.minimum_level]
+
+
+def rebuild():
+    StockLevel.query.delete()
+    items = Item.query.all()
+    for item in items:
+        db.session.add(StockLevel(item_id=item.id, qty=computed_qty(item)))
+    return len(items)
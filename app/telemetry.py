@@ -0,0 +1,252 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from flask import current_app, g
+from sqlalchemy import event, insert, tuple_
+from sqlalchemy.exc import IntegrityError
+
+from . import db, events
+from .models import Item, MeterChain, MeterReading
+from .routing import current_station
+
+logger = logging.getLogger(__name__)
+
+
+class ReadingError(ValueError):
+    """ Raised for a malformed meter reading. """
+
+
+class QueueFull(Exception):
+    """ Raised when the ingestion queue cannot take a request's readings; the client should retry later. """
+
+
+def _to_ms(value):
+    if value is None:
+        return int(time.time() * 1000)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ReadingError(f"taken_at must be epoch milliseconds or an ISO timestamp: {value!r}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def parse_readings(payload):
+    """ {"readings": [{"item_id", "nozzle", "reading", "taken_at"?}, ...]} (or one reading) -> tuples.
+
+    Returns [(item_id, nozzle, taken_at_ms, reading)]; taken_at defaults to now.
+    """
+    readings = payload.get('readings', [payload]) if isinstance(payload, dict) else None
+    if not isinstance(readings, list) or not readings:
+        raise ReadingError("Send a reading or a non-empty list of readings")
+
+    parsed = []
+    for r in readings:
+        try:
+            item_id, nozzle, reading = int(r['item_id']), str(r['nozzle']), float(r['reading'])
+        except (KeyError, TypeError, ValueError):
+            raise ReadingError("Each reading needs item_id, nozzle and a numeric reading")
+        if not nozzle or len(nozzle) > 20:
+            raise ReadingError(f"Invalid nozzle: {nozzle!r}")
+        parsed.append((item_id, nozzle, _to_ms(r.get('taken_at')), reading))
+
+    unknown = _unknown_items({r[0] for r in parsed})
+    if unknown:
+        raise ReadingError(f"Unknown item(s): {', '.join(map(str, sorted(unknown)))}")
+    return parsed
+
+
+# Seconds a worker trusts its list of existing items; items deleted by another worker drop out after this
+KNOWN_ITEMS_TTL = 60
+
+_known_items = set()
+_known_since = 0.0
+
+
+def _unknown_items(item_ids):
+    """ Item ids that do not exist; known ones are cached so steady streams cost no query. """
+    global _known_since
+    if time.monotonic() - _known_since > KNOWN_ITEMS_TTL:
+        _known_items.clear()
+        _known_since = time.monotonic()
+    missing = item_ids - _known_items
+    if missing:
+        _known_items.update(i for (i,) in db.session.query(Item.id).filter(Item.id.in_(missing)))
+    return item_ids - _known_items
+
+
+@event.listens_for(Item, 'after_delete')
+def _forget_item(mapper, connection, target):
+    _known_items.discard(target.id)
+
+
+def latest_reading(item_id, nozzle):
+    """ Last written reading of the item's meter at `nozzle`, or None. """
+    chain = MeterChain.query.filter_by(item_id=item_id, nozzle=nozzle).first() if nozzle else None
+    return chain.last_reading if chain else None
+
+
+class TelemetryWriter:
+    """ Writes streamed meter readings from a background thread with group commit.
+
+    Requests only append to a bounded in-memory queue and return. The writer
+    takes up to TELEMETRY_BATCH_SIZE readings once that many are waiting, or
+    TELEMETRY_FLUSH_INTERVAL seconds after the first one arrived, and writes
+    them with one INSERT and one commit per station, so SQLite sees a few
+    transactions per second instead of one per reading. A request that would
+    overflow TELEMETRY_QUEUE_SIZE is refused as a whole (QueueFull). Whatever
+    is queued is written before the process exits.
+    """
+
+    def __init__(self):
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._app = None
+        self._busy = False
+        self._stopping = False
+        self._chains = {}  # (station, item_id, nozzle) -> MeterChain.id
+        self.stats = dict.fromkeys(('accepted', 'rejected', 'written', 'failed', 'batches'), 0)
+
+    def submit(self, readings):
+        """ Queue [(item_id, nozzle, taken_at_ms, reading)] for the current station. """
+        app = current_app._get_current_object()
+        station = current_station()
+        with self._cond:
+            if self._stopping:
+                self.stats['rejected'] += len(readings)
+                raise QueueFull("shutting down")
+            if len(self._pending) + len(readings) > app.config['TELEMETRY_QUEUE_SIZE']:
+                self.stats['rejected'] += len(readings)
+                raise QueueFull(f"{len(self._pending)} readings are waiting to be written")
+            self._pending.extend((station, *r) for r in readings)
+            self.stats['accepted'] += len(readings)
+            self._cond.notify_all()
+        self._start(app)
+
+    def status(self):
+        with self._cond:
+            return dict(self.stats, queued=len(self._pending), running=bool(self._thread and self._thread.is_alive()))
+
+    def _start(self, app):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is None:
+                    atexit.register(self.stop)
+                self._app = app
+                self._thread = threading.Thread(target=self._run, name='telemetry-writer', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        config = self._app.config
+        size, interval = config['TELEMETRY_BATCH_SIZE'], config['TELEMETRY_FLUSH_INTERVAL']
+        with self._cond:
+            while not self._pending and not self._stopping:
+                self._cond.wait()
+            deadline = time.monotonic() + interval
+            while len(self._pending) < size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._pending.popleft() for _ in range(min(size, len(self._pending)))]
+            self._busy = bool(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return  # stopping and drained
+            try:
+                self._write(batch)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _write(self, batch):
+        by_station = {}
+        for station, *reading in batch:
+            by_station.setdefault(station, []).append(reading)
+
+        for station, readings in by_station.items():
+            try:
+                with self._app.app_context():
+                    g.station = station
+                    self._insert(station, readings)
+                    db.session.commit()
+                self.stats['written'] += len(readings)
+                self.stats['batches'] += 1
+            except Exception:
+                logger.exception("Failed to write %d meter reading(s) for %s", len(readings), station)
+                self.stats['failed'] += len(readings)
+                # Chains created in the failed transaction are gone too
+                self._chains = {k: v for k, v in self._chains.items() if k[0] != station}
+
+    def _chain_ids(self, station, keys):
+        missing = {k for k in keys if (station, *k) not in self._chains}
+        if missing:
+            existing = MeterChain.query.filter(tuple_(MeterChain.item_id, MeterChain.nozzle).in_(list(missing))).all()
+            new = [MeterChain(item_id=item_id, nozzle=nozzle)
+                   for item_id, nozzle in missing - {(c.item_id, c.nozzle) for c in existing}]
+            try:
+                db.session.add_all(new)
+                db.session.flush()
+            except IntegrityError:
+                # Another worker created one of them first; nothing else is in this transaction yet
+                db.session.rollback()
+                return self._chain_ids(station, keys)
+            for chain in existing + new:
+                self._chains[(station, chain.item_id, chain.nozzle)] = chain.id
+        return {k: self._chains[(station, *k)] for k in keys}
+
+    def _insert(self, station, readings):
+        chain_ids = self._chain_ids(station, {(item_id, nozzle) for item_id, nozzle, _, _ in readings})
+
+        rows, newest = [], {}
+        for item_id, nozzle, taken_at, reading in readings:
+            chain_id = chain_ids[(item_id, nozzle)]
+            rows.append({'chain_id': chain_id, 'taken_at': taken_at, 'reading': reading})
+            if chain_id not in newest or taken_at >= newest[chain_id][0]:
+                newest[chain_id] = (taken_at, reading)
+        db.session.execute(insert(MeterReading.__table__), rows)
+        events.publish_after_commit('reading', events.reading_event(readings))
+
+        # Readings may arrive out of order; the chain keeps the latest one
+        for chain in MeterChain.query.filter(MeterChain.id.in_(newest)):
+            taken_at, reading = newest[chain.id]
+            if chain.last_taken_at is None or taken_at >= chain.last_taken_at:
+                chain.last_taken_at, chain.last_reading = taken_at, reading
+
+    def flush(self, timeout=None):
+        """ Wait until everything queued so far has been written. Returns False on timeout. """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._pending or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=30):
+        """ Write what is queued and stop the thread; new readings are refused from now on. """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._pending:
+                logger.warning("Shut down with %d meter reading(s) unwritten", len(self._pending))
+
+
+writer = TelemetryWriter()
@@ -0,0 +1,130 @@
+""" Wet-stock reconciliation over a year of sales: ORM rows and a Python loop vs column arrays and NumPy.
+
+    python benchmarks/bench_reconciliation.py [sale_lines] [items]
+
+Both variants reconcile the same sales, deliveries and daily dips and must
+agree on every item's total variance.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LINES = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+ITEMS = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+DAYS = 365
+START = datetime(2025, 1, 1)
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp.name, 'bench.sqlite3')}"
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import create_app, db, reconciliation  # noqa: E402
+from app.models import Customer, Item, Purchase, Sale, Supplier, TankDip  # noqa: E402
+
+
+def populate():
+    rng = random.Random(42)
+    db.session.add(Customer(name='Walk-in', mobile='0', cash_balance_type='Receivable'))
+    db.session.add(Supplier(name='PSO', cash_balance_type='Payable'))
+    for i in range(ITEMS):
+        db.session.add(Item(item_name=f'Fuel {i}', item_code=f'F{i}', sale_rate=1.0, purchase_rate=1.0, opening_stock=0))
+    db.session.commit()
+
+    stock = {item_id: 50000.0 for item_id in range(1, ITEMS + 1)}
+    sold = {(item_id, day): 0.0 for item_id in stock for day in range(DAYS)}
+    rows = []
+    for n in range(LINES):
+        item_id, seconds = rng.randint(1, ITEMS), rng.randrange(DAYS * 86400)
+        qty = round(rng.uniform(5, 60), 2)
+        sold[(item_id, seconds // 86400)] += qty
+        rows.append({'slip_no': str(n), 'date': START + timedelta(seconds=seconds), 'station': 'MAIN',
+                     'salesperson': 's', 'cashier': 'c', 'customer_id': 1, 'item_id': item_id,
+                     'previous_reading': 0.0, 'current_reading': qty, 'qty': qty, 'unit_rate': 1.0,
+                     'net_amount': qty, 'cash': qty, 'balance': 0.0})
+        if len(rows) == 50000:
+            db.session.execute(insert(Sale.__table__), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(Sale.__table__), rows)
+
+    purchases, dips = [], []
+    for item_id in stock:
+        dips.append({'item_id': item_id, 'date': START - timedelta(hours=1), 'qty': stock[item_id]})
+        for day in range(DAYS):
+            moment = START + timedelta(days=day)
+            if day % 7 == 3:
+                purchases.append({'purchase_no': f'{item_id}-{day}', 'date': moment + timedelta(hours=6),
+                                  'supplier_id': 1, 'item_id': item_id, 'qty': 8000.0, 'purchase_rate': 1.0,
+                                  'net_amount': 8000.0, 'payment': 8000.0, 'balance': 0.0, 'station': 'MAIN'})
+                stock[item_id] += 8000.0
+            stock[item_id] -= sold[(item_id, day)] + rng.gauss(0, 15)
+            dips.append({'item_id': item_id, 'date': moment + timedelta(hours=23), 'qty': stock[item_id]})
+    db.session.execute(insert(Purchase.__table__), purchases)
+    db.session.execute(insert(TankDip.__table__), dips)
+    db.session.commit()
+
+
+def row_loop(start, end):
+    """ The straightforward version: ORM objects, then day by day per item. """
+    sold, delivered, closing, opening = {}, {}, {}, {}
+    for sale in Sale.query.filter(Sale.date >= start, Sale.date < end):
+        key = (sale.item_id, sale.date.date())
+        sold[key] = sold.get(key, 0.0) + sale.qty
+    for purchase in Purchase.query.filter(Purchase.date >= start, Purchase.date < end):
+        key = (purchase.item_id, purchase.date.date())
+        delivered[key] = delivered.get(key, 0.0) + purchase.qty
+    for dip in TankDip.query.order_by(TankDip.date).filter(TankDip.date < end):
+        if dip.date < start:
+            opening[dip.item_id] = dip.qty
+        else:
+            closing[(dip.item_id, dip.date.date())] = dip.qty
+
+    totals = {}
+    for item_id in sorted({k[0] for k in sold} | {k[0] for k in delivered} | set(opening)):
+        last_dip, book, cumulative = opening.get(item_id), opening.get(item_id), 0.0
+        for n in range((end - start).days):
+            day = (start + timedelta(days=n)).date()
+            if book is not None:
+                book += delivered.get((item_id, day), 0.0) - sold.get((item_id, day), 0.0)
+            if (item_id, day) in closing:
+                last_dip = closing[(item_id, day)]
+                if book is not None:
+                    cumulative += last_dip - book
+                book = last_dip
+        totals[item_id] = round(cumulative, 3)
+    return totals
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        began = time.perf_counter()
+        populate()
+        print(f"{LINES:,} sale lines, {ITEMS} items, {DAYS} days; loaded in {time.perf_counter() - began:.1f}s")
+
+        end = START + timedelta(days=DAYS)
+        began = time.perf_counter()
+        looped = row_loop(START, end)
+        loop_time = time.perf_counter() - began
+        db.session.expunge_all()
+
+        began = time.perf_counter()
+        report = reconciliation.reconcile(START, end)
+        vector_time = time.perf_counter() - began
+
+        vectorized = {item['item_id']: item['variance'] for item in report}
+        assert all(abs(looped[i] - vectorized[i]) < 0.01 for i in looped), (looped, vectorized)
+        print(f"{'ORM rows + Python loop':<30} {loop_time:>8.2f}s")
+        print(f"{'columns + NumPy':<30} {vector_time:>8.2f}s  ({loop_time / vector_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+""" Rows/sec for the list endpoints: ORM + to_dict + stdlib json vs column projection + fast JSON.
+
+    python benchmarks/bench_serialization.py [rows]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+REPEAT = 5
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp.name, 'bench.sqlite3')}"
+
+from app import create_app, db  # noqa: E402
+from app.models import Customer  # noqa: E402
+from app import serialization  # noqa: E402
+
+
+def seed():
+    db.session.execute(Customer.__table__.insert(), [
+        {
+            'name': f'Fleet customer {i}',
+            'address': f'Plot {i}, Industrial Area',
+            'tel': '042-000000',
+            'mobile': f'0300{i:07d}',
+            'email': f'fleet{i}@example.com',
+            'cash_balance': i * 1.5,
+            'cash_balance_type': 'Receivable',
+        }
+        for i in range(ROWS)
+    ])
+    db.session.commit()
+
+
+def orm_stdlib():
+    rows = [c.to_dict() for c in Customer.query.all()]
+    return json.dumps(rows).encode('utf-8')
+
+
+def projection(fields=None):
+    columns = serialization.columns_for(Customer, fields)
+    rows = serialization.fetch_rows(columns)
+    if serialization.orjson is not None:
+        return serialization.orjson.dumps(rows)
+    return json.dumps(rows).encode('utf-8')
+
+
+def projection_msgpack():
+    rows = serialization.fetch_rows(serialization.columns_for(Customer))
+    return serialization.msgpack.packb(rows, use_bin_type=True)
+
+
+def measure(label, fn):
+    best = float('inf')
+    size = 0
+    for _ in range(REPEAT):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        size = len(fn())
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<40} {ROWS / best:>12,.0f} rows/s  {size / 1024:>8,.0f} KiB")
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed()
+        print(f"{ROWS} customers, best of {REPEAT}; fast JSON backend: "
+              f"{'orjson' if serialization.orjson else 'not installed (stdlib)'}")
+        measure("ORM + to_dict + json (current)", orm_stdlib)
+        measure("projection, all columns", projection)
+        measure("projection, fields=id,name,mobile", lambda: projection('id,name,mobile'))
+        if serialization.msgpack is not None:
+            measure("projection + MessagePack", projection_msgpack)
+
+
+if __name__ == '__main__':
+    main()
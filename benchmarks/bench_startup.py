@@ -0,0 +1,60 @@
+""" Per-worker startup cost of the app.
+
+    python benchmarks/bench_startup.py [runs]
+
+Each run is a fresh interpreter and reports three phases:
+  import      - importing the app package and its dependencies
+  create_app  - the factory itself (what wsgi.py does at import)
+  schema+seed - create_all + seed_admin_user, which init_db used to run in
+                every process before "flask db upgrade"/"flask seed-admin"
+
+With gunicorn's preload_app the first two happen once in the master, so a
+forked worker starts with none of them.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+SCRIPT = """
+import time
+t0 = time.perf_counter()
+from app import create_app, db
+from seed import seed_admin_user
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+with app.app_context():
+    db.create_all()
+    seed_admin_user()
+t3 = time.perf_counter()
+print(t1 - t0, t2 - t1, t3 - t2)
+"""
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'startup.sqlite3')}", LOG_LEVEL='WARNING')
+
+        phases = ([], [], [])
+        for i in range(RUNS + 1):
+            out = subprocess.run([sys.executable, '-c', SCRIPT], cwd=ROOT, env=env,
+                                 capture_output=True, text=True, check=True)
+            if i == 0:
+                continue  # first run creates the schema
+            for phase, value in zip(phases, out.stdout.strip().splitlines()[-1].split()):
+                phase.append(float(value) * 1000)
+
+    imports, factory, schema = (statistics.median(p) for p in phases)
+    print(f"median of {RUNS} runs (ms): import {imports:.1f}, create_app {factory:.1f}, schema+seed {schema:.1f}")
+    print(f"old per-worker start (run.py/init_db):  {imports + factory + schema:7.1f} ms")
+    print(f"wsgi without preload:                   {imports + factory:7.1f} ms")
+    print(f"wsgi with preload_app (per fork):          ~0 ms  ({imports + factory:.1f} ms once in the master)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+""" Meter readings/sec written to SQLite: one ORM commit per reading vs the group-commit writer.
+
+    python benchmarks/bench_telemetry.py [readings] [threads]
+
+Both variants are fed by the same number of threads, standing in for the
+request threads of a gunicorn worker.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+READINGS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+THREADS = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp.name, 'bench.sqlite3')}"
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from app import create_app, db  # noqa: E402
+from app.models import Item, MeterChain, MeterReading  # noqa: E402
+from app.telemetry import writer  # noqa: E402
+
+
+def in_threads(app, fn):
+    per_thread = READINGS // THREADS
+
+    def run(offset):
+        with app.app_context():
+            for i in range(offset, offset + per_thread):
+                fn(i)
+            db.session.remove()
+
+    threads = [threading.Thread(target=run, args=(t * per_thread,)) for t in range(THREADS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return start, per_thread * THREADS
+
+
+def commit_per_reading(app, chain_id):
+    def write(i):
+        db.session.add(MeterReading(chain_id=chain_id, taken_at=int(time.time() * 1000), reading=float(i)))
+        db.session.commit()
+    start, count = in_threads(app, write)
+    return count / (time.perf_counter() - start)
+
+
+def group_commit(app):
+    def submit(i):
+        writer.submit([(1, 'BENCH', int(time.time() * 1000), float(i))])
+    start, count = in_threads(app, submit)
+    writer.flush()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    app = create_app({'TELEMETRY_QUEUE_SIZE': READINGS})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Item(item_name='Petrol', item_code='P1', sale_rate=1.0, purchase_rate=1.0, opening_stock=0))
+        chain = MeterChain(item_id=1, nozzle='DIRECT')
+        db.session.add(chain)
+        db.session.commit()
+        chain_id = chain.id
+
+    print(f"{READINGS} readings from {THREADS} threads; batch {app.config['TELEMETRY_BATCH_SIZE']}, "
+          f"interval {app.config['TELEMETRY_FLUSH_INTERVAL']}s")
+    print(f"{'commit per reading':<30} {commit_per_reading(app, chain_id):>10,.0f} readings/s")
+    print(f"{'queue + group commit':<30} {group_commit(app):>10,.0f} readings/s  {writer.status()}")
+    writer.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+# Build the app once in the master and fork it into the workers
+preload_app = True
+
+# SQLite has a single writer, so a few processes with threads go further than
+# many processes. Each open /stream connection holds a thread for its whole
+# life, so a worker takes at most STREAM_MAX_CLIENTS of them; for more
+# dashboards, run a second instance for /stream behind the same proxy
+workers = int(os.environ.get('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count() * 2 + 1)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = 500
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared with the children
+    from app import db
+    with server.app.wsgi().app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    # Write out meter readings still queued in this worker
+    from app.telemetry import writer
+    writer.stop()
+    # Report jobs not started yet stay queued for "flask run-report-jobs"
+    from app.reports import runner
+    runner.stop()
@@ -1,12 +1,19 @@
 from app import create_app, db
+from app.routing import BIND_PREFIX
 from seed import seed_admin_user
-app = create_app()
 
-def init_db():
+
+def init_db(app=None):
+    """ Create any missing tables and the admin user (development shortcut for
+    "flask db upgrade" + "flask seed-admin"). """
+    app = app or create_app()
     with app.app_context():
         db.create_all()
+        for station in app.config['STATION_DATABASES']:
+            db.metadata.create_all(db.engines[BIND_PREFIX + station])
         print("Database tables created successfully.")
         seed_admin_user()
-        db_path = 'instance/db.sqlite3'  # Adjusted path
 
-init_db()
+
+if __name__ == '__main__':
+    init_db()
@@ -0,0 +1,34 @@
+"""station column on transactional tables
+
+Revision ID: 76a3e01c2f22
+Revises: 06d21eacc57c
+Create Date: 2026-10-19 12:01:37.634599
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '76a3e01c2f22'
+down_revision = '06d21eacc57c'
+branch_labels = None
+depends_on = None
+
+TABLES = ('credit_voucher', 'debit_voucher', 'journal_entry', 'purchase', 'sale')
+
+
+def upgrade():
+    # Existing rows belong to the station this database has been serving
+    station = os.environ.get('STATION_CODE', 'MAIN')
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('station', sa.String(length=20), nullable=False, server_default=station))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('station')
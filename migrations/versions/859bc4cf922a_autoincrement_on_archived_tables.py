@@ -0,0 +1,48 @@
+"""autoincrement on archived tables
+
+Revision ID: 859bc4cf922a
+Revises: e484684579bf
+Create Date: 2026-10-19 13:22:50.494736
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '859bc4cf922a'
+down_revision = 'e484684579bf'
+branch_labels = None
+depends_on = None
+
+
+# Hot table -> its archive table; rows move between them with their ids
+TABLES = [
+    ('sale', 'sale_archive'),
+    ('amount', 'amount_archive'),
+    ('credit_sale', 'credit_sale_archive'),
+    ('purchase', 'purchase_archive'),
+]
+
+
+def upgrade():
+    # AUTOINCREMENT so ids of rows moved to the archive are never handed out again
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table, archive in TABLES:
+        with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+        # Start after every id used so far, hot or archived
+        op.execute(f"DELETE FROM sqlite_sequence WHERE name = '{table}'")
+        op.execute(
+            f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table}', max("
+            f"(SELECT coalesce(max(id), 0) FROM {table}), (SELECT coalesce(max(id), 0) FROM {archive}))"
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table, _ in reversed(TABLES):
+        with op.batch_alter_table(table, recreate='always'):
+            pass
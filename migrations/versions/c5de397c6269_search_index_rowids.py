@@ -0,0 +1,45 @@
+"""search index rowids
+
+Revision ID: c5de397c6269
+Revises: d5c9beb107d3
+Create Date: 2026-10-19 12:55:44.142749
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5de397c6269'
+down_revision = 'd5c9beb107d3'
+branch_labels = None
+depends_on = None
+
+
+# kind, table, title column, extra column; rowid = id * 3 + position, as in app.search.KIND_CODES
+KINDS = [
+    ('item', 'item', 'item_name', 'item_code'),
+    ('customer', 'customer', 'name', 'mobile'),
+    ('supplier', 'supplier', 'name', None),
+]
+
+
+def upgrade():
+    # Renumber the search index so each record's row is found by rowid
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    exists = op.get_bind().execute(
+        sa.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'")).first()
+    if not exists:
+        return
+    op.execute("DELETE FROM search_index")
+    for code, (kind, table, title, extra) in enumerate(KINDS):
+        extra = f"coalesce({extra}, '')" if extra else "''"
+        op.execute(
+            "INSERT INTO search_index (rowid, kind, ref_id, title, extra) "
+            f"SELECT id * {len(KINDS)} + {code}, '{kind}', id, coalesce({title}, ''), {extra} FROM {table}")
+
+
+def downgrade():
+    # The old code finds rows by kind and ref_id, which are unchanged
+    pass
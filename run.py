@@ -1,8 +1,11 @@
+import os
+
 from app import create_app
 from init_db import init_db
 
 app = create_app()
 
 if __name__ == '__main__':
-    init_db()
-    app.run(debug=True)
+    # Development server only; production runs wsgi:app under gunicorn
+    init_db(app)
+    app.run(debug=os.environ.get('FLASK_DEBUG', '1') == '1')
@@ -1,6 +1,5 @@
 from app import db, create_app
 from app.models import User
-from faker import Faker
 
 def seed_admin_user():
     admin_email = 'admin@gmail.com'
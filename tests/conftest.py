@@ -0,0 +1,65 @@
+import pytest
+
+from app import create_app, db, prices
+from app.routing import BIND_PREFIX
+
+
+@pytest.fixture
+def config(tmp_path):
+    """ Settings for the test app; override this fixture in a module to change them. """
+    return {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.sqlite3'}",
+        'SNAPSHOT_DIR': str(tmp_path / 'snapshots'),
+        'REPORT_DIR': str(tmp_path / 'reports'),
+        'REPORT_WORKERS': 0,
+        'LOG_LEVEL': 'WARNING',
+    }
+
+
+def create_tables(app):
+    with app.app_context():
+        # Only the default bind: db keeps the metadata of every station bind any earlier app had
+        db.create_all(bind_key=None)
+        for station in app.config['STATION_DATABASES']:
+            db.metadata.create_all(db.engines[BIND_PREFIX + station])
+
+
+@pytest.fixture
+def app(config):
+    app = create_app(config)
+    create_tables(app)
+    # The price cache outlives each test's database
+    prices.cache.invalidate()
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def post_ok(client, path, json, status=200, **kwargs):
+    response = client.post(path, json=json, **kwargs)
+    assert response.status_code == status, response.get_data(as_text=True)
+    return response.get_json()
+
+
+@pytest.fixture
+def seeded(client):
+    """ Petrol (item 1, 250/L, 500 L), Diesel (item 2, 260/L, 500 L), supplier 1 and customer 1. """
+    post_ok(client, '/items', dict(item_name='Petrol', item_code='P1', sale_rate=250.0, purchase_rate=240.0,
+                                   minimum_level=100, opening_stock=500, unit='L'), 201)
+    post_ok(client, '/items', dict(item_name='Diesel', item_code='D1', sale_rate=260.0, purchase_rate=250.0,
+                                   minimum_level=100, opening_stock=500, unit='L'), 201)
+    post_ok(client, '/suppliers', dict(name='PSO', cash_balance_type='Payable'), 201)
+    post_ok(client, '/customers', dict(name='Fleet Co', mobile='0300', cash_balance_type='Receivable'), 201)
+    return client
+
+
+def sale(client, *readings, cash=0.0, **kwargs):
+    """ POST /create-sale for customer 1 with a line per (item_id, litres). """
+    items = [dict(item_id=item_id, previous_reading=0, current_reading=litres) for item_id, litres in readings]
+    return post_ok(client, '/create-sale', dict(customer_id=1, salesperson='a', cashier='b', cash=cash, items=items),
+                   **kwargs)
@@ -0,0 +1,49 @@
+""" Admission control refuses work it has no room for, with Retry-After, and never sale posting first. """
+import pytest
+
+from app import create_app
+
+from conftest import create_tables
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, ADMISSION_RATES={'report': (0.01, 2.0)}, ADMISSION_CLIENT_IDS={'till-1', 'till-2'})
+
+
+def test_reports_over_the_rate_get_429(client):
+    codes = [client.get('/trial-balance', headers={'X-Client-Id': 'till-1'}).status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+
+    refused = client.get('/trial-balance', headers={'X-Client-Id': 'till-1'})
+    assert int(refused.headers['Retry-After']) >= 1
+    # Each terminal has its own bucket
+    assert client.get('/trial-balance', headers={'X-Client-Id': 'till-2'}).status_code == 200
+
+
+def test_unknown_client_ids_share_the_address_bucket(client):
+    codes = [client.get('/trial-balance', headers={'X-Client-Id': f'made-up-{n}'}).status_code for n in range(3)]
+    assert codes == [200, 200, 429]
+
+
+def test_reports_give_way_to_queued_writes(app, client):
+    app.extensions['admission']['write'].waiting = 1
+    try:
+        refused = client.get('/trial-balance')
+        assert refused.status_code == 503 and refused.headers['Retry-After'] == '1'
+        assert client.get('/items').status_code == 200
+    finally:
+        app.extensions['admission']['write'].waiting = 0
+    assert client.get('/admission').get_json()['report']['rejected_busy'] == 1
+
+
+def test_a_full_class_is_refused(config):
+    app = create_app(dict(config, ADMISSION_LIMITS={'write': 0, 'read': 8, 'report': 2, 'login': 2},
+                          ADMISSION_QUEUE_TIMEOUTS={'write': 0}))
+    create_tables(app)
+    client = app.test_client()
+
+    refused = client.post('/customers', json=dict(name='Fleet Co', cash_balance_type='Receivable'))
+    assert refused.status_code == 503 and 'Retry-After' in refused.headers
+    # Streams and telemetry are not limited
+    assert client.get('/telemetry/status').status_code == 200
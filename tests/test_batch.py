@@ -0,0 +1,54 @@
+""" /batch runs its operations in one transaction: all of them commit, or none does. """
+from app import db
+from app.models import Customer, JournalEntry, Sale, StreamEvent
+from app.sequences import allocator
+
+from conftest import post_ok
+
+
+def sale_op(op_id, customer_id=1, item_id=1):
+    return dict(id=op_id, method='POST', path='/create-sale',
+                body=dict(customer_id=customer_id, salesperson='a', cashier='b', cash=10,
+                          items=[dict(item_id=item_id, previous_reading=0, current_reading=2)]))
+
+
+def test_operations_commit_together(seeded):
+    ops = [dict(id='cust', method='POST', path='/customers', body=dict(name='New Fleet', cash_balance_type='Receivable')),
+           sale_op('sale', customer_id='${cust.customer.id}'),
+           dict(method='GET', path='/customers/${cust.customer.id}/statement')]
+    body = post_ok(seeded, '/batch', dict(operations=ops))
+
+    assert body['committed'] is True
+    assert [r['status'] for r in body['results']] == [201, 200, 200]
+    assert body['results'][2]['body']['closing_balance'] == 490.0
+    assert Sale.query.filter_by(customer_id=2).count() == 1
+
+
+def test_a_failed_operation_rolls_back_everything(seeded):
+    ops = [dict(id='cust', method='POST', path='/customers', body=dict(name='New Fleet', cash_balance_type='Receivable')),
+           sale_op('ok'), sale_op('bad', item_id=99)]
+    body = post_ok(seeded, '/batch', dict(operations=ops), status=400)
+
+    assert body['committed'] is False
+    assert [r['status'] for r in body['results']] == [201, 200, 404]
+    assert Customer.query.count() == 1
+    assert Sale.query.count() == 0
+    assert JournalEntry.query.count() == 0
+    assert StreamEvent.query.count() == 0
+
+
+def test_numbers_reserved_by_a_rolled_back_batch_are_not_reused(app, seeded):
+    app.config['SEQUENCE_BLOCK_SIZE'] = 10
+    post_ok(seeded, '/batch', dict(operations=[sale_op('s'), dict(method='GET', path='/nope')]), status=400)
+    assert not allocator._blocks.get((str(db.engine.url), 'slip', 'MAIN'))
+
+    outside = post_ok(seeded, '/create-sale', sale_op('x')['body'])['slip_no']
+    inside = [r['body']['slip_no'] for r in post_ok(seeded, '/batch', dict(operations=[sale_op('a'), sale_op('b')]))['results']]
+    after = post_ok(seeded, '/create-sale', sale_op('y')['body'])['slip_no']
+
+    assert len({outside, after, *inside}) == 4
+
+
+def test_batches_cannot_be_nested(seeded):
+    body = post_ok(seeded, '/batch', dict(operations=[dict(method='POST', path='/batch')]), status=400)
+    assert body['results'][0]['body']['error'] == 'Batches cannot be nested'
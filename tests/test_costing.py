@@ -0,0 +1,138 @@
+""" Incremental costing (add_purchase, add_sales, remove and the rewinds they
+trigger) must leave exactly what costing the whole history again does. """
+from datetime import datetime
+from itertools import count
+
+import pytest
+
+from app import costing, db
+from app.models import Customer, Item, Purchase, Sale, ItemCost, CostLayer, SaleCost, CostAllocation
+
+_numbers = count(1)
+
+
+def day(n, hour=12):
+    return datetime(2026, 3, n, hour)
+
+
+@pytest.fixture
+def item(app):
+    item = Item(item_name='Petrol', item_code='P1', sale_rate=300.0, purchase_rate=240.0, opening_stock=100.0,
+                minimum_level=0, unit='L')
+    db.session.add_all([item, Customer(name='Fleet Co', cash_balance_type='Receivable')])
+    db.session.commit()
+    return item
+
+
+def buy(item, qty, rate, date, discount=0.0):
+    purchase = Purchase(purchase_no='PO', bill_no=f'BILL-{next(_numbers)}', item_id=item.id, qty=qty,
+                        purchase_rate=rate, net_amount=qty * rate, discount_percent=discount, date=date)
+    db.session.add(purchase)
+    db.session.flush()
+    costing.add_purchase(purchase)
+    db.session.commit()
+    return purchase
+
+
+def sell(item, *lines):
+    """ One slip with a line per (qty, date). """
+    slip_no = f'SLIP-{next(_numbers)}'
+    sales = [Sale(slip_no=slip_no, salesperson='a', cashier='b', customer_id=1, item_id=item.id,
+                  previous_reading=0.0, current_reading=qty, qty=qty, unit_rate=300.0, net_amount=qty * 300.0,
+                  cash=0.0, balance=qty * 300.0, date=date)
+             for qty, date in lines]
+    db.session.add_all(sales)
+    db.session.flush()
+    costing.add_sales(sales)
+    db.session.commit()
+    return sales
+
+
+def delete(row):
+    db.session.delete(row)
+    db.session.flush()
+    costing.remove(row.item_id, row.date)
+    db.session.commit()
+
+
+def costed(item):
+    """ Everything costing keeps for `item`, keyed so re-created rows compare equal. """
+    state = db.session.get(ItemCost, item.id)
+    layers = {layer.id: layer for layer in CostLayer.query.filter_by(item_id=item.id)}
+    return {
+        'state': (pytest.approx(state.qty), pytest.approx(state.value), pytest.approx(state.last_cost),
+                  state.last_date),
+        'layers': sorted((layer.purchase_id or 0, layer.date, pytest.approx(layer.qty),
+                          pytest.approx(layer.remaining), pytest.approx(layer.unit_cost))
+                         for layer in layers.values()),
+        'sales': {s.sale_id: (s.date, pytest.approx(s.qty), pytest.approx(s.cost))
+                  for s in SaleCost.query.filter_by(item_id=item.id)},
+        'allocations': sorted((a.sale_id, layers[a.layer_id].purchase_id or 0, pytest.approx(a.qty))
+                              for a in CostAllocation.query.filter(CostAllocation.layer_id.in_(layers))),
+    }
+
+
+def assert_matches_full_replay(item):
+    db.session.expire_all()
+    incremental = costed(item)
+    costing.replay(None)
+    db.session.commit()
+    db.session.expire_all()
+    assert incremental == costed(item)
+    return incremental
+
+
+def test_fifo_across_a_deleted_purchase(item):
+    buy(item, 50, 250.0, day(2))
+    second = buy(item, 80, 260.0, day(3))
+    buy(item, 40, 270.0, day(4), discount=5)
+    sell(item, (120, day(5)))
+    sell(item, (90, day(6)))
+
+    delete(second)
+
+    figures = assert_matches_full_replay(item)
+    # The opening 100 at 240 and the 50 at 250 went first, then the discounted 40 at 256.5
+    assert figures['sales'][1][2] == pytest.approx(100 * 240 + 20 * 250)
+    assert figures['sales'][2][2] == pytest.approx(30 * 250 + 40 * 256.5 + 20 * 256.5)
+
+
+def test_fifo_sale_beyond_stock_then_delivery(item):
+    sell(item, (130, day(2)))
+    buy(item, 60, 250.0, day(3))
+    sell(item, (20, day(4)))
+
+    figures = assert_matches_full_replay(item)
+    # The 30 litres short were priced at the latest cost and taken out of the next delivery
+    assert figures['sales'][1][2] == pytest.approx(100 * 240 + 30 * 240)
+    assert figures['layers'][-1][3] == pytest.approx(10)
+    assert figures['state'][0] == pytest.approx(10)
+
+
+def test_average_method(app, item):
+    app.config['COSTING_METHOD'] = 'average'
+    buy(item, 100, 260.0, day(2))
+    sell(item, (50, day(3)), (30, day(3, 13)))
+    early = buy(item, 50, 230.0, day(2, 18))  # back-dated past both lines
+    sell(item, (300, day(4)))
+    buy(item, 100, 250.0, day(5))
+
+    figures = assert_matches_full_replay(item)
+    assert figures['sales'][1][2] == pytest.approx(50 * (100 * 240 + 100 * 260 + 50 * 230) / 250)
+
+    delete(early)
+    assert_matches_full_replay(item)
+
+
+def test_backdated_entries_rewind(item):
+    buy(item, 100, 250.0, day(2))
+    sell(item, (80, day(3)), (40, day(5)))
+    sell(item, (60, day(6)))
+
+    buy(item, 30, 200.0, day(4))  # between the two lines of the first slip
+    sell(item, (10, day(1)))  # before every purchase
+    assert_matches_full_replay(item)
+
+    delete(Sale.query.filter_by(date=day(3)).one())
+    figures = assert_matches_full_replay(item)
+    assert figures['state'][3] == day(6)
@@ -0,0 +1,80 @@
+""" Every posted document leaves one balanced entry, kept in step as its rows are deleted. """
+import pytest
+from sqlalchemy import func
+
+from app import db, journal
+from app.journal import JournalError
+from app.models import JournalEntry, JournalLine
+
+from conftest import post_ok, sale
+
+
+def entries():
+    """ {(doc_type, doc_no): (total, debit, credit)} from the journal tables. """
+    rows = db.session.query(JournalEntry.doc_type, JournalEntry.doc_no, JournalEntry.total,
+                            func.sum(JournalLine.debit), func.sum(JournalLine.credit)) \
+        .join(JournalLine, JournalLine.entry_id == JournalEntry.id) \
+        .group_by(JournalEntry.id)
+    return {(doc_type, doc_no): (pytest.approx(total), pytest.approx(debit), pytest.approx(credit))
+            for doc_type, doc_no, total, debit, credit in rows}
+
+
+@pytest.fixture
+def posted(seeded):
+    post_ok(seeded, '/purchases', dict(purchase_no='PO1', supplier_name='PSO', payment=1000, discount_percentage=2,
+                                       items=[dict(item_name='Petrol', qty=100), dict(item_name='Diesel', qty=50)]))
+    sale(seeded, (1, 10), (2, 5), cash=1000)
+    post_ok(seeded, '/vouchers', dict(cr_account='in hand', accounts=[dict(account_code='A1', account_name='x', debit=5),
+                                                                      dict(account_code='A2', account_name='y', debit=7)]),
+            201)
+    post_ok(seeded, '/debit_vouchers', dict(db_account='online', accounts=[dict(account_code='A1', account_name='x',
+                                                                                credit=5)]), 201)
+    return seeded
+
+
+def test_every_entry_balances(posted):
+    posted_entries = entries()
+
+    assert {doc_type for doc_type, _ in posted_entries} == {'purchase', 'sale', 'credit_voucher', 'debit_voucher'}
+    for total, debit, credit in posted_entries.values():
+        assert debit == credit == total
+    # The sale: 10 L at 250 and 5 L at 260 on account, 1000 paid in cash
+    assert posted_entries[('sale', 'SLIP-MAIN-000001')][0] == 3800 + 1000
+
+
+def test_deleting_rows_reposts_their_document(posted):
+    sale_lines = posted.get('/sales').get_json()
+    diesel = next(row for row in sale_lines if row['item_id'] == 2)
+    assert posted.delete(f"/sales/{diesel['id']}").status_code == 200
+    assert posted.delete('/vouchers/1').status_code == 200
+
+    posted_entries = entries()
+    assert posted_entries[('sale', 'SLIP-MAIN-000001')][0] == 2500 + 1000
+    assert posted_entries[('credit_voucher', 'CV-MAIN-000001')][0] == 7
+    assert posted.get('/vouchers/2').get_json()['total_debit'] == pytest.approx(7)
+
+
+def test_rebuild_posts_the_same_entries(posted):
+    before = entries()
+    JournalLine.query.delete()
+    JournalEntry.query.delete()
+    db.session.commit()
+
+    posted_count, skipped = journal.rebuild()
+    db.session.commit()
+
+    assert (posted_count, skipped) == (len(before), 0)
+    assert entries() == before
+    # Running it again finds nothing left to post
+    assert journal.rebuild() == (0, 0)
+
+
+def test_zero_sale_posts_nothing(seeded):
+    slip_no = sale(seeded, (1, 0))['slip_no']
+    assert journal.get_entry('sale', slip_no) is None
+
+
+def test_unbalanced_entry_is_refused(app):
+    lines = [journal.line(('CASH', 'Cash'), 10), journal.line(('SALES', 'Sales'), -9)]
+    with pytest.raises(JournalError, match='does not balance'):
+        journal.post_entry('sale', 'SLIP-X', lines)
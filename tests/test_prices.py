@@ -0,0 +1,58 @@
+""" Sales are priced from the cached price history, which follows every committed change. """
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app import db, prices
+from app.models import Item, ItemPrice, Sale
+
+from conftest import post_ok, sale
+
+
+def rates(slip_no):
+    return [s.unit_rate for s in Sale.query.filter_by(slip_no=slip_no).order_by(Sale.id)]
+
+
+def test_price_changes_price_the_next_sale(seeded):
+    assert rates(sale(seeded, (1, 2))['slip_no']) == [250.0]
+
+    post_ok(seeded, '/prices', dict(prices=[dict(item_id=1, sale_rate=255.0)]), 201)
+    assert rates(sale(seeded, (1, 2))['slip_no']) == [255.0]
+
+    assert seeded.put('/items/1', json=dict(sale_rate=260.0)).status_code == 200
+    assert rates(sale(seeded, (1, 2), (2, 1))['slip_no']) == [260.0, 260.0]
+
+
+def test_changes_committed_elsewhere_are_picked_up(app, seeded):
+    sale(seeded, (1, 2))  # loads the cache
+    # Another worker's change: it never invalidates this process's cache
+    with db.engine.begin() as conn:
+        conn.execute(insert(ItemPrice.__table__).values(
+            item_id=1, effective_from=datetime.utcnow() - timedelta(seconds=1), sale_rate=270.0))
+
+    # A new app context, like the next request
+    with app.app_context():
+        assert prices.rate_at(db.session.get(Item, 1)) == 270.0
+
+
+def test_future_prices_wait_until_due(app, seeded):
+    soon = datetime.utcnow() + timedelta(hours=1)
+    post_ok(seeded, '/prices', dict(effective_from=soon.isoformat(), prices=[dict(item_id=1, sale_rate=300.0)]), 201)
+    item = db.session.get(Item, 1)
+
+    assert rates(sale(seeded, (1, 2))['slip_no']) == [250.0]
+    assert item.sale_rate == 250.0
+    with app.app_context():
+        item = db.session.get(Item, 1)
+        assert prices.rate_at(item, soon + timedelta(seconds=1)) == 300.0
+        assert prices.apply_due(soon + timedelta(seconds=1)) == [item]
+
+
+def test_invalid_changes_are_refused(seeded):
+    for body in (dict(prices=[]),
+                 dict(prices=[dict(item_id=1, sale_rate=-1)]),
+                 dict(prices=[dict(item_id=1, sale_rate=1), dict(item_id=99, sale_rate=1)]),
+                 dict(effective_from='2020-01-01', prices=[dict(item_id=1, sale_rate=1)])):
+        assert seeded.post('/prices', json=body).status_code == 400, body
+    assert seeded.put('/items/1', json=dict(sale_rate='cheap')).status_code == 400
+    assert ItemPrice.query.count() == 0
@@ -0,0 +1,50 @@
+""" Document numbers come from block-reserved sequences: never reused, never taken from the client. """
+import pytest
+
+from app.models import DocumentSequence
+from app.sequences import SequenceAllocator, allocator
+
+from conftest import post_ok, sale
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, SEQUENCE_BLOCK_SIZE=3)
+
+
+def test_numbers_run_on_across_blocks(app):
+    numbers = allocator.next_values('slip', count=7, station='MAIN')
+
+    assert numbers == list(range(1, 8))
+    # Three blocks of three were reserved
+    assert DocumentSequence.query.filter_by(doc_type='slip', station='MAIN').one().next_hi == 3
+
+
+def test_another_worker_starts_after_reserved_blocks(app):
+    first = allocator.next_values('voucher', count=2, station='MAIN')
+    other = SequenceAllocator().next_values('voucher', count=2, station='MAIN')
+    more = allocator.next_values('voucher', count=2, station='MAIN')
+
+    assert first == [1, 2]
+    assert other == [4, 5]
+    # This worker finishes its own block, then reserves after the other's
+    assert more == [3, 7]
+
+
+def test_stations_and_document_types_count_separately(app):
+    assert allocator.next_number('slip', station='NORTH') == 'SLIP-NORTH-000001'
+    assert allocator.next_number('slip', station='SOUTH') == 'SLIP-SOUTH-000001'
+    assert allocator.next_number('bill', station='NORTH') == 'BILL-NORTH-000001'
+
+
+def test_client_supplied_numbers_are_ignored(seeded):
+    first = sale(seeded, (1, 2))['slip_no']
+    second = post_ok(seeded, '/create-sale', dict(slip_no=first, customer_id=1, salesperson='a', cashier='b', cash=0,
+                                                  items=[dict(item_id=1, previous_reading=0, current_reading=1)]))
+    assert second['slip_no'] != first
+
+    vouchers = post_ok(seeded, '/vouchers', dict(voucher_no='CV-MAIN-000001', cr_account='in hand',
+                                                 accounts=[dict(account_code='A1', account_name='x', debit=5)]), 201)
+    again = post_ok(seeded, '/vouchers', dict(voucher_no=vouchers[0]['voucher_no'], cr_account='in hand',
+                                              accounts=[dict(account_code='A1', account_name='x', debit=5)]), 201)
+    assert again[0]['voucher_no'] != vouchers[0]['voucher_no']
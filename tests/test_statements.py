@@ -0,0 +1,48 @@
+""" Statement pages carry the running balance in their cursor and add up to the whole statement. """
+import pytest
+
+from conftest import sale
+
+
+def statement(client, customer_id=1, **params):
+    response = client.get(f'/customers/{customer_id}/statement', query_string=params)
+    return response.status_code, response.get_json()
+
+
+@pytest.fixture
+def slips(seeded):
+    for litres in range(1, 8):
+        sale(seeded, (1, litres), cash=100)
+    return seeded
+
+
+def test_pages_match_the_whole_statement(slips):
+    status, whole = statement(slips, limit=1000)
+    assert status == 200
+
+    paged, cursor = [], None
+    while True:
+        status, page = statement(slips, limit=3, **({'cursor': cursor} if cursor else {}))
+        assert status == 200 and len(page['lines']) <= 3
+        paged += page['lines']
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    assert paged == whole['lines']
+    assert len(paged) == 14  # the debit for each slip and the cash paid against it
+    assert page['closing_balance'] == whole['closing_balance'] == pytest.approx(250 * 28 - 100 * 7)
+
+
+def test_cursor_only_fits_its_own_statement(slips):
+    slips.post('/customers', json=dict(name='Other Co', mobile='0301', cash_balance_type='Receivable'))
+    _, page = statement(slips, limit=2)
+
+    status, body = statement(slips, customer_id=2, limit=2, cursor=page['next_cursor'])
+    assert status == 400 and 'different customer' in body['error']
+
+    status, _ = statement(slips, limit=2, cursor=page['next_cursor'], **{'from': '2020-01-01'})
+    assert status == 400
+
+    status, body = statement(slips, limit=2, cursor=page['next_cursor'][:-2] + 'xx')
+    assert status == 400 and body['error'] == 'Invalid cursor'
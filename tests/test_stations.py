@@ -0,0 +1,55 @@
+""" Station tables go to the station's own database; master data stays shared. """
+import sqlite3
+
+import pytest
+
+from app.models import StockLevel
+
+from conftest import post_ok, sale
+
+
+@pytest.fixture
+def config(config, tmp_path):
+    return dict(config, STATION_CODE='MAIN', STATION_DATABASES={
+        'NORTH': f"sqlite:///{tmp_path / 'north.sqlite3'}",
+        'SOUTH': f"sqlite:///{tmp_path / 'south.sqlite3'}",
+    })
+
+
+def rows(tmp_path, name, sql):
+    with sqlite3.connect(tmp_path / f'{name}.sqlite3') as conn:
+        return conn.execute(sql).fetchall()
+
+
+def test_writes_go_to_the_station_database(seeded, tmp_path):
+    north = sale(seeded, (1, 10), headers={'X-Station': 'north'})['slip_no']
+    south = sale(seeded, (1, 20), headers={'X-Station': 'SOUTH'})['slip_no']
+    main = sale(seeded, (1, 5))['slip_no']
+
+    assert (north, south, main) == ('SLIP-NORTH-000001', 'SLIP-SOUTH-000001', 'SLIP-MAIN-000001')
+    assert rows(tmp_path, 'north', 'select slip_no, station from sale') == [(north, 'NORTH')]
+    assert rows(tmp_path, 'south', 'select slip_no, station from sale') == [(south, 'SOUTH')]
+    assert rows(tmp_path, 'test', 'select slip_no from sale') == [(main,)]
+    # Items and customers are only in the shared database
+    assert rows(tmp_path, 'north', 'select count(*) from item') == [(0,)]
+
+    stations = seeded.get('/reports/stations').get_json()['stations']
+    assert {s['station']: s['sales_qty'] for s in stations} == {'MAIN': 5, 'NORTH': 10, 'SOUTH': 20}
+
+
+def test_unknown_stations_are_refused(seeded):
+    response = seeded.get('/sales', headers={'X-Station': 'EAST'})
+    assert response.status_code == 400 and 'Unknown station' in response.get_json()['error']
+
+
+def test_station_stock_starts_from_zero(app, seeded):
+    sale(seeded, (1, 10), headers={'X-Station': 'NORTH'})
+    sale(seeded, (1, 10))
+
+    assert StockLevel.query.get(1).qty == 490
+    with app.test_request_context(headers={'X-Station': 'NORTH'}):
+        app.preprocess_request()
+        assert StockLevel.query.get(1).qty == -10
+
+    response = seeded.put('/items/1', json=dict(opening_stock=900), headers={'X-Station': 'NORTH'})
+    assert response.status_code == 400
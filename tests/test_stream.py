@@ -0,0 +1,67 @@
+""" /stream sends committed sales to subscribers, without an app context while streaming. """
+import pytest
+
+from app import create_app, events
+from app.events import EventBroker
+
+from conftest import create_tables, post_ok, sale
+
+
+@pytest.fixture
+def client(config, monkeypatch):
+    # No app context is kept pushed, as under a real server, and each test gets its own broker
+    app = create_app(dict(config, STREAM_POLL_INTERVAL=0.05, STREAM_MAX_CLIENTS=1))
+    create_tables(app)
+    monkeypatch.setattr(events, 'broker', EventBroker())
+    client = app.test_client()
+    post_ok(client, '/items', dict(item_name='Petrol', item_code='P1', sale_rate=250.0, opening_stock=500), 201)
+    post_ok(client, '/customers', dict(name='Fleet Co', cash_balance_type='Receivable'), 201)
+    return client
+
+
+def next_event(chunks):
+    chunk = next(chunks)
+    while chunk.startswith(b':') or chunk.startswith(b'retry:'):
+        chunk = next(chunks)
+    return chunk.decode()
+
+
+def test_committed_sales_reach_subscribers(client):
+    response = client.get('/stream', query_string={'cashier': 'b'}, buffered=False)
+    chunks = iter(response.response)
+
+    slip_no = sale(client, (1, 2))['slip_no']
+    event = next_event(chunks)
+    response.close()
+
+    assert 'event: sale' in event and f'"slip_no":"{slip_no}"' in event
+
+
+def test_resume_after_last_event_id(client):
+    first = client.get('/stream', buffered=False)
+    chunks = iter(first.response)
+    sale(client, (1, 2))
+    event_id = next_event(chunks).split('\n')[0][len('id: '):]
+    first.close()
+
+    later = sale(client, (1, 3))['slip_no']
+    resumed = client.get('/stream', headers={'Last-Event-ID': event_id}, buffered=False)
+    event = next_event(iter(resumed.response))
+    resumed.close()
+
+    assert f'"slip_no":"{later}"' in event
+
+    reset = client.get('/stream', headers={'Last-Event-ID': 'garbage'}, buffered=False)
+    assert 'event: reset' in next(iter(reset.response)).decode()
+    reset.close()
+
+
+def test_subscribers_are_capped_per_worker(client):
+    first = client.get('/stream', buffered=False)
+    refused = client.get('/stream')
+    assert refused.status_code == 503 and refused.headers['Retry-After'] == '5'
+
+    first.close()
+    again = client.get('/stream', buffered=False)
+    assert again.status_code == 200
+    again.close()
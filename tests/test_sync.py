@@ -0,0 +1,48 @@
+""" /sync replays the change log: inserts and updates with their rows, deletes as tombstones. """
+from conftest import sale
+
+
+def changes(client, since=None, **params):
+    if since:
+        params['since'] = since
+    response = client.get('/sync', query_string=params)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    body = response.get_json()
+    return [(c['table'], c['id'], c['op'], c['data']) for c in body['changes']], body['cursor'], body['has_more']
+
+
+def test_pages_follow_the_cursor(seeded):
+    first, cursor, has_more = changes(seeded, limit=3)
+    rest, cursor, more = changes(seeded, cursor)
+
+    assert [(table, op) for table, _, op, _ in first] == [('item', 'I'), ('item', 'I'), ('supplier', 'I')]
+    assert has_more and not more
+    assert [(table, op) for table, _, op, _ in rest] == [('customer', 'I')]
+    assert changes(seeded, cursor)[0] == []
+
+
+def test_deletes_leave_tombstones(seeded):
+    sale(seeded, (1, 2))
+    _, cursor, _ = changes(seeded)
+    sale_id = seeded.get('/sales').get_json()[0]['id']
+
+    assert seeded.delete(f'/sales/{sale_id}').status_code == 200
+    deleted, cursor, _ = changes(seeded, cursor)
+
+    assert ('sale', sale_id, 'D', None) in deleted
+    assert {table for table, _, op, data in deleted if op == 'D' and data is None} >= {'sale', 'credit_sale'}
+    assert all(op == 'D' for _, _, op, _ in deleted)
+
+
+def test_updates_carry_the_new_row(seeded):
+    _, cursor, _ = changes(seeded)
+    assert seeded.put('/items/1', json=dict(minimum_level=50)).status_code == 200
+
+    updated, _, _ = changes(seeded, cursor, tables='item')
+    assert [(table, row_id, op) for table, row_id, op, _ in updated] == [('item', 1, 'U')]
+    assert updated[0][3]['minimum_level'] == 50
+
+
+def test_unknown_tables_and_cursors_are_refused(seeded):
+    assert seeded.get('/sync', query_string={'tables': 'foo'}).status_code == 400
+    assert seeded.get('/sync', query_string={'since': 'nonsense'}).status_code == 400
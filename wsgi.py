@@ -0,0 +1,8 @@
+""" Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing this module only builds the app. Run "flask db upgrade" and
+"flask seed-admin" once per deploy, not per worker.
+"""
+from app import create_app
+
+app = create_app()